@@ -0,0 +1,140 @@
+# artifact_gc.py
+# This module is the garbage collector of the persisted PDFs (see pdf_storage.py). Every
+# PDF_GC_INTERVAL_MINUTES it walks the storage one user at a time and deletes
+#   - expired files: not written again within PDF_RETENTION_DAYS (their history entries stay, and
+#     GET /pdfs/{record_id} answers 410 Gone for them)
+#   - unreferenced files: no PDFRecord points at them any more, e.g. leftovers of interrupted writes;
+#     files younger than PDF_GC_GRACE_MINUTES are kept, their record may not be committed yet
+#   - files beyond the user's quota, oldest first
+# Files are checked against the database and deleted in batches of PDF_GC_BATCH_SIZE, so a run holds
+# one batch in memory and yields to the API between batches. Nutrition reports live in the shared PDF
+# cache, which bounds its own size (see pdf_cache.py), so the collector never touches them.
+#
+# Every API worker starts the loop, but only the one holding the PDF_GC_LOCK_PATH file lock collects;
+# the others check again every interval and take over when that worker exits.
+#
+# One collection can also be run by hand from the FoodRecipeBackend folder:
+#   python -m app.artifact_gc
+import asyncio
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.future import select
+
+load_dotenv()
+
+from . import file_store, metrics
+from .database import AsyncSessionLocal
+from .models import PDFRecord
+from .pdf_storage import PDF_QUOTA_MB, PDF_RETENTION_DAYS, Artifact, ArtifactStorage, storage
+
+# Whether this process runs the collector, and the minutes between two collections
+PDF_GC_ENABLED = os.getenv("PDF_GC_ENABLED", "1") == "1"
+PDF_GC_INTERVAL_MINUTES = float(os.getenv("PDF_GC_INTERVAL_MINUTES", "60"))
+# Files checked against the database and deleted per batch
+PDF_GC_BATCH_SIZE = int(os.getenv("PDF_GC_BATCH_SIZE", "200"))
+# Minutes an unreferenced file is kept after it was written
+PDF_GC_GRACE_MINUTES = float(os.getenv("PDF_GC_GRACE_MINUTES", "10"))
+# Lock file (without the ".lock" suffix) that elects the one process of the host that collects
+PDF_GC_LOCK_PATH = os.getenv("PDF_GC_LOCK_PATH", "pdf_gc")
+
+# Summary of the last collection, reported on /metrics
+last_run: Dict[str, float] = {}
+
+_task: Optional[asyncio.Task] = None
+_lock_file = None  # Held while this process is the one that collects
+
+# Function to find which of the given paths are still referenced by a PDFRecord
+async def referenced_paths(session_factory: Callable, paths: List[str]) -> set:
+    async with session_factory() as db:
+        result = await db.execute(select(PDFRecord.file_path).filter(PDFRecord.file_path.in_(paths)))
+        return set(result.scalars().all())
+
+# Function to delete a batch of artifacts (blocking; runs in a worker thread)
+def delete_batch(storage: ArtifactStorage, artifacts: List[Artifact]):
+    for artifact in artifacts:
+        storage.delete(artifact.path)
+
+# Function to run one collection over the whole storage; returns the number of deleted files per reason
+async def collect(storage: ArtifactStorage, session_factory: Callable, batch_size: int = PDF_GC_BATCH_SIZE,
+                  retention_days: float = PDF_RETENTION_DAYS, grace_minutes: float = PDF_GC_GRACE_MINUTES,
+                  quota_mb: float = PDF_QUOTA_MB) -> dict:
+    started = time.perf_counter()
+    summary = {"scanned": 0, "expired": 0, "unreferenced": 0, "over_quota": 0, "freed_bytes": 0}
+    for user in await asyncio.to_thread(storage.users):
+        artifacts = await asyncio.to_thread(storage.artifacts, user)
+        summary["scanned"] += len(artifacts)
+        for start in range(0, len(artifacts), batch_size):
+            batch = artifacts[start:start + batch_size]
+            referenced = await referenced_paths(session_factory, [artifact.path for artifact in batch])
+            doomed: List[Artifact] = []
+            for artifact in batch:
+                if storage.expired(artifact, retention_days):
+                    summary["expired"] += 1
+                elif artifact.path not in referenced and time.time() - artifact.modified > grace_minutes * 60:
+                    summary["unreferenced"] += 1
+                else:
+                    continue
+                doomed.append(artifact)
+            await asyncio.to_thread(delete_batch, storage, doomed)
+            summary["freed_bytes"] += sum(artifact.size for artifact in doomed)
+        over_quota = await asyncio.to_thread(storage.enforce_quota, user, quota_mb)
+        summary["over_quota"] += len(over_quota)
+        summary["freed_bytes"] += sum(artifact.size for artifact in over_quota)
+
+    for reason in ("expired", "unreferenced", "over_quota"):
+        if summary[reason]:
+            metrics.increment(f"pdf_gc.deleted.{reason}", summary[reason])
+    metrics.observe("pdf_gc.run", time.perf_counter() - started)
+    last_run.clear()
+    last_run.update(summary, finished_at=time.time(), seconds=round(time.perf_counter() - started, 3))
+    return summary
+
+# Function to tell whether this process collects, taking the collector lock if no other process holds it
+def is_collector(lock_path: str = PDF_GC_LOCK_PATH) -> bool:
+    global _lock_file
+    if _lock_file is None:
+        _lock_file = file_store.try_file_lock(lock_path)
+    return _lock_file is not None
+
+# Background loop that collects every `interval_minutes` while this process holds the collector lock
+# (a failed run is logged and retried next time)
+async def run_periodically(storage: ArtifactStorage, session_factory: Callable, interval_minutes: float = PDF_GC_INTERVAL_MINUTES):
+    while True:
+        await asyncio.sleep(interval_minutes * 60)
+        if not is_collector():
+            continue  # Another worker collects
+        try:
+            summary = await collect(storage, session_factory)
+            print(f"PDF garbage collection: {summary}")
+        except Exception as e:
+            print(f"PDF garbage collection failed: {str(e)}")
+
+# Function to start the background collector (called from the app's startup event)
+def start(storage: ArtifactStorage, session_factory: Callable):
+    global _task
+    if _task is None and PDF_GC_ENABLED:
+        _task = asyncio.create_task(run_periodically(storage, session_factory))
+
+# Function to stop the background collector and hand the collector lock over (called from the app's shutdown event)
+def stop():
+    global _task, _lock_file
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    if _lock_file is not None:
+        _lock_file.close()
+        _lock_file = None
+
+# Entry point of a manual collection
+async def main():
+    if not is_collector():
+        print("An API worker is collecting the PDFs already, nothing to do.")
+        return
+    summary = await collect(storage, AsyncSessionLocal)
+    print(f"✅ PDF garbage collection: {summary}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
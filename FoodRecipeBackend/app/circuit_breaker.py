@@ -0,0 +1,132 @@
+# circuit_breaker.py
+# This module keeps one circuit breaker per third-party API (Pexels, YouTube, Nutritionix). While an
+# upstream is failing or too slow, its breaker opens and calls fail immediately instead of tying up
+# workers; callers then serve their last-known-good cached result (search_cache.py, nutrient_table.py).
+#   - closed: calls go through; the outcomes of the last BREAKER_WINDOW calls are kept, and a slow call
+#     (longer than BREAKER_SLOW_CALL_SECONDS) counts as a failure
+#   - open: entered when at least BREAKER_FAILURE_RATE of the window failed; calls are rejected with
+#     CircuitOpenError for BREAKER_OPEN_SECONDS
+#   - half-open: afterwards up to BREAKER_HALF_OPEN_PROBES calls are let through as probes; a successful
+#     probe closes the breaker, a failed one opens it again
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+from . import metrics
+
+# Share of failed (or slow) calls in the window that opens the breaker, and the calls needed before it can open
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+# Number of recent call outcomes kept per upstream
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+# Calls slower than this count as failures; calls are cancelled after BREAKER_CALL_TIMEOUT_SECONDS
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "5"))
+BREAKER_CALL_TIMEOUT_SECONDS = float(os.getenv("BREAKER_CALL_TIMEOUT_SECONDS", "10"))
+# Seconds an open breaker rejects calls before probing the upstream again, and the number of probes
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+# Breaker states reported on /circuit-breakers
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retrying in {retry_after:.0f} seconds")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_rate: float = BREAKER_FAILURE_RATE, min_calls: int = BREAKER_MIN_CALLS,
+                 window: int = BREAKER_WINDOW, slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+                 call_timeout: float = BREAKER_CALL_TIMEOUT_SECONDS, open_seconds: float = BREAKER_OPEN_SECONDS,
+                 half_open_probes: int = BREAKER_HALF_OPEN_PROBES):
+        self.name = name  # Upstream name used in metric names, e.g. "pexels"
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.call_timeout = call_timeout
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=window)  # True for a failed or slow call
+        self.opened_at: Optional[float] = None
+        self.probes = 0  # Probe calls in flight while half-open
+        self.last_error: Optional[str] = None
+
+    # Seconds until an open breaker lets a probe through
+    def retry_after(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    # Decide whether a call may go through now (moves an open breaker to half-open when its time is up)
+    def _admit(self) -> bool:
+        if self.state == OPEN and self.retry_after() == 0:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.probes >= self.half_open_probes:
+                return False
+            self.probes += 1
+            return True
+        return self.state == CLOSED
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        print(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        metrics.increment(f"breaker.{self.name}.{state}")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state == CLOSED:
+            self.outcomes.clear()
+        self.probes = 0
+
+    def _record(self, failed: bool, probe: bool):
+        if probe:
+            self._set_state(OPEN if failed else CLOSED)
+            return
+        self.outcomes.append(failed)
+        if self.state == CLOSED and len(self.outcomes) >= self.min_calls:
+            if sum(self.outcomes) / len(self.outcomes) >= self.failure_rate:
+                self._set_state(OPEN)
+
+    # Run `func(*args, **kwargs)` unless the breaker is open; failures, timeouts and slow calls are recorded
+    async def call(self, func: Callable[..., Awaitable[Any]], *args, **kwargs):
+        if not self._admit():
+            metrics.increment(f"breaker.{self.name}.rejected")
+            raise CircuitOpenError(self.name, self.retry_after() or self.open_seconds)
+        probe = self.state == HALF_OPEN
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(func(*args, **kwargs), self.call_timeout)
+        except asyncio.CancelledError:
+            if probe:
+                self.probes -= 1  # The caller went away; let another call probe
+            raise
+        except Exception as e:
+            self.last_error = str(e) or type(e).__name__
+            metrics.increment(f"breaker.{self.name}.failed")
+            self._record(True, probe)
+            raise
+        slow = time.monotonic() - started > self.slow_call_seconds
+        if slow:
+            metrics.increment(f"breaker.{self.name}.slow")
+        self._record(slow, probe)
+        return result
+
+    # Function to summarize the breaker for the status endpoint
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "recent_calls": len(self.outcomes),
+            "recent_failures": sum(self.outcomes),
+            "retry_after_seconds": round(self.retry_after(), 1),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,92 @@
+# deadlines.py
+# This module gives every request a total time budget (deadline) that is split across its stages
+# (DB, CLIP encode, FAISS search, LLM). The deadline is stored in a context variable, so code deep in
+# the call stack (e.g. llm.complete_task) can see how much time the request has left. Time a stage
+# does not use rolls over to the later stages, and once a stage has run nothing is reserved for it any
+# more (e.g. the DB write after the LLM call may use everything that is left).
+import asyncio
+import contextvars
+import os
+import time
+from typing import Awaitable, Dict, Optional
+
+from fastapi import HTTPException
+
+from . import metrics
+
+# Total budget (seconds) and the share of it reserved for each stage, in the order the stages run
+ENDPOINT_BUDGETS = {
+    "generate_recipe": (
+        float(os.getenv("GENERATE_RECIPE_DEADLINE_SECONDS", "30")),
+        {"db": 0.1, "llm": 0.9},
+    ),
+    "upload_image": (
+        float(os.getenv("UPLOAD_IMAGE_DEADLINE_SECONDS", "35")),
+        {"db": 0.05, "clip": 0.15, "search": 0.05, "llm": 0.75},
+    ),
+    "generate_shopping_list": (
+        float(os.getenv("SHOPPING_LIST_DEADLINE_SECONDS", "60")),
+        {"db": 0.05, "llm": 0.9, "render": 0.05},
+    ),
+}
+
+class Deadline:
+    def __init__(self, endpoint: str, total: float, shares: Dict[str, float]):
+        self.endpoint = endpoint
+        self.total = total
+        self.shares = shares
+        self.expires_at = time.monotonic() + total
+        self.finished = set()  # Stages that have already run
+
+    # Seconds left before the request's deadline
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    # Time a stage may use: everything left except what is reserved for the later stages that have not run yet
+    def stage_timeout(self, stage: str) -> float:
+        stages = list(self.shares)
+        later = stages[stages.index(stage) + 1:] if stage in self.shares else []
+        reserved = sum(self.shares[name] for name in later if name not in self.finished) * self.total
+        return max(0.0, min(self.remaining(), self.remaining() - reserved))
+
+# Deadline of the request currently being handled (None outside a request)
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+# Function to start the deadline for a request; call it at the beginning of the endpoint
+def start_deadline(endpoint: str) -> Deadline:
+    total, shares = ENDPOINT_BUDGETS[endpoint]
+    deadline = Deadline(endpoint, total, shares)
+    _current_deadline.set(deadline)
+    return deadline
+
+# Function to get the deadline of the current request, if any
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+# Function to roll back a session whose statement was cancelled (logged, never raised: the 504 is what matters)
+async def rollback(session):
+    try:
+        await session.rollback()
+        metrics.increment("deadline.db.rolled_back")
+    except Exception as e:
+        print(f"Error rolling back after a DB timeout: {str(e)}")
+
+# Function to run one stage of the request within its share of the deadline and record its latency.
+# Cancelling a DB call does not undo what it started, so DB stages pass their session, which is rolled
+# back when the stage times out (the request's later stages and the session's next user start clean).
+async def within_stage(stage: str, awaitable: Awaitable, session=None):
+    deadline = current_deadline()
+    if deadline is None:
+        return await awaitable
+    started = time.monotonic()
+    try:
+        result = await asyncio.wait_for(awaitable, timeout=deadline.stage_timeout(stage))
+        deadline.finished.add(stage)
+        return result
+    except asyncio.TimeoutError:
+        metrics.increment(f"deadline.{deadline.endpoint}.{stage}.expired")
+        if session is not None:
+            await rollback(session)
+        raise HTTPException(status_code=504, detail=f"Request took too long ({stage} stage). Please try again.")
+    finally:
+        metrics.observe(f"stage.{deadline.endpoint}.{stage}", time.monotonic() - started)
@@ -0,0 +1,38 @@
+# disconnect.py
+# This module stops work for requests whose client has gone away. A long pipeline (CLIP encode,
+# OpenAI calls, PDF rendering, ChatLog writes) runs as a task while the client connection is polled;
+# when the client disconnects the task is cancelled, which also cancels the upstream calls it awaits
+# and drops its queued inference/LLM work, so the capacity goes back to live requests.
+import asyncio
+from typing import Awaitable
+
+from fastapi import HTTPException, Request
+
+from . import metrics
+
+# How often the client connection is checked while the pipeline runs
+POLL_INTERVAL_SECONDS = 0.25
+# Non-standard "client closed request" status (as used by nginx); nobody reads the response anyway
+CLIENT_CLOSED_REQUEST = 499
+
+# Function to run a request pipeline and cancel it as soon as the client disconnects
+async def run_while_connected(request: Request, pipeline: Awaitable, name: str):
+    task = asyncio.ensure_future(pipeline)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=POLL_INTERVAL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    except asyncio.CancelledError:
+        task.cancel()  # The server itself is cancelling this request (e.g. shutdown)
+        raise
+    task.cancel()
+    metrics.increment(f"requests.cancelled.{name}")
+    print(f"Client disconnected, cancelled {name}")
+    try:
+        await task  # Let the pipeline run its cleanup (finally blocks, session close)
+    except (asyncio.CancelledError, Exception):
+        pass
+    raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
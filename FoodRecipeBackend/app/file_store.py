@@ -0,0 +1,98 @@
+# file_store.py
+# This module holds the file helpers shared by the locally stored tables and caches (recipe_catalogue.py,
+# nutrient_table.py, pdf_cache.py, pdf_storage.py). Several API workers and the offline jobs write the
+# same files, so
+#   - every write goes through its own temporary file in the target folder and is moved into place,
+#     readers never see a half-written file and two writers never share a temporary file
+#   - JSON tables are merged into the file as stored on disk under an exclusive file lock, so
+#     concurrent writers do not lose each other's entries
+#   - an unreadable JSON table loads as empty, so a damaged file does not keep the API from starting
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Dict
+
+# Suffix of the temporary files written next to the real ones (skipped when a folder is listed)
+TEMP_SUFFIX = ".tmp"
+
+# Function to write a file atomically through a temporary file of its own (blocking)
+def write_atomic(path: str, content: bytes):
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f"{name}.", suffix=TEMP_SUFFIX)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+# Exclusive lock on a file shared by the threads and worker processes of the host (blocking)
+@contextmanager
+def file_lock(path: str):
+    with open(f"{path}.lock", "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# Function to take an exclusive lock without waiting, e.g. to let one worker process of the host run a
+# background job. Returns the open lock file (the lock is held until it is closed) or None when another
+# process holds the lock.
+def try_file_lock(path: str):
+    lock_file = open(f"{path}.lock", "a+b")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+# Function to load a JSON table (empty if the file does not exist yet or is unreadable; the next save replaces it)
+def load_json(path: str) -> Dict[str, dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        print(f"Ignoring unreadable file {path}: {str(e)}")
+        return {}
+
+# Function to save a JSON table atomically
+def save_json(table: Dict[str, dict], path: str):
+    write_atomic(path, json.dumps(table, indent=2, ensure_ascii=False).encode("utf-8"))
+
+# Function to merge entries into a JSON table as stored on disk, under the file lock. Returns the merged table.
+def update_json(entries: Dict[str, dict], path: str) -> Dict[str, dict]:
+    with file_lock(path):
+        stored = load_json(path)
+        stored.update(entries)
+        save_json(stored, path)
+    return stored
+
+# Function to get a file's modification stamp (None when it does not exist), used to notice rewrites by other processes
+def file_stamp(path: str):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,54 @@
+# http_client.py
+# This module owns the shared async HTTP client used for Pexels, YouTube and Nutritionix. It is
+# created at app startup and closed at shutdown; all calls reuse its per-host keep-alive connection
+# pools (HTTP/2 when the optional `h2` package is installed), so a call after the first skips the TCP
+# and TLS handshakes, and no call blocks the event loop.
+import os
+from typing import Optional
+
+import httpx
+
+# Timeouts (seconds): connecting, waiting for response data, sending the request, waiting for a pooled connection
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "15"))
+WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "10"))
+POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5"))
+# Connection pool size (all hosts) and idle keep-alive connections kept open
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_client: Optional[httpx.AsyncClient] = None
+
+# Function to create the shared client (called from the app's startup event)
+def start() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE and os.getenv("HTTP2_ENABLED", "1") == "1",
+            timeout=httpx.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT, write=WRITE_TIMEOUT, pool=POOL_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+# Function to get the shared client (created on first use outside the app, e.g. in scripts)
+def get_client() -> httpx.AsyncClient:
+    return start()
+
+# Function to close the shared client and its pooled connections (called from the app's shutdown event)
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,207 @@
+# ingredients.py
+# This module turns the ingredient lists returned by OpenAI into structured (item, quantity, unit)
+# rows and merges the rows of several recipes into one aggregated shopping list,
+# so that "2 onions" from one recipe plus "1 onion" from another becomes "3 onions".
+import re
+from fractions import Fraction
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# JSON schema sent to OpenAI so that all selected recipes come back in one structured completion
+SHOPPING_LIST_SCHEMA = {
+    "name": "shopping_list",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "recipes": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "recipe": {"type": "string"},
+                        "ingredients": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "item": {"type": "string"},  # Ingredient name, e.g. "onion"
+                                    "quantity": {"type": ["number", "null"]},  # Amount, or null for "to taste"
+                                    "unit": {"type": "string"},  # Unit such as "g" or "cup", empty for counted items
+                                },
+                                "required": ["item", "quantity", "unit"],
+                                "additionalProperties": False,
+                            },
+                        },
+                    },
+                    "required": ["recipe", "ingredients"],
+                    "additionalProperties": False,
+                },
+            }
+        },
+        "required": ["recipes"],
+        "additionalProperties": False,
+    },
+}
+
+# One structured ingredient row; `recipes` lists the recipes that needed this ingredient
+class IngredientRow(NamedTuple):
+    item: str
+    quantity: Optional[float]
+    unit: str
+    recipes: Tuple[str, ...] = ()
+
+# Map of unit spellings to one canonical unit so that "2 tbsp" and "1 tablespoon" can be merged
+UNIT_ALIASES = {
+    "g": "g", "gram": "g", "grams": "g", "gm": "g", "gms": "g",
+    "kg": "kg", "kilogram": "kg", "kilograms": "kg",
+    "mg": "mg",
+    "ml": "ml", "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml",
+    "l": "l", "liter": "l", "liters": "l", "litre": "l", "litres": "l",
+    "tsp": "tsp", "teaspoon": "tsp", "teaspoons": "tsp",
+    "tbsp": "tbsp", "tablespoon": "tbsp", "tablespoons": "tbsp",
+    "cup": "cup", "cups": "cup",
+    "oz": "oz", "ounce": "oz", "ounces": "oz",
+    "lb": "lb", "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "clove": "clove", "cloves": "clove",
+    "pinch": "pinch", "pinches": "pinch",
+    "can": "can", "cans": "can",
+    "slice": "slice", "slices": "slice",
+    "piece": "", "pieces": "", "pc": "", "pcs": "", "whole": "",
+}
+
+# Canonical units that read as words and take a plural form ("2 cups", "3 cloves")
+COUNTABLE_UNITS = {"cup", "clove", "pinch", "can", "slice"}
+
+# Unicode fractions that OpenAI sometimes uses in free-text ingredient lists
+UNICODE_FRACTIONS = {"½": "1/2", "⅓": "1/3", "⅔": "2/3", "¼": "1/4", "¾": "3/4", "⅛": "1/8"}
+
+# Matches a leading quantity: a range such as "2-3", "2", "1.5", "1/2" or a mixed number such as "1 1/2"
+QUANTITY_PATTERN = re.compile(r"^(\d+(?:\.\d+)?\s*[-–]\s*\d+(?:\.\d+)?|\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?)\s*(.*)$")
+
+# Function to convert a quantity string like "1 1/2" or "0.5" into a float (a range counts as its upper bound)
+def parse_quantity(text: str) -> Optional[float]:
+    text = re.split(r"[-–]", text)[-1]  # "2-3" -> "3", buying enough for the larger amount
+    try:
+        return float(sum(Fraction(part) for part in text.split()))
+    except (ValueError, ZeroDivisionError):
+        return None
+
+# Function to map a unit spelling to its canonical form (unknown units are kept as lowercase text)
+def normalize_unit(unit: str) -> str:
+    unit = unit.strip().lower().rstrip(".")
+    return UNIT_ALIASES.get(unit, unit)
+
+# Function to reduce an English plural to its singular form (good enough for ingredient names)
+def singularize(word: str) -> str:
+    if len(word) > 3 and word.endswith("ies"):
+        return word[:-3] + "y"  # berries -> berry
+    if len(word) > 4 and word.endswith(("oes", "ches", "shes", "sses", "xes")):
+        return word[:-2]  # tomatoes -> tomato, peaches -> peach
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]  # onions -> onion
+    return word
+
+# Function to turn a singular ingredient name into its plural form for display
+def pluralize(word: str) -> str:
+    if word.endswith("y") and len(word) > 1 and word[-2] not in "aeiou":
+        return word[:-1] + "ies"
+    if word.endswith(("o", "ch", "sh", "ss", "x")):
+        return word + "es"
+    if word.endswith("s"):
+        return word
+    return word + "s"
+
+# Function to normalize an ingredient name so the same ingredient from different recipes gets the same key
+def normalize_item(item: str) -> str:
+    item = item.strip().lower()
+    item = item.split(",")[0]  # Drop preparation notes, e.g. "onion, finely chopped"
+    item = re.sub(r"\(.*?\)", "", item)  # Drop bracketed notes, e.g. "chicken (boneless)"
+    item = re.sub(r"^(of|fresh)\s+", "", item.strip())  # "of flour" left over from "2 cups of flour"
+    words = item.split()
+    if not words:
+        return ""
+    words[-1] = singularize(words[-1])  # Only the head noun is plural: "green chilies" -> "green chili"
+    return " ".join(words)
+
+# Function to parse one free-text line such as "- 2 cups rice" into a structured ingredient row
+def parse_ingredient_line(line: str, recipe: str = "") -> Optional[IngredientRow]:
+    line = line.strip()
+    line = re.sub(r"^(?:[-*•]|\d+[.)])\s+", "", line)  # Remove bullet points and list numbering
+    for symbol, fraction in UNICODE_FRACTIONS.items():
+        line = line.replace(symbol, f" {fraction}")
+    line = line.strip()
+    if not line or line.endswith(":"):
+        return None  # Skip empty lines and headings such as "Ingredients:"
+    # Drop bracketed sizes and preparation notes before splitting out the unit and item,
+    # e.g. "1 (14 oz) can tomatoes" -> "1 can tomatoes", "2 cloves garlic, minced" -> "2 cloves garlic"
+    line = re.sub(r"\s*\(.*?\)", "", line).split(",")[0].strip()
+    quantity = None
+    unit = ""
+    match = QUANTITY_PATTERN.match(line)
+    if match:
+        quantity = parse_quantity(match.group(1))
+        line = match.group(2)
+        first, _, rest = line.partition(" ")
+        if rest and first.lower().rstrip(".") in UNIT_ALIASES:
+            unit = normalize_unit(first)
+            line = rest
+    item = normalize_item(line)
+    if not item:
+        return None
+    return IngredientRow(item=item, quantity=quantity, unit=unit, recipes=(recipe,) if recipe else ())
+
+# Function to turn the structured JSON payload returned by OpenAI into ingredient rows
+def rows_from_payload(payload: dict) -> List[IngredientRow]:
+    rows = []
+    for entry in payload.get("recipes", []):
+        recipe = str(entry.get("recipe", "")).strip()
+        for ingredient in entry.get("ingredients", []):
+            item = normalize_item(str(ingredient.get("item", "")))
+            if not item:
+                continue
+            quantity = ingredient.get("quantity")
+            rows.append(IngredientRow(
+                item=item,
+                quantity=float(quantity) if isinstance(quantity, (int, float)) else None,
+                unit=normalize_unit(str(ingredient.get("unit") or "")),
+                recipes=(recipe,) if recipe else (),
+            ))
+    return rows
+
+# Function to split recipes into batches that fit one structured completion, given the tokens each
+# recipe needs and the largest max_tokens of one completion (at least one recipe per batch)
+def batch_recipes(recipes: List[str], tokens_per_recipe: int, max_tokens: int) -> List[List[str]]:
+    size = max(1, max_tokens // tokens_per_recipe)
+    return [recipes[start:start + size] for start in range(0, len(recipes), size)]
+
+# Function to merge rows with the same normalized item and unit across recipes, summing their quantities
+def aggregate_ingredients(rows: List[IngredientRow]) -> List[IngredientRow]:
+    merged: Dict[Tuple[str, str], IngredientRow] = {}
+    for row in rows:
+        key = (row.item, row.unit)
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = row
+            continue
+        # Quantities only add up when both rows have one; "salt to taste" stays without a quantity
+        if existing.quantity is not None and row.quantity is not None:
+            quantity = existing.quantity + row.quantity
+        else:
+            quantity = existing.quantity if existing.quantity is not None else row.quantity
+        recipes = existing.recipes + tuple(r for r in row.recipes if r not in existing.recipes)
+        merged[key] = IngredientRow(item=row.item, quantity=quantity, unit=row.unit, recipes=recipes)
+    return sorted(merged.values(), key=lambda r: r.item)
+
+# Function to format a quantity without a trailing ".0" (3.0 -> "3", 0.5 -> "0.5")
+def format_quantity(quantity: float) -> str:
+    return f"{quantity:g}" if quantity != int(quantity) else str(int(quantity))
+
+# Function to render an aggregated row as display text, e.g. "3 onions" or "2 tbsp oil"
+def format_ingredient_row(row: IngredientRow) -> str:
+    if row.quantity is None:
+        return row.item
+    if row.unit:
+        unit = pluralize(row.unit) if row.quantity > 1 and row.unit in COUNTABLE_UNITS else row.unit
+        return f"{format_quantity(row.quantity)} {unit} {row.item}"
+    item = pluralize(row.item) if row.quantity > 1 else row.item
+    return f"{format_quantity(row.quantity)} {item}"
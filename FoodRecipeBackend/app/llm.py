@@ -0,0 +1,359 @@
+# llm.py
+# This module is the single gateway for OpenAI chat completions. Every call from the API goes through a
+# global admission controller that:
+#   - keeps the app inside the provider's requests-per-minute and tokens-per-minute budgets (token buckets),
+#   - lets interactive calls (recipes, uploads, videos) jump ahead of shopping-list fan-out (priority queue),
+#   - backs off exponentially on 429/5xx errors and honours the provider's Retry-After header,
+#   - records how long calls waited in the queue (see /metrics).
+# Call sites do not name a model: they name a task ("recipe", "video_query", ...) and the routing table
+# below decides the model, limits and the faster fallback model to use when the primary is slow or failing.
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+from typing import NamedTuple, Optional
+
+import openai
+from openai import AsyncOpenAI
+
+from . import metrics
+from .deadlines import current_deadline
+
+# Priorities (lower value = served first)
+PRIORITY_INTERACTIVE = 0  # A user is waiting on the page (generate-recipe, upload-image, get-videos)
+PRIORITY_BATCH = 1        # Shopping-list fan-out over several recipes
+PRIORITY_BACKGROUND = 2   # Catalogue refreshes and other work nobody is waiting for
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch", PRIORITY_BACKGROUND: "background"}
+
+# Provider budgets and retry settings (override them in .env to match your OpenAI account tier)
+REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "30000"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1.0"))
+BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "60.0"))
+# Latency samples a task needs before hedging starts (the p95 is meaningless with fewer)
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Share of a request's LLM stage budget kept for the fallback model when the primary model is slow
+FALLBACK_RESERVE = float(os.getenv("LLM_FALLBACK_RESERVE", "0.3"))
+
+# Settings used for one task: which model to call, its limits, and the model to fall back to
+class ModelRoute(NamedTuple):
+    model: str
+    max_tokens: int
+    temperature: float = 0.7
+    timeout: float = 30.0  # Seconds (including queue time) before the fallback model is tried
+    fallback_model: Optional[str] = None
+    hedge: bool = False  # Send a duplicate request when the first one is slower than the task's p95 latency
+
+# Default routing table, one entry per task
+DEFAULT_MODEL_ROUTES = {
+    "recipe": ModelRoute("gpt-4", max_tokens=100, timeout=30.0, fallback_model="gpt-4o-mini", hedge=True),
+    "upload_recipe": ModelRoute("gpt-4", max_tokens=150, timeout=30.0, fallback_model="gpt-4o-mini", hedge=True),
+    # Sections of a full-length recipe, requested concurrently (see recipe_sections.py)
+    "recipe_ingredients": ModelRoute("gpt-4", max_tokens=300, timeout=30.0, fallback_model="gpt-4o-mini", hedge=True),
+    "recipe_steps": ModelRoute("gpt-4", max_tokens=500, timeout=30.0, fallback_model="gpt-4o-mini", hedge=True),
+    "recipe_notes": ModelRoute("gpt-4o-mini", max_tokens=200, timeout=20.0),
+    "video_query": ModelRoute("gpt-4o-mini", max_tokens=50, timeout=10.0),
+    "ingredients": ModelRoute("gpt-4", max_tokens=200, timeout=30.0, fallback_model="gpt-4o-mini"),
+    # Tasks using structured outputs (response_format json_schema) need gpt-4o class models
+    "shopping_list": ModelRoute("gpt-4o", max_tokens=200, timeout=45.0, fallback_model="gpt-4o-mini"),
+    "catalogue": ModelRoute("gpt-4o", max_tokens=1200, timeout=90.0, fallback_model="gpt-4o-mini"),
+}
+
+# Largest completion (max_tokens) each model accepts; models not listed get DEFAULT_OUTPUT_LIMIT
+MODEL_OUTPUT_LIMITS = {"gpt-4": 8192, "gpt-4o": 16384, "gpt-4o-mini": 16384}
+DEFAULT_OUTPUT_LIMIT = 4096
+
+# JSON file that overrides the routing table without code changes, e.g.
+#   {"video_query": {"model": "gpt-4o-mini", "max_tokens": 40}, "recipe": {"fallback_model": null}}
+MODEL_ROUTES_PATH = os.getenv("LLM_MODEL_ROUTES_PATH", "model_routes.json")
+
+# Function to build the routing table from the defaults plus the optional JSON override file
+def load_model_routes(path: str = MODEL_ROUTES_PATH) -> dict:
+    routes = dict(DEFAULT_MODEL_ROUTES)
+    try:
+        with open(path, "r") as f:
+            overrides = json.load(f)
+    except FileNotFoundError:
+        return routes
+    for task, settings in overrides.items():
+        base = routes.get(task, ModelRoute(model="gpt-4o-mini", max_tokens=200))
+        routes[task] = base._replace(**settings)
+    print(f"Loaded model routes from {path}")
+    return routes
+
+MODEL_ROUTES = load_model_routes()
+
+# Function to get the largest max_tokens a task may request: the smaller output limit of its model and fallback model
+def max_output_tokens(task: str) -> int:
+    route = MODEL_ROUTES[task]
+    models = [route.model] + ([route.fallback_model] if route.fallback_model else [])
+    return min(MODEL_OUTPUT_LIMITS.get(model, DEFAULT_OUTPUT_LIMIT) for model in models)
+
+# A token bucket that refills continuously at `per_minute / 60` units per second up to `per_minute` units
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    # Add the tokens earned since the last update
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until `amount` tokens are available (0 if they are available now)
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)  # A request larger than the whole budget waits for a full bucket
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    # Take tokens out of the bucket (may go negative when a response used more than estimated)
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    # Give back tokens that were reserved but not used
+    def refund(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+# Global scheduler that admits queued calls in priority order whenever both budgets allow it
+class AdmissionController:
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.queue = []  # Heap of (priority, sequence, tokens, future)
+        self.sequence = itertools.count()  # Keeps FIFO order within one priority
+        self.paused_until = 0.0  # Set from Retry-After when the provider says we are over the limit
+        self.wakeup = asyncio.Event()
+        self.dispatcher: Optional[asyncio.Task] = None
+
+    # Wait in the queue until the call may be sent; returns the number of seconds spent waiting
+    async def acquire(self, tokens: int, priority: int) -> float:
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self._dispatch())
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, next(self.sequence), tokens, future))
+        metrics.increment("llm.queued")
+        self.wakeup.set()
+        enqueued_at = time.monotonic()
+        await future  # Cancelled callers leave a cancelled future behind, the dispatcher skips it
+        waited = time.monotonic() - enqueued_at
+        metrics.observe(f"llm.queue_time.{PRIORITY_NAMES.get(priority, priority)}", waited)
+        return waited
+
+    # Stop admitting calls for `seconds` (used when the provider answers 429 with Retry-After)
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.wakeup.set()
+
+    # Correct the token budget once the real usage of a call is known
+    def settle(self, reserved: int, used: Optional[int]):
+        if used is None:
+            return
+        if used < reserved:
+            self.tokens.refund(reserved - used)
+        else:
+            self.tokens.consume(used - reserved)
+
+    # Background loop: admit the head of the queue as soon as the budgets and any 429 pause allow
+    async def _dispatch(self):
+        while True:
+            while self.queue and self.queue[0][3].done():
+                heapq.heappop(self.queue)  # Drop callers that were cancelled while queued
+            if not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            priority, _, tokens, future = self.queue[0]
+            delay = max(
+                self.paused_until - time.monotonic(),
+                self.requests.wait_time(1),
+                self.tokens.wait_time(tokens),
+            )
+            if delay > 0:
+                # Sleep until the budget refills, but wake up early if a new (maybe higher priority) call arrives
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.queue)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            future.set_result(None)
+
+    # Current state for the /metrics endpoint
+    def status(self) -> dict:
+        return {
+            "queued": sum(1 for entry in self.queue if not entry[3].done()),
+            "requests_available": round(self.requests.tokens, 1),
+            "tokens_available": round(self.tokens.tokens, 1),
+            "paused_for_seconds": round(max(0.0, self.paused_until - time.monotonic()), 2),
+        }
+
+# Shared OpenAI client and admission controller (created on first use inside the running event loop)
+_client: Optional[AsyncOpenAI] = None
+_controller: Optional[AdmissionController] = None
+
+# Function to get the shared asynchronous OpenAI client
+def get_client() -> AsyncOpenAI:
+    global _client
+    if _client is None:
+        # OPENAI_BASE_URL points the client at a compatible server, e.g. the local stand-in (app/standin_server.py);
+        # the stand-in does not check the key, so a placeholder is used when none is configured
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY") or "not-set",
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            max_retries=0,  # Retries are handled here
+        )
+    return _client
+
+# Function to get the global admission controller
+def get_controller() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+    return _controller
+
+# Function to estimate the tokens a call will use: prompt (about 4 characters per token) plus the completion limit
+def estimate_tokens(messages: list, max_tokens: int) -> int:
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in messages)
+    return prompt_chars // 4 + max_tokens
+
+# Function to read the provider's Retry-After hint (in seconds) from a rate-limit or server error
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None  # Retry-After as an HTTP date is rare for OpenAI, fall back to exponential backoff
+    return None
+
+# Function to compute the exponential backoff delay for an attempt (with jitter so callers do not retry in lockstep)
+def backoff_delay(attempt: int) -> float:
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+# Errors worth retrying: rate limits, provider 5xx, timeouts and dropped connections
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APITimeoutError, openai.APIConnectionError)
+
+# Function to run one chat completion through the admission controller and return the response text
+async def complete(model: str, messages: list, max_tokens: int, temperature: float = 0.7,
+                   priority: int = PRIORITY_INTERACTIVE, **kwargs) -> str:
+    controller = get_controller()
+    reserved = estimate_tokens(messages, max_tokens)
+    for attempt in range(MAX_RETRIES + 1):
+        await controller.acquire(reserved, priority)
+        try:
+            response = await get_client().chat.completions.create(
+                model=model, messages=messages, max_tokens=max_tokens, temperature=temperature, **kwargs
+            )
+        except RETRYABLE_ERRORS as e:
+            controller.settle(reserved, 0)  # A failed call did not use its token reservation
+            if attempt == MAX_RETRIES:
+                metrics.increment("llm.failed")
+                raise
+            delay = retry_after_seconds(e) or backoff_delay(attempt)
+            if isinstance(e, openai.RateLimitError):
+                metrics.increment("llm.rate_limited")
+                controller.pause(delay)  # Everybody waits, so the queue does not keep hammering the limit
+            metrics.increment("llm.retries")
+            print(f"OpenAI call failed ({type(e).__name__}), retrying in {delay:.1f} seconds")
+            await asyncio.sleep(delay)
+            continue
+        usage = getattr(response, "usage", None)
+        controller.settle(reserved, getattr(usage, "total_tokens", None))
+        metrics.increment("llm.completed")
+        return response.choices[0].message.content.strip()
+
+# Function to get the delay after which a task's request is hedged: its recent p95 latency
+def hedge_delay(task: str) -> Optional[float]:
+    samples = list(metrics.timings.get(f"llm.task.{task}", ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return metrics.percentile(samples, 95)
+
+# Function to run a call with a hedge: if the first attempt has not finished after `delay` seconds,
+# a duplicate is sent and whichever answers first wins (the other one is cancelled)
+async def hedged(make_call, delay: float, task: str) -> str:
+    first = asyncio.ensure_future(make_call())
+    attempts = [first]
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if done:
+            return first.result()
+        metrics.increment(f"llm.task.{task}.hedged")
+        attempts.append(asyncio.ensure_future(make_call()))
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    if attempt is not first:
+                        metrics.increment(f"llm.task.{task}.hedge_won")
+                    return attempt.result()
+        return first.result()  # Both attempts failed: raise the first error
+    finally:
+        for attempt in attempts:
+            if not attempt.done():
+                attempt.cancel()
+
+# Function to run the completion for a task using the routing table; falls back to the task's faster
+# model when the primary model times out or fails, and records per-task latency.
+# The timeouts never exceed the request's LLM stage budget, and the primary attempt leaves
+# FALLBACK_RESERVE of that budget to the fallback model.
+async def complete_task(task: str, messages: list, max_tokens: Optional[int] = None,
+                        priority: int = PRIORITY_INTERACTIVE, **kwargs) -> str:
+    route = MODEL_ROUTES[task]
+    limit = max_tokens or route.max_tokens  # Call sites may scale the limit, e.g. per recipe in a shopping list
+    deadline = current_deadline()
+    started = time.monotonic()
+    # Seconds the LLM stage of the current request may use from now (None without a deadline)
+    budget = deadline.stage_timeout("llm") if deadline else None
+
+    # Timeout for one attempt: the route's timeout, capped by what is left of the stage budget
+    def attempt_timeout() -> float:
+        if budget is None:
+            return route.timeout
+        return min(route.timeout, max(0.0, budget - (time.monotonic() - started)))
+
+    # The primary attempt stops early enough for the fallback model to run within the budget
+    def primary_timeout() -> float:
+        if budget is None or not route.fallback_model:
+            return attempt_timeout()
+        return min(route.timeout, budget * (1 - FALLBACK_RESERVE))
+
+    def call_primary():
+        return complete(route.model, messages, limit, route.temperature, priority, **kwargs)
+
+    delay = hedge_delay(task) if route.hedge else None
+    try:
+        primary = hedged(call_primary, delay, task) if delay is not None else call_primary()
+        result = await asyncio.wait_for(primary, timeout=primary_timeout())
+        metrics.observe(f"llm.task.{task}", time.monotonic() - started)
+        return result
+    except (asyncio.TimeoutError, openai.OpenAIError) as e:
+        if not route.fallback_model or attempt_timeout() <= 0:
+            metrics.increment(f"llm.task.{task}.failed")
+            raise
+        print(f"{task}: {route.model} failed ({type(e).__name__}), falling back to {route.fallback_model}")
+        metrics.increment(f"llm.task.{task}.fallback")
+    result = await asyncio.wait_for(
+        complete(route.fallback_model, messages, limit, route.temperature, priority, **kwargs),
+        timeout=attempt_timeout(),
+    )
+    metrics.observe(f"llm.task.{task}", time.monotonic() - started)
+    return result
@@ -2,12 +2,16 @@
 import os  
 # Import asyncio for asynchronous programming support
 import asyncio  
+# Import ThreadPoolExecutor to run CLIP/FAISS inference off the event loop in a bounded worker pool
+from concurrent.futures import ThreadPoolExecutor  
+# Import functools to pre-fill arguments of helper functions (e.g. the priority of background OpenAI calls)
+import functools  
 # Import datetime and timedelta to work with dates and time intervals
 from datetime import datetime, timedelta  
 # Import various FastAPI modules to create API endpoints and handle HTTP exceptions
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, status  
-# Import FileResponse to send files as responses to API calls
-from fastapi.responses import FileResponse  
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Request, status  
+# Import Response to send in-memory PDFs as responses to API calls (and JSONResponse for custom status codes)
+from fastapi.responses import JSONResponse, Response  
 # Import CORS middleware to handle Cross-Origin Resource Sharing issues (allows external domains to access your API)
 from fastapi.middleware.cors import CORSMiddleware  
 # Import OpenAI to use OpenAI's API services (like GPT-4)
@@ -16,32 +20,12 @@ import openai
 from pydantic import BaseModel  
 # Import load_dotenv to load environment variables from a .env file
 from dotenv import load_dotenv  
-# Import requests to make HTTP requests to external APIs
-import requests  
-# Import torch from PyTorch for tensor operations and model inference
-import torch  
-# Import clip to work with OpenAI's CLIP model for image-text tasks
-import clip  
-# Import faiss for efficient similarity search on embeddings
-import faiss  
-# Import numpy for numerical operations on arrays
-import numpy as np  
-# Import Image from PIL to handle image processing tasks
-from PIL import Image  
-# Import io for handling byte streams (useful for in-memory file operations)
-import io  
-# Import the vision module from google.cloud to use Google Vision API features
-from google.cloud import vision  
-# Import service_account for Google credentials handling
-from google.oauth2 import service_account  
-# Import OpenAI client from openai (a different client initializer)
-from openai import OpenAI  
-# Import FPDF to generate PDF documents
-from fpdf import FPDF  
+# Import json to parse structured (JSON-schema) responses from OpenAI
+import json  
 # Import traceback for printing detailed error traces when exceptions occur
 import traceback  
 # Import List type for type annotations of lists
-from typing import List  
+from typing import List, Optional  
 # Import jwt for JSON Web Token operations (encoding/decoding)
 import jwt  
 # Import select from SQLAlchemy's future module to build SQL queries
@@ -63,27 +47,113 @@ from jose import jwt, JWTError
 if not hasattr(bcrypt, "__about__") or not hasattr(bcrypt.__about__, "__version__"):
     bcrypt.__about__ = types.SimpleNamespace(__version__=bcrypt.__version__)
 
+# Load environment variables from the .env file so that API keys and secrets become available
+# (done before the local imports because modules such as llm.py read their settings at import time)
+load_dotenv()
+
 # -----------------------------
 # Import async database components and ORM models from local modules
-from .database import Base, engine, get_db  # Import the Base class, the engine for database connections, and a function to get a database session
+from .database import AsyncSessionLocal, Base, engine, get_db  # Import the Base class, the engine for database connections, the session factory and a function to get a database session
 from .models import User, RecipeSearch, ChatLog, PDFRecord  # Import ORM models for users, recipe searches, chat logs, and PDF records
+# Import helpers that parse ingredient lists into (item, quantity, unit) rows and merge them across recipes
+from .ingredients import (
+    SHOPPING_LIST_SCHEMA, aggregate_ingredients, batch_recipes, format_ingredient_row, parse_ingredient_line,
+    rows_from_payload,
+)
+# Import in-process performance metrics and the single-flight layer that coalesces identical upstream calls
+from . import metrics
+from .singleflight import SingleFlight
+# Import the OpenAI gateway (model routing table, rate limiting, priority queue and 429-aware retries)
+from . import llm
+# Import the precomputed recipe catalogue (one stored recipe per recognizable dish)
+from .recipe_catalogue import (
+    StoredCatalogue, format_recipe, generate_recipe_entry, is_stale,
+)
+# Import the recognition vocabulary (the dish labels of the stored image embeddings)
+from .vocabulary import load_vocabulary
+# Import the local YouTube query builder (templates + dish vocabulary + synonyms)
+from .video_query import LLM_REFINEMENT_ENABLED, VideoQueryBuilder
+# Import full-length recipe generation from concurrently requested sections
+from .recipe_sections import format_sectioned_recipe, generate_sectioned_recipe
+# Import disconnect detection that cancels a request pipeline when the client goes away
+from .disconnect import run_while_connected
+# Import the dish recognition stack (CLIP + FAISS), loaded in the background instead of at import time
+from . import recognition
+# Import the client for out-of-process recognition workers (used instead of in-process models when configured)
+from .recognition_client import RECOGNITION_SOCKETS, RecognitionClient
+# Import per-request deadlines that split a total time budget across the DB, CLIP, search and LLM stages
+from .deadlines import start_deadline, within_stage
+# Import the shared async HTTP client (pooled keep-alive connections) used for Pexels, YouTube and Nutritionix
+from . import http_client
+# Import the startup warm-up (DB pool, external API connections) that gates readiness
+from . import warmup
+# Import the shared SQLite cache of Pexels and YouTube search results
+from .search_cache import SearchCache
+# Import the storage of persisted per-user PDFs (quota, retention) and its background garbage collector
+from . import pdf_storage
+from . import artifact_gc
+# Import the PDF templates, rendered in a pool of worker processes
+from . import pdf_reports
+from .pdf_reports import NUTRITION_PDF_TEMPLATE_VERSION, meal_totals, render_food_pdf, render_meal_pdf, render_shopping_list_pdf
+# Import the shared on-disk cache of nutrition PDFs
+from .pdf_cache import PDFCache
+# Import the circuit breaker that fails fast while an upstream API is down
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+# Import the local nutrient table (Nutritionix is only called for foods it does not know yet)
+from .nutrient_table import NUTRITIONIX_API_KEY, NUTRITIONIX_APP_ID, NUTRITIONIX_BASE_URL, NutrientTable, NutritionixError, fetch_nutrients
 
 # Set an environment variable to prevent duplicate library loading issues (specific to MKL libraries)
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
-# Load environment variables from the .env file so that API keys and secrets become available
-load_dotenv()
-
 # Create the FastAPI app instance
 app = FastAPI()
 # Create an instance of HTTPBearer for token-based authentication
 oauth2_scheme = HTTPBearer()
 
+# Background startup work (warm-up), kept referenced so it is not garbage collected while running
+startup_tasks = set()
+
 # Startup event: When the app starts, create database tables asynchronously if they don't exist
 @app.on_event("startup")
 async def on_startup():
+    http_client.start()  # Shared HTTP client for the external APIs, closed again at shutdown
+    pdf_reports.start()  # PDF rendering processes, stopped again at shutdown
+    artifact_gc.start(pdf_storage.storage, AsyncSessionLocal)  # Deletes expired and unreferenced PDFs now and then
     async with engine.begin() as conn:  # Begin an async database connection
         await conn.run_sync(Base.metadata.create_all)  # Create tables based on ORM models
+    # Warm-up steps that must finish before /ready reports this instance ready
+    steps = {
+        "database": warmup.warm_up_database(engine),
+        "openai": warmup.warm_up_openai(),
+        "pexels": warmup.warm_up_http(PEXELS_BASE_URL),
+        "youtube": warmup.warm_up_http(YOUTUBE_BASE_URL),
+        "nutritionix": warmup.warm_up_http(NUTRITIONIX_BASE_URL),
+        "pdf_workers": pdf_reports.warm_up(),
+    }
+    # With recognition workers configured, this process does not load the models unless none is reachable
+    use_workers = False
+    if recognition_client.configured:
+        await recognition_client.start()
+        use_workers = recognition_client.available()
+        if not use_workers:
+            print("No recognition worker reachable, falling back to in-process recognition")
+    # Load and warm up the CLIP model and FAISS index in the background, so the other routes answer right away
+    if not use_workers and recognition.WARMUP_MODE == "background":
+        steps["recognition"] = asyncio.wrap_future(recognition.start_warm_up(inference_executor))
+    recognition.start_retries(inference_executor)  # A failed load is retried after its backoff, without waiting for an upload
+    task = asyncio.create_task(warmup.run(steps))
+    startup_tasks.add(task)
+    task.add_done_callback(startup_tasks.discard)
+
+# Shutdown event: close the connections to the recognition workers and the external APIs, stop the PDF workers,
+# the PDF garbage collector and the recognition retries
+@app.on_event("shutdown")
+async def on_shutdown():
+    await recognition_client.close()
+    await http_client.close()
+    pdf_reports.shutdown()
+    artifact_gc.stop()
+    recognition.stop_retries()
 
 # Add CORS middleware to allow requests from any origin (adjust allowed origins as necessary)
 app.add_middleware(
@@ -94,40 +164,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Function to generate the full file path for a given image filename
-def get_image_path(filename):
-    base_dir = os.path.abspath(os.path.join(__file__, ".."))  # Get the parent directory of this file
-    image_dir = os.path.join(base_dir, "static", "images")      # Construct the path to the static/images directory
-    return os.path.join(image_dir, filename)                  # Return the complete path to the image
-
-# Define a mapping between nutritional categories and their corresponding image file paths
-category_images = {
-    "Calories": get_image_path("running_person.png"),
-    "Total Fat": get_image_path("bacon.png"),
-    "Protein": get_image_path("chicken_leg.png"),
-    "Carbohydrates": get_image_path("bread.png"),
-}
-# Define nutritional categories as tuples: (Display Name, API Response Key, Unit)
-categories = [
-    ("Calories", "nf_calories", "kcal"),
-    ("Total Fat", "nf_total_fat", "g"),
-    ("Protein", "nf_protein", "g"),
-    ("Carbohydrates", "nf_total_carbohydrate", "g"),
-]
-# Set dimensions for images used in the PDF (width and height)
-image_width = 12
-image_height = 12
-
 # Retrieve API keys and secrets from environment variables
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 PEXELS_API_KEY = os.getenv("PEXELS_API_KEY")
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 SECRET_KEY = os.getenv("SECRET_KEY")
-# If the OpenAI API key isn't set, raise an error so you don't run without proper credentials
+# Base URLs of the external APIs; point them at the local stand-in (app/standin_server.py) for offline runs
+# and load tests. The OpenAI base URL is read by llm.get_client (OPENAI_BASE_URL), the Nutritionix one
+# by nutrient_table.py (NUTRITIONIX_BASE_URL).
+PEXELS_BASE_URL = os.getenv("PEXELS_BASE_URL", "https://api.pexels.com").rstrip("/")
+YOUTUBE_BASE_URL = os.getenv("YOUTUBE_BASE_URL", "https://www.googleapis.com").rstrip("/")
+# If the OpenAI API key isn't set, warn instead of failing so the app can start against the stand-in server
 if not OPENAI_API_KEY:
-    raise ValueError("OpenAI API key not found. Make sure it's set in your .env file.")
+    print("Warning: OpenAI API key not found. Set OPENAI_API_KEY in your .env file (or OPENAI_BASE_URL for the stand-in).")
 # Set the API key in the OpenAI library for subsequent API calls
 openai.api_key = OPENAI_API_KEY
+# Single-flight groups: concurrent callers with the same key await one upstream call per group
+openai_flight = SingleFlight("openai")
+youtube_flight = SingleFlight("youtube")
+pexels_flight = SingleFlight("pexels")
+nutritionix_flight = SingleFlight("nutritionix")
+# Shared on-disk cache of rendered nutrition PDFs (see pdf_cache.py)
+pdf_cache = PDFCache()
+# Circuit breakers: calls to a failing or slow upstream fail fast and the cached results are served instead
+pexels_breaker = CircuitBreaker("pexels")
+youtube_breaker = CircuitBreaker("youtube")
+nutritionix_breaker = CircuitBreaker("nutritionix")
+# Persistent Pexels/YouTube search result cache shared by all workers (see search_cache.py)
+search_cache = SearchCache()
+
+# Helper function to build a single-flight key from free text (case and surrounding spaces are ignored)
+def flight_key(*parts) -> tuple:
+    return tuple(part.strip().lower() if isinstance(part, str) else part for part in parts)
 
 # Configure password hashing by initializing a CryptContext that uses bcrypt
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -216,68 +284,99 @@ async def login(user: UserLogin, db: AsyncSession = Depends(get_db)):
 # Pydantic model for a recipe prompt request (for generating a recipe)
 class RecipePrompt(BaseModel):
     prompt: str  # The text prompt that describes what recipe to generate
+    # "quick" is one short completion; "full" (opt-in) generates ingredients, steps and notes as concurrent
+    # sections, which costs up to three hedged completions instead of one
+    mode: str = "quick"
 
 # Function to sanitize image descriptions by removing common unwanted terms
 def sanitize_description(description: str) -> str:
     exclude_terms = ["closeup", "picture", "view", "photography"]
     return " ".join(word for word in description.split() if word.lower() not in exclude_terms)
 
+# Helper function that calls the Pexels search API (through the shared async HTTP client)
+async def search_pexels(query: str) -> dict:
+    api_url = f"{PEXELS_BASE_URL}/v1/search"  # URL for the Pexels search API
+    headers = {"Authorization": PEXELS_API_KEY or ""}  # Authorization header using the Pexels API key
+    params = {"query": f"{query} cooked dish", "per_page": 8}  # Query parameters for the search
+    response = await http_client.get_client().get(api_url, headers=headers, params=params)
+    response.raise_for_status()  # Non-200 responses are treated as errors
+    return response.json()
+
 # Endpoint to fetch images related to a query using the Pexels API
 @app.get("/get-images/{query}")
 async def get_images(query: str):
-    api_url = "https://api.pexels.com/v1/search"  # URL for the Pexels search API
-    headers = {"Authorization": PEXELS_API_KEY}  # Authorization header using the Pexels API key
-    params = {"query": f"{query} cooked dish", "per_page": 8}  # Query parameters for the search
     try:
-        response = requests.get(api_url, headers=headers, params=params)  # Make the API request
-        if response.status_code == 200:
-            data = response.json()  # Parse the JSON response
-            images = [
-                {"id": photo["id"], "url": photo["src"]["medium"], "alt": query.capitalize()}
-                for photo in data["photos"]
-            ]
-            return {"images": images}  # Return the list of images
-        return {"images": []}  # Return an empty list if the request fails
+        # Served from the shared search cache; on a miss concurrent page views for the same query share one Pexels request
+        data = await search_cache.get_or_fetch(
+            "pexels", query, lambda normalized: pexels_flight.do(flight_key(normalized), pexels_breaker.call, search_pexels, normalized)
+        )
+        images = [
+            {"id": photo["id"], "url": photo["src"]["medium"], "alt": query.capitalize()}
+            for photo in data["photos"]
+        ]
+        return {"images": images}  # Return the list of images
     except Exception as e:
         print(f"Error fetching images: {str(e)}")  # Log the error
         return {"images": []}
 
-# Endpoint to fetch videos related to a query using the YouTube API and refined search query from OpenAI
+# Build the YouTube query builder from the recognizable dish vocabulary
+try:
+    video_queries = VideoQueryBuilder(load_vocabulary())
+except FileNotFoundError:
+    video_queries = VideoQueryBuilder([])
+
+# Helper function that asks OpenAI to turn a free-text dish name into a YouTube search query
+# (only used for queries outside the vocabulary when VIDEO_QUERY_LLM_REFINEMENT=1)
+async def refine_video_query(query: str) -> str:
+    messages = [
+        {"role": "system", "content": "You are an AI that improves search queries for finding the best cooking videos."},
+        {"role": "user", "content": f"Generate an accurate YouTube search query for cooking a {query} recipe."}
+    ]
+    refined = await llm.complete_task("video_query", messages)
+    return refined.strip('"')  # The model often wraps the query in quotes
+
+# Helper function that calls the YouTube search API (through the shared async HTTP client)
+async def search_youtube(search_query: str) -> dict:
+    youtube_api_url = f"{YOUTUBE_BASE_URL}/youtube/v3/search"  # YouTube search API URL
+    params = {
+        "part": "snippet",
+        "q": search_query,  # Use the refined query for search
+        "type": "video",
+        "maxResults": 3,
+        "key": YOUTUBE_API_KEY,
+    }
+    response = await http_client.get_client().get(youtube_api_url, params=params)
+    if response.status_code != 200:
+        print("YouTube API Error:", response.status_code, response.text)
+    response.raise_for_status()
+    return response.json()
+
+# Endpoint to fetch videos related to a query using the YouTube API and a locally built search query
 @app.get("/get-videos/{query}")
 async def get_videos(query: str):
     try:
-        messages = [
-            {"role": "system", "content": "You are an AI that improves search queries for finding the best cooking videos."},
-            {"role": "user", "content": f"Generate an accurate YouTube search query for cooking a {query} recipe."}
-        ]
-        # Use OpenAI's API to refine the search query
-        openai_response = openai.chat.completions.create(
-            model="gpt-4", messages=messages, max_tokens=50, temperature=0.7
+        # Build the search query locally, e.g. "chicken curry recipe" (no OpenAI round trip for known dishes)
+        search_query = video_queries.build(query)
+        if LLM_REFINEMENT_ENABLED and video_queries.match_dish(query) is None:
+            # Free text outside the vocabulary: refine it with OpenAI once and reuse the result for this dish
+            refined_query = video_queries.cached_refinement(query)
+            if refined_query is None:
+                refined_query = await openai_flight.do(flight_key("video-query", query), refine_video_query, query)
+                video_queries.store_refinement(query, refined_query)
+            search_query = refined_query
+        print(f"Video Search Query: {search_query}")
+        data = await search_cache.get_or_fetch(
+            "youtube", search_query, lambda normalized: youtube_flight.do(flight_key(normalized), youtube_breaker.call, search_youtube, normalized)
         )
-        refined_query = openai_response.choices[0].message.content.strip()  # Extract the refined query
-        print(f"Refined Search Query: {refined_query}")
-        youtube_api_url = "https://www.googleapis.com/youtube/v3/search"  # YouTube search API URL
-        params = {
-            "part": "snippet",
-            "q": refined_query,  # Use the refined query for search
-            "type": "video",
-            "maxResults": 3,
-            "key": YOUTUBE_API_KEY,
-        }
-        response = requests.get(youtube_api_url, params=params)  # Make the API request
-        if response.status_code == 200:
-            data = response.json()  # Parse JSON response
-            videos = [
-                {
-                    "videoId": item["id"]["videoId"],
-                    "title": item["snippet"]["title"],
-                    "thumbnail": item["snippet"]["thumbnails"]["medium"]["url"],
-                }
-                for item in data["items"]
-            ]
-            return {"videos": videos}  # Return the list of videos
-        print("YouTube API Error:", response.status_code, response.text)
-        return {"videos": []}
+        videos = [
+            {
+                "videoId": item["id"]["videoId"],
+                "title": item["snippet"]["title"],
+                "thumbnail": item["snippet"]["thumbnails"]["medium"]["url"],
+            }
+            for item in data["items"]
+        ]
+        return {"videos": videos}  # Return the list of videos
     except Exception as e:
         print(f"Error fetching YouTube videos: {str(e)}")
         return {"videos": []}
@@ -303,148 +402,240 @@ async def save_pdf_record(db: AsyncSession, user_id: int, file_path: str):
     await db.commit()  # Commit to save the record
     await db.refresh(pdf_entry)  # Refresh the record
 
+# Helper function to send an in-memory PDF to the client as a download (with an ETag for stored documents)
+def pdf_response(content: bytes, filename: str, etag: Optional[str] = None) -> Response:
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if etag:
+        headers["ETag"] = etag
+    return Response(content=content, media_type="application/pdf", headers=headers)
+
+# Helper function to record a generated PDF in the user's history; the record points at its per-user,
+# content-addressed path, where a copy is written in the background (see pdf_storage.py)
+async def store_pdf(db: AsyncSession, user_id: int, filename: str, content: bytes) -> str:
+    path = pdf_storage.artifact_path(user_id, filename, content)
+    pdf_storage.persist_later(user_id, path, content)
+    await save_pdf_record(db, user_id, path)
+    return path
+
 # Endpoint to generate a recipe using OpenAI based on a provided prompt
 @app.post("/generate-recipe/")
 async def generate_recipe(recipe_prompt: RecipePrompt, user: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    start_deadline("generate_recipe")  # Total time budget for this request, split across its stages
     try:
         # Retrieve the user from the database using the username from the JWT token
-        result = await db.execute(select(User).filter(User.username == user))
+        result = await within_stage("db", db.execute(select(User).filter(User.username == user)), db)
         db_user = result.scalars().first()
         if not db_user:
             raise HTTPException(status_code=404, detail="User not found")
 
         # Save the recipe search query to the database for history
-        await save_recipe_search(db, db_user.id, recipe_prompt.prompt)
-
-        messages = [
-            {"role": "system", "content": "You are an AI that generates detailed recipes with ingredients, preparation steps, and cook times"},
-            {"role": "user", "content": f"Generate a recipe for {recipe_prompt.prompt}"}
-        ]
-        # Generate a recipe using OpenAI's chat completion API
-        response = openai.chat.completions.create(
-            model="gpt-4", messages=messages, max_tokens=100, temperature=0.7
-        )
-        recipe = response.choices[0].message.content.strip()  # Extract the generated recipe text
+        await within_stage("db", save_recipe_search(db, db_user.id, recipe_prompt.prompt), db)
+
+        if recipe_prompt.mode == "full":
+            # Full-length recipe from concurrent sections, reusing the catalogue's ingredients for known dishes
+            label = video_queries.match_dish(recipe_prompt.prompt)
+            stored_ingredients = recipe_catalogue.get(label, {}).get("ingredients") if label else None
+            recipe_details = await within_stage("llm", openai_flight.do(
+                flight_key("recipe-full", recipe_prompt.prompt),
+                generate_sectioned_recipe, recipe_prompt.prompt, stored_ingredients
+            ))
+            recipe = format_sectioned_recipe(recipe_details)
+        else:
+            messages = [
+                {"role": "system", "content": "You are an AI that generates detailed recipes with ingredients, preparation steps, and cook times"},
+                {"role": "user", "content": f"Generate a recipe for {recipe_prompt.prompt}"}
+            ]
+            # Generate a recipe using OpenAI's chat completion API (identical concurrent prompts share one call)
+            recipe = await within_stage("llm", openai_flight.do(
+                flight_key("recipe", recipe_prompt.prompt), llm.complete_task, "recipe", messages
+            ))
+            recipe_details = None
 
         # Log the generated recipe in the chat history
-        await save_chat_message(db, db_user.id, f"Recipe for {recipe_prompt.prompt}: {recipe}")
-
-        return {"recipe": recipe}  # Return the recipe to the client
+        await within_stage("db", save_chat_message(db, db_user.id, f"Recipe for {recipe_prompt.prompt}: {recipe}"), db)
+
+        return {"recipe": recipe, "recipe_details": recipe_details}  # Return the recipe to the client
+    except HTTPException:
+        raise  # Keep the status code chosen above (404 user, 504 deadline)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Recipe generation timed out. Please try again.")
+    except openai.RateLimitError:
+        # Still rate limited after all retries: tell the client to come back later instead of failing with 500
+        raise HTTPException(status_code=503, detail="Recipe service is busy. Please try again shortly.", headers={"Retry-After": "10"})
     except openai.OpenAIError as e:
         raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-# Google Vision API setup:
-# Retrieve the path to Google Vision credentials from the environment variables
-GOOGLE_VISION_CREDENTIALS_PATH = os.getenv("GOOGLE_VISION_CREDENTIALS_PATH")
-if not GOOGLE_VISION_CREDENTIALS_PATH:
-    raise ValueError("Google Vision credentials path not found. Set GOOGLE_VISION_CREDENTIALS_PATH in .env.")
-# Load credentials for Google Vision from the specified file
-credentials = service_account.Credentials.from_service_account_file(GOOGLE_VISION_CREDENTIALS_PATH)
-# Create a client for Google Vision API using the loaded credentials
-vision_client = vision.ImageAnnotatorClient(credentials=credentials)
-
-# Initialize an OpenAI client instance (for later asynchronous calls)
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-# Load the CLIP model and its preprocessing function; use CPU device for inference
-device = "cpu"
-model, preprocess = clip.load("ViT-B/32", device=device)
-
-# Initialize a FAISS index for similarity search with a vector dimension of 512
-d = 512
-index = faiss.IndexFlatL2(d)
-try:
-    # Load precomputed image embeddings from a .npy file
-    stored_embeddings = np.load("food_embeddings.npy")
-    index.add(stored_embeddings)  # Add these embeddings to the FAISS index
-    # Read the associated recipe names from a text file
-    with open("recipe_names.txt", "r") as f:
-        recipe_names = f.read().splitlines()
-except FileNotFoundError:
-    print("No stored embeddings found, please generate them in Colab first.")
-
-# Function to generate an image embedding from raw image bytes using the CLIP model
-def get_image_embedding(image_bytes):
-    image = Image.open(io.BytesIO(image_bytes))  # Open the image from bytes
-    image = preprocess(image).unsqueeze(0).to(device)  # Preprocess and add a batch dimension, then move to CPU
-    with torch.no_grad():
-        embedding = model.encode_image(image)  # Compute the image embedding using CLIP
-    return embedding.cpu().numpy()  # Return the embedding as a numpy array
+# Load the precomputed recipe catalogue so /upload-image/ can answer without calling OpenAI
+recipe_catalogue = StoredCatalogue()
+if not recipe_catalogue:
+    print("No recipe catalogue found, run `python -m app.recipe_catalogue` to generate it.")
+# Optional: regenerate catalogue entries older than this many days in the background when they are served
+RECIPE_CATALOGUE_REFRESH_DAYS = os.getenv("RECIPE_CATALOGUE_REFRESH_DAYS")
+catalogue_max_age = float(RECIPE_CATALOGUE_REFRESH_DAYS) * 86400 if RECIPE_CATALOGUE_REFRESH_DAYS else None
+# How /upload-image/ generates a recipe for a dish missing from the catalogue, like RecipePrompt.mode:
+# "quick" = one short completion (default), "full" = concurrent sections (see recipe_sections.py), opt-in
+# because it costs up to three hedged completions on top of the background catalogue generation
+UPLOAD_RECIPE_MODE = os.getenv("UPLOAD_RECIPE_MODE", "quick")
+# Background refresh tasks (kept referenced so they are not garbage collected while running)
+catalogue_refresh_tasks = set()
+
+# Background task that (re)generates the stored recipe for one dish and writes it to the catalogue file
+async def refresh_catalogue_entry(label: str):
+    try:
+        # Catalogue refreshes run at background priority so they never delay a waiting user
+        complete = functools.partial(llm.complete_task, "catalogue", priority=llm.PRIORITY_BACKGROUND)
+        entry = await openai_flight.do(flight_key("catalogue", label), generate_recipe_entry, complete, label)
+        # Merge into the file as stored on disk, other workers may have added dishes meanwhile
+        await asyncio.to_thread(recipe_catalogue.store, label, entry)
+        print(f"Recipe catalogue updated for {label}")
+    except Exception as e:
+        print(f"Error refreshing recipe catalogue for {label}: {str(e)}")
+
+# Function to schedule a background catalogue refresh for a dish (at most one at a time per dish)
+def schedule_catalogue_refresh(label: str):
+    if any(task.get_name() == f"catalogue:{label}" for task in catalogue_refresh_tasks):
+        return
+    task = asyncio.create_task(refresh_catalogue_entry(label), name=f"catalogue:{label}")
+    catalogue_refresh_tasks.add(task)
+    task.add_done_callback(catalogue_refresh_tasks.discard)
+
+# Worker pool for CLIP encodes and FAISS searches; work still waiting in its queue is dropped when the
+# request that submitted it is cancelled (e.g. the client disconnected)
+inference_executor = ThreadPoolExecutor(max_workers=int(os.getenv("INFERENCE_WORKERS", "1")), thread_name_prefix="inference")
+# Out-of-process recognition workers (RECOGNITION_SOCKETS); without any, images are recognized in this process
+recognition_client = RecognitionClient(RECOGNITION_SOCKETS)
+
+# Function to tell whether an uploaded image can be recognized right now (by a worker or in-process)
+def recognition_ready() -> bool:
+    return recognition_client.available() or recognition.is_ready()
+
+# Function to compute the CLIP embedding of an image, in a recognition worker when one is connected
+async def encode_image(image_bytes: bytes):
+    if recognition_client.available():
+        try:
+            return await recognition_client.encode(image_bytes)
+        except ConnectionError as e:
+            metrics.increment("recognition.remote.fallback")
+            print(f"Recognition worker failed ({e}), encoding in-process")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, recognition.encode, image_bytes)
+
+# Function to find the dish whose stored embedding is closest to the query embedding
+async def find_dish(query_embedding) -> str:
+    if recognition_client.available():
+        try:
+            _, _, labels = await recognition_client.search(query_embedding, k=1)
+            return labels[0][0]
+        except ConnectionError as e:
+            metrics.increment("recognition.remote.fallback")
+            print(f"Recognition worker failed ({e}), searching in-process")
+    loop = asyncio.get_running_loop()
+    D, I = await loop.run_in_executor(inference_executor, functools.partial(recognition.search, query_embedding, k=1))
+    return recognition.label(I[0][0])
 
 # Endpoint to upload an image and generate a recipe based on the image content
 @app.post("/upload-image/")
-async def upload_image(file: UploadFile = File(...), user: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def upload_image(request: Request, file: UploadFile = File(...), user: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    # Run the pipeline, cancelling it (inference, OpenAI call, ChatLog writes) if the client disconnects
+    return await run_while_connected(request, upload_image_pipeline(file, user, db), "upload_image")
+
+# Pipeline behind /upload-image/: recognize the dish in the image and return its recipe
+async def upload_image_pipeline(file: UploadFile, user: str, db: AsyncSession):
     import time
-    from openai import AsyncOpenAI
-    import aiohttp
 
-    # Initialize an asynchronous OpenAI client for non-blocking API calls
-    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    start_deadline("upload_image")  # Total time budget for this request, split across its stages
     try:
         print(f"Received file: {file.filename}")  # Log the received file name
         start_time = time.time()  # Start a timer for performance logging
 
         # Retrieve the user from the database using the provided token
-        result = await db.execute(select(User).filter(User.username == user))
+        result = await within_stage("db", db.execute(select(User).filter(User.username == user)), db)
         db_user = result.scalars().first()
         if not db_user:
             raise HTTPException(status_code=404, detail="User not found")
 
         # Log the upload action in the user's chat history
-        await save_chat_message(db, db_user.id, f"Uploaded image: {file.filename}")
+        await within_stage("db", save_chat_message(db, db_user.id, f"Uploaded image: {file.filename}"), db)
+
+        # The CLIP model and FAISS index load in the background after startup; until then ask the client to retry
+        if not recognition_ready():
+            recognition.start_warm_up(inference_executor)  # Starts loading in "lazy" mode or when no worker is reachable
+            detail = recognition.error or "Image recognition is still starting up. Please try again shortly."
+            retry_after = max(5, int(recognition.retry_after()) + 1)  # A failed load is retried after its backoff
+            raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(retry_after)})
 
         # Step 1: Read the uploaded image file into bytes
         image_bytes = await file.read()
         print(f"Time to read file: {time.time() - start_time:.2f} seconds")
         step_time = time.time()
 
-        # Step 2: Generate an embedding for the image using the CLIP model
-        query_embedding = get_image_embedding(image_bytes)
+        # Step 2: Generate an embedding for the image using the CLIP model (recognition worker or inference pool)
+        query_embedding = await within_stage("clip", encode_image(image_bytes))
         print(f"Time for CLIP embedding: {time.time() - step_time:.2f} seconds")
         step_time = time.time()
 
         # Step 3: Use FAISS to find the most similar stored image embedding (i.e., the best matching recipe)
-        D, I = index.search(query_embedding, k=1)
-        best_match = recipe_names[I[0][0]]
+        best_match = await within_stage("search", find_dish(query_embedding))
         print(f"Time for FAISS search: {time.time() - step_time:.2f} seconds")
         step_time = time.time()
 
-        # Step 4: Use OpenAI to generate a detailed recipe for the best matching dish
+        # Step 4: Serve the precomputed recipe for the dish from the local catalogue (no network call)
+        entry = recipe_catalogue.get(best_match)
+        if entry is not None:
+            generated_recipe = format_recipe(entry)
+            print(f"Time for catalogue lookup: {time.time() - step_time:.2f} seconds")
+            if is_stale(entry, catalogue_max_age):
+                schedule_catalogue_refresh(best_match)  # Serve the stored recipe now, refresh it for later uploads
+            await within_stage("db", save_chat_message(db, db_user.id, f"Generated recipe for {best_match}: {generated_recipe}"), db)
+            return {"dish": best_match, "recipe": generated_recipe, "recipe_details": entry}
+
+        # Dish not in the catalogue yet: generate the recipe live and store a structured one for next time
+        schedule_catalogue_refresh(best_match)
         messages = [
             {"role": "system", "content": "You are an expert chef AI that generates detailed food recipes."},
             {"role": "user", "content": f"Generate a detailed recipe for {best_match}."}
         ]
-        # Use an asynchronous HTTP session to make the API call with a timeout
-        async with aiohttp.ClientSession() as session:
-            try:
-                response = await asyncio.wait_for(
-                    client.chat.completions.create(
-                        model="gpt-4", messages=messages, max_tokens=150, temperature=0.7
-                    ),
-                    timeout=30.0
-                )
-                generated_recipe = response.choices[0].message.content.strip()  # Extract the recipe text
-                print(f"Time for OpenAI recipe generation: {time.time() - step_time:.2f} seconds")
-                print(f"Generated Recipe: {generated_recipe}")
-
-                # Save the generated recipe in the chat history
-                await save_chat_message(db, db_user.id, f"Generated recipe for {best_match}: {generated_recipe}")
-            except asyncio.TimeoutError:
-                print("OpenAI request timed out after 30 seconds")
-                raise HTTPException(status_code=504, detail="Recipe generation timed out. Please try again.")
-            except Exception as api_error:
-                print(f"OpenAI API error: {str(api_error)}")
-                raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(api_error)}")
+        # Call OpenAI (the routing table sets the timeouts and fallback models);
+        # concurrent uploads of the same dish share one generation
+        recipe_details = None
+        try:
+            if UPLOAD_RECIPE_MODE == "full":
+                # Full-length recipe from concurrent sections (ingredients, steps, notes)
+                recipe_details = await within_stage("llm", openai_flight.do(
+                    flight_key("recipe-full", best_match),
+                    generate_sectioned_recipe, best_match.replace("_", " ")
+                ))
+                generated_recipe = format_sectioned_recipe(recipe_details)
+            else:
+                generated_recipe = await within_stage("llm", openai_flight.do(
+                    flight_key("upload-recipe", best_match), llm.complete_task, "upload_recipe", messages
+                ))
+            print(f"Time for OpenAI recipe generation: {time.time() - step_time:.2f} seconds")
+            print(f"Generated Recipe: {generated_recipe}")
+
+            # Save the generated recipe in the chat history
+            await within_stage("db", save_chat_message(db, db_user.id, f"Generated recipe for {best_match}: {generated_recipe}"), db)
+        except HTTPException:
+            raise  # 504 when the request deadline expired
+        except asyncio.TimeoutError:
+            print("OpenAI request timed out (primary and fallback model)")
+            raise HTTPException(status_code=504, detail="Recipe generation timed out. Please try again.")
+        except openai.RateLimitError:
+            print("OpenAI rate limit still exceeded after retries")
+            raise HTTPException(status_code=503, detail="Recipe service is busy. Please try again shortly.", headers={"Retry-After": "10"})
+        except Exception as api_error:
+            print(f"OpenAI API error: {str(api_error)}")
+            raise HTTPException(status_code=500, detail=f"OpenAI API error: {str(api_error)}")
 
         # Return the best matching dish and its generated recipe to the client
-        return {"dish": best_match, "recipe": generated_recipe}
+        return {"dish": best_match, "recipe": generated_recipe, "recipe_details": recipe_details}
+    except HTTPException:
+        raise  # Keep the status code chosen above (504 timeout, 503 busy, 404 user)
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await client.close()  # Ensure the asynchronous client is properly closed
 
 # Endpoint to retrieve the chat history for the authenticated user
 @app.get("/chat-history/")
@@ -467,57 +658,117 @@ async def get_chat_history(user: str = Depends(get_current_user), db: AsyncSessi
         print(f"Error fetching chat history: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching chat history: {str(e)}")
 
-# Retrieve Nutritionix API keys and app ID from environment variables
-NUTRITIONIX_API_KEY = os.getenv("NUTRITIONIX_API_KEY")
-NUTRITIONIX_APP_ID = os.getenv("NUTRITIONIX_APP_ID")
+# Nutritionix API keys and app ID are read from environment variables by nutrient_table.py
 if not NUTRITIONIX_API_KEY or not NUTRITIONIX_APP_ID:
-    raise ValueError("Nutritionix API keys not found. Set them in your .env file.")
+    print("Warning: Nutritionix API keys not found. Set them in your .env file (or NUTRITIONIX_BASE_URL for the stand-in).")
+# Local nutrient values per food, pre-warmed with `python -m app.nutrient_table` and filled from Nutritionix on a miss
+nutrient_table = NutrientTable()
+if not len(nutrient_table):
+    print("No nutrient table found, run `python -m app.nutrient_table` to pre-warm it.")
+
+# Function to query Nutritionix through its circuit breaker (identical concurrent queries share one call)
+async def query_nutritionix(query: str) -> dict:
+    return await nutritionix_flight.do(flight_key(query), nutritionix_breaker.call, fetch_nutrients, query)
+
+# Function to get the nutrient values of a food from the local table (Nutritionix is only asked on a miss)
+async def lookup_nutrients(food_item: str):
+    return await nutrient_table.lookup(food_item, query_nutritionix)
+
+# Helper function to turn a failed Nutritionix lookup into the error the client sees: a query Nutritionix
+# rejects is the caller's 400, any other upstream failure (error status, unreachable, timeout) a 502
+def nutritionix_http_error(e: Exception) -> HTTPException:
+    print(f"Error fetching nutrition data: {str(e) or type(e).__name__}")
+    if isinstance(e, NutritionixError) and e.rejected_query:
+        return HTTPException(status_code=400, detail=str(e))
+    return HTTPException(status_code=502, detail="Error fetching nutrition data, please try again.")
 
 
 # Pydantic model for a food request (used to generate a nutrition details PDF)
 class FoodRequest(BaseModel):
     food_item: str  # The food item to look up nutritional information for
 
+# Pydantic model for a meal request (several food items, e.g. ["1 cup rice", "200g chicken breast", "pepsi"])
+class MealRequest(BaseModel):
+    foods: List[str]
+
 # Pydantic model for a shopping list request containing a list of recipes
 class ShoppingListRequest(BaseModel):
     recipes: List[str]
-
-# Helper function (again) to get the full path of an image file (used for shopping list images)
-def get_image_path(filename):
-    base_dir = os.path.abspath(os.path.join(__file__, ".."))
-    image_dir = os.path.join(base_dir, "static", "images")
-    return os.path.join(image_dir, filename)
-
-# Define the path to the shopping cart image used in the shopping list PDF
-shopping_cart_image = get_image_path("shopping_cart.png")
-
-# ---------------------------
-# Define a FancyPDF class that extends FPDF to create modern, styled PDFs with custom headers and footers
-class FancyPDF(FPDF):
-    def header(self):
-        # Draw a header background rectangle with a rich blue color
-        self.set_fill_color(0, 102, 204)
-        self.rect(0, 0, self.w, 30, 'F')
-        # Set font and color for the header text and display it centered
-        self.set_font("Arial", "B", 20)
-        self.set_text_color(255, 255, 255)
-        self.cell(0, 15, "Nutrition Details", align="C", ln=True)
-        self.ln(5)
-        # Reset text color to black for subsequent text
-        self.set_text_color(0, 0, 0)
-
-    def footer(self):
-        # Set the position of the footer 20 units from the bottom of the page
-        self.set_y(-20)
-        # Draw a footer background rectangle with the same blue color
-        self.set_fill_color(0, 102, 204)
-        self.rect(0, self.h - 20, self.w, 20, 'F')
-        # Set font and color for the footer text and display the current page number centered
-        self.set_font("Arial", "I", 10)
-        self.set_text_color(255, 255, 255)
-        self.cell(0, 10, f"Page {self.page_no()}", align="C")
-        # Reset text color to black
-        self.set_text_color(0, 0, 0)
+    # "combined" asks OpenAI for all recipes in one structured completion; "per_recipe" sends one prompt per recipe
+    mode: str = "combined"
+
+# Helper function to look up all foods of a meal: stored foods come from the local table, the others
+# from one batched Nutritionix query. Returns the found foods (in request order) and the unknown items.
+async def lookup_meal(food_items: List[str]):
+    food_items = [item.strip() for item in food_items if item.strip()]
+    if not food_items:
+        raise HTTPException(status_code=400, detail="Please add at least one food item.")
+    entries = await nutrient_table.lookup_many(food_items, query_nutritionix)
+    found = [(item, entries[item]) for item in food_items if entries[item] is not None]
+    not_found = [item for item in food_items if entries[item] is None]
+    if not found:
+        raise HTTPException(status_code=400, detail="No food item found.")
+    return found, not_found
+
+# Endpoint to get the nutritional values of every food of a meal and the meal totals
+@app.post("/meal-nutrition/")
+async def meal_nutrition(meal: MealRequest, user: str = Depends(get_current_user)):
+    try:
+        found, not_found = await lookup_meal(meal.foods)
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
+    except Exception as e:
+        raise nutritionix_http_error(e)
+    foods = [{"item": item, **food} for item, food in found]
+    return {"foods": foods, "totals": meal_totals([food for _, food in found]), "not_found": not_found}
+
+# Helper function to get the nutrient values that go into a PDF (without bookkeeping such as fetched_at)
+def pdf_nutrients(food: dict) -> dict:
+    return {key: value for key, value in food.items() if key != "fetched_at"}
+
+# Helper function to send a nutrition PDF from the shared PDF cache, rendering it only on a miss.
+# The user's PDFRecord points at the shared cached file and is only saved once the document is sent, so
+# failed renders do not add history entries. Clients revalidate a document they already have with a
+# conditional GET /pdfs/{record_id} (the ETag is the same), POST always answers with the document.
+async def send_nutrition_pdf(db: AsyncSession, user: str, filename: str, payload: dict, render) -> Response:
+    key = pdf_cache.key({"template": NUTRITION_PDF_TEMPLATE_VERSION, "filename": filename, **payload})
+    etag = f'"{key}"'
+
+    # Retrieve the user from the database to save the PDF record
+    result = await db.execute(select(User).filter(User.username == user))
+    db_user = result.scalars().first()
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    content = await pdf_cache.lookup(key, filename)
+    if content is None:
+        content = await render()  # Rendered in a PDF worker process
+        pdf_cache.store_later(key, filename, content)
+    await save_pdf_record(db, db_user.id, pdf_cache.path(key, filename))
+    return pdf_response(content, filename, etag)
+
+# Endpoint to generate one nutrition details PDF for a whole meal (every food plus the meal totals)
+@app.post("/generate-meal-pdf/")
+async def generate_meal_pdf(meal: MealRequest, user: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    try:
+        found, not_found = await lookup_meal(meal.foods)
+        payload = {"foods": [[item, pdf_nutrients(food)] for item, food in found], "not_found": not_found}
+        return await send_nutrition_pdf(
+            db, user, "meal_nutrition_details.pdf", payload, lambda: pdf_reports.render(render_meal_pdf, found, not_found)
+        )
+    except HTTPException:
+        raise  # Keep the status code chosen above (400 no foods, 404 user)
+    except CircuitOpenError as e:
+        # Nutritionix is down and some foods are not in the local table
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
+    except (NutritionixError, asyncio.TimeoutError) as e:
+        raise nutritionix_http_error(e)
+    except Exception as e:
+        print(f"Error: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
 
 # ---------------------------
 # Endpoint to generate a nutrition details PDF using FancyPDF with an enhanced design
@@ -526,155 +777,119 @@ async def generate_food_pdf(food_request: FoodRequest, user: str = Depends(get_c
     try:
         food_item = food_request.food_item  # Get the food item from the request
         print(f"Received food item: {food_item}")
-        headers = {
-            "x-app-id": NUTRITIONIX_APP_ID,
-            "x-app-key": NUTRITIONIX_API_KEY,
-        }
-        params = {"query": food_item}  # Set the query parameter for the Nutritionix API
-        # Make a POST request to Nutritionix API to fetch nutritional information for the food item
-        nutrition_response = requests.post("https://trackapi.nutritionix.com/v2/natural/nutrients", headers=headers, json=params)
-        if nutrition_response.status_code != 200:
-            print(f"Nutritionix error: {nutrition_response.text}")
-            raise HTTPException(status_code=400, detail="Error fetching nutrition data.")
-        nutrition_data = nutrition_response.json()  # Parse the JSON response
-        foods = nutrition_data.get("foods", [])
-        if not foods:
+        # Read the nutritional information from the local table (Nutritionix is only called for unknown foods)
+        food = await lookup_nutrients(food_item)
+        if food is None:
             raise HTTPException(status_code=400, detail="No food item found.")
-        food = foods[0]  # Use the first food item returned
-
-        # Create an instance of FancyPDF to build the PDF document
-        pdf = FancyPDF()
-        pdf.add_page()  # Add a new page to the PDF
-        pdf.set_auto_page_break(auto=True, margin=15)  # Enable automatic page breaks with a margin
-
-        # Create a title section with a background fill
-        pdf.set_fill_color(230, 230, 230)
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(0, 12, f"{food_item.title()} Nutrition Details", ln=True, align="C", fill=True)
-        pdf.ln(8)
-
-        # Display the food image (if available) and the food name
-        food_image_path = os.path.join(os.path.abspath(os.path.join(__file__, "..")), "static", "food.png")
-        if os.path.exists(food_image_path):
-            pdf.image(food_image_path, x=10, y=pdf.get_y(), w=30)
-            pdf.set_xy(45, pdf.get_y() + 5)
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 10, f"Food: {food['food_name'].title()}", ln=True)
-        pdf.ln(5)
-
-        # Generate a table of nutritional values with alternating row colors for better readability
-        row_color = False
-        for category, key, unit in categories:
-            value = food.get(key, "N/A")  # Get the nutritional value or use "N/A" if not available
-            image_path = category_images.get(category, "")  # Get the corresponding image for the category
-            x = pdf.get_x()
-            y = pdf.get_y()
-            fill_color = (245, 245, 245) if row_color else (255, 255, 255)  # Alternate row colors
-            pdf.set_fill_color(*fill_color)
-            # Create a cell for the category icon
-            pdf.cell(image_width, 12, "", border=1, fill=True)
-            if image_path and os.path.exists(image_path):
-                pdf.image(image_path, x + 1, y + 1, image_width - 2, image_height - 2)
-            pdf.set_x(x + image_width)
-            # Create a cell for the category name
-            pdf.cell(80, 12, category, border=1, fill=True)
-            # Create a cell for the nutritional value, right-aligned
-            pdf.cell(50, 12, f"{value} {unit}", border=1, align="R", fill=True)
-            pdf.ln(12)
-            row_color = not row_color  # Toggle row color for next row
-
-        pdf_file_path = f"{food_item.replace(' ', '_')}_nutrition_details.pdf"  # Define the output PDF file name
-        pdf.output(pdf_file_path)  # Save the PDF to a file
-        print(f"PDF successfully created: {pdf_file_path}")
-
-        # Retrieve the user from the database to save the PDF record
-        result = await db.execute(select(User).filter(User.username == user))
-        db_user = result.scalars().first()
-        if not db_user:
-            raise HTTPException(status_code=404, detail="User not found")
-        await save_pdf_record(db, db_user.id, pdf_file_path)  # Save the PDF record in the database
 
-        # Return the generated PDF as a file response
-        return FileResponse(pdf_file_path, media_type="application/pdf", filename=pdf_file_path)
+        # Identical requests share one cached PDF (rendered once, then served from disk)
+        filename = pdf_storage.safe_filename(f"{food_item.replace(' ', '_')}_nutrition_details.pdf")
+        payload = {"title": food_item.title(), "food": pdf_nutrients(food)}
+        return await send_nutrition_pdf(db, user, filename, payload, lambda: pdf_reports.render(render_food_pdf, food_item, food))
+    except HTTPException:
+        raise  # Keep the status code chosen above (400 unknown food, 404 user)
+    except CircuitOpenError as e:
+        # Nutritionix is down and the food is not in the local table
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
+    except (NutritionixError, asyncio.TimeoutError) as e:
+        raise nutritionix_http_error(e)
     except Exception as e:
         print(f"Error: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
 
+# ---------------------------
+# Largest max_tokens of one combined shopping list completion (the model's output limit applies as well);
+# longer selections are split into batches of recipes that are requested concurrently
+SHOPPING_LIST_MAX_TOKENS = int(os.getenv("SHOPPING_LIST_MAX_TOKENS", "4000"))
+
+# Helper function to fetch ingredients for several recipes in ONE JSON-schema-constrained completion
+# This avoids repeating the system prompt N times and returns rows that need no free-text parsing
+async def fetch_ingredient_rows_batch(recipes: List[str], max_tokens: int):
+    messages = [
+        {"role": "system", "content": "You are an AI chef that provides ingredients lists for recipes. "
+                                      "Give each ingredient a numeric quantity and a unit (empty unit for counted items)."},
+        {"role": "user", "content": "Provide the ingredients needed for each of these recipes: " + "; ".join(recipes)}
+    ]
+    # The "shopping_list" route uses a model that supports structured outputs (response_format json_schema)
+    content = await openai_flight.do(
+        flight_key("shopping-list", *sorted(recipe.strip().lower() for recipe in recipes)),
+        llm.complete_task, "shopping_list", messages,
+        max_tokens=max_tokens, priority=llm.PRIORITY_BATCH,
+        response_format={"type": "json_schema", "json_schema": SHOPPING_LIST_SCHEMA},
+    )
+    return rows_from_payload(json.loads(content))
+
+# Helper function to fetch ingredients for all recipes with as few structured completions as fit the token limit
+async def fetch_ingredient_rows_combined(recipes: List[str]):
+    tokens_per_recipe = llm.MODEL_ROUTES["shopping_list"].max_tokens
+    limit = min(SHOPPING_LIST_MAX_TOKENS, llm.max_output_tokens("shopping_list"))
+    batches = batch_recipes(recipes, tokens_per_recipe, limit)
+    results = await asyncio.gather(*(
+        fetch_ingredient_rows_batch(batch, tokens_per_recipe * len(batch)) for batch in batches
+    ))
+    return [row for rows in results for row in rows]
+
+# Helper function to fetch ingredients with one free-text prompt per recipe and parse each line into a row
+async def fetch_ingredient_rows_per_recipe(recipes: List[str]):
+    async def fetch_one(recipe: str):
+        messages = [
+            {"role": "system", "content": "You are an AI chef that provides ingredients lists for recipes."},
+            {"role": "user", "content": f"Provide a list of ingredients needed for {recipe}."}
+        ]
+        content = await openai_flight.do(
+            flight_key("ingredients", recipe), llm.complete_task, "ingredients", messages, priority=llm.PRIORITY_BATCH
+        )
+        return [row for row in (parse_ingredient_line(line, recipe) for line in content.split("\n")) if row]
+
+    # Request all recipes concurrently and flatten the per-recipe rows
+    results = await asyncio.gather(*(fetch_one(recipe) for recipe in recipes))
+    return [row for rows in results for row in rows]
+
 # ---------------------------
 # Endpoint to generate a grocery shopping list PDF based on selected recipes
 @app.post("/generate-shopping-list/")
-async def generate_shopping_list(request: ShoppingListRequest, user: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def generate_shopping_list(request: ShoppingListRequest, http_request: Request, user: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    # Run the pipeline, cancelling it (OpenAI calls, PDF render, DB writes) if the client disconnects
+    return await run_while_connected(http_request, shopping_list_pipeline(request, user, db), "generate_shopping_list")
+
+# Pipeline behind /generate-shopping-list/: fetch and merge the ingredients, then render the PDF
+async def shopping_list_pipeline(request: ShoppingListRequest, user: str, db: AsyncSession):
+    start_deadline("generate_shopping_list")  # Total time budget for this request, split across its stages
     try:
         selected_recipes = request.recipes  # Get the list of selected recipes from the request
-        recipe_ingredients = {}  # Dictionary to store ingredients for each recipe
+        if not selected_recipes:
+            raise HTTPException(status_code=400, detail="Please select at least one recipe.")
 
         # Retrieve the user from the database
-        result = await db.execute(select(User).filter(User.username == user))
+        result = await within_stage("db", db.execute(select(User).filter(User.username == user)), db)
         db_user = result.scalars().first()
         if not db_user:
             raise HTTPException(status_code=404, detail="User not found")
 
         # Save each recipe search query in the database for history tracking
         for recipe in selected_recipes:
-            await save_recipe_search(db, db_user.id, f"Shopping list recipe: {recipe}")
+            await within_stage("db", save_recipe_search(db, db_user.id, f"Shopping list recipe: {recipe}"), db)
 
-        # For each selected recipe, generate a list of ingredients using OpenAI
-        for recipe in selected_recipes:
-            messages = [
-                {"role": "system", "content": "You are an AI chef that provides ingredients lists for recipes."},
-                {"role": "user", "content": f"Provide a list of ingredients needed for {recipe}."}
-            ]
-            response = openai.chat.completions.create(
-                model="gpt-4", messages=messages, max_tokens=200, temperature=0.7
-            )
-            ingredients = response.choices[0].message.content.strip().split("\n")
-            recipe_ingredients[recipe] = [item.strip() for item in ingredients if item.strip()]
-
-        # Create a new PDF document for the shopping list
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-
-        # Add a title for the shopping list
-        pdf.set_font("Arial", style="B", size=16)
-        pdf.cell(0, 10, txt="Grocery Shopping List", ln=True, align="C")
-        pdf.ln(5)
-
-        # Add a shopping cart image if it exists
-        if os.path.exists(shopping_cart_image):
-            pdf.image(shopping_cart_image, x=95, y=20, w=10, h=10)
-        pdf.ln(15)
-
-        pdf.set_font("Arial", size=12)
-
-        # For each recipe, add a section in the PDF with its ingredients
-        for recipe, ingredients in recipe_ingredients.items():
-            pdf.set_font("Arial", style="B", size=14)
-            pdf.cell(0, 10, txt=f"{recipe.title()}", ln=True, border=1)
-            pdf.set_font("Arial", size=12)
-            pdf.ln(2)
-            for ingredient in ingredients:
-                if ingredient.startswith("- "):
-                    ingredient = ingredient[2:].strip()  # Remove the leading hyphen if present
-                parts = ingredient.split(" ", 1)
-                if len(parts) > 1 and parts[0].isdigit():
-                    quantity = parts[0]
-                    item = parts[1]
-                    pdf.cell(0, 8, txt=f"- {item} (x{quantity})", ln=True)
-                else:
-                    pdf.cell(0, 8, txt=f"- {ingredient}", ln=True)
-            pdf.ln(5)
-
-        pdf_path = "shopping_list.pdf"  # Define the PDF file name for the shopping list
-        pdf.output(pdf_path)  # Save the PDF to a file
-        print(f"PDF successfully created: {pdf_path}")
+        # Collect structured ingredient rows for all selected recipes using OpenAI
+        if request.mode == "per_recipe":
+            rows = await within_stage("llm", fetch_ingredient_rows_per_recipe(selected_recipes))
+        else:
+            rows = await within_stage("llm", fetch_ingredient_rows_combined(selected_recipes))
+        # Merge the same ingredient across recipes, e.g. "2 onions" + "1 onion" -> "3 onions"
+        shopping_items = aggregate_ingredients(rows)
+
+        # Render the PDF in a worker process from plain data: the recipes and one formatted line per ingredient
+        items = [(format_ingredient_row(row), list(row.recipes)) for row in shopping_items]
+        content = await within_stage("render", pdf_reports.render(render_shopping_list_pdf, selected_recipes, items))
 
         # Save the shopping list PDF record in the database
-        await save_pdf_record(db, db_user.id, pdf_path)
+        await within_stage("db", store_pdf(db, db_user.id, "shopping_list.pdf", content), db)
 
-        # Return the shopping list PDF as a file response
-        return FileResponse(pdf_path, media_type="application/pdf", filename="shopping_list.pdf")
+        # Send the shopping list PDF straight from memory
+        return pdf_response(content, "shopping_list.pdf")
+    except HTTPException:
+        raise  # Keep the status code chosen above (404 user, 504 deadline)
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating shopping list: {str(e)}")
@@ -750,7 +965,7 @@ async def get_nutrition_history(user: str = Depends(get_current_user), db: Async
 
         # Format the PDF records into a history list
         history = [
-            {"type": "pdf", "file_path": entry.file_path, "created_at": entry.created_at} 
+            {"type": "pdf", "id": entry.id, "file_path": entry.file_path, "created_at": entry.created_at} 
             for entry in pdfs if "nutrition_details" in entry.file_path
         ]
         history.sort(key=lambda x: x["created_at"])
@@ -782,7 +997,7 @@ async def get_shopping_list_history(user: str = Depends(get_current_user), db: A
             {"type": "search", "query": entry.query, "timestamp": entry.timestamp} 
             for entry in searches if "Shopping list recipe" in entry.query
         ] + [
-            {"type": "pdf", "file_path": entry.file_path, "created_at": entry.created_at} 
+            {"type": "pdf", "id": entry.id, "file_path": entry.file_path, "created_at": entry.created_at} 
             for entry in pdfs if "shopping_list" in entry.file_path
         ]
         history.sort(key=lambda x: x["timestamp"] if "timestamp" in x else x["created_at"])
@@ -790,3 +1005,88 @@ async def get_shopping_list_history(user: str = Depends(get_current_user), db: A
     except Exception as e:
         print(f"Error fetching shopping list history: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error fetching history: {str(e)}")
+
+# Helper function to read a stored PDF by its record path: a per-user artifact or a shared cached report.
+# Paths of neither kind (files written to the working directory by older versions) are not read.
+async def read_pdf(path: str) -> Optional[bytes]:
+    if pdf_storage.storage.owns(path):
+        return await asyncio.to_thread(pdf_storage.storage.read, path)
+    if pdf_cache.owns(path):
+        return await asyncio.to_thread(pdf_cache.read_path, path)
+    return None
+
+# Endpoint to download one of the user's generated PDFs by the id of its history record
+# (410 Gone once the file expired, went over the quota or was evicted from the shared cache). Stored
+# paths are content-addressed, so their folder name is the ETag; a client that already has the document
+# (If-None-Match) gets 304 Not Modified without a body.
+@app.get("/pdfs/{record_id}")
+async def download_pdf(record_id: int, request: Request, user: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(User).filter(User.username == user))
+    db_user = result.scalars().first()
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    record = await db.get(PDFRecord, record_id)
+    if record is None or record.user_id != db_user.id:
+        raise HTTPException(status_code=404, detail="PDF not found")
+    try:
+        content = await read_pdf(record.file_path)
+    except OSError as e:
+        print(f"Error reading PDF {record.file_path}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error reading PDF")
+    if content is None:
+        raise HTTPException(status_code=410, detail="This PDF is no longer stored, please generate it again")
+    etag = f'"{record.file_path.split("/")[-2]}"'
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        metrics.increment("pdfs.not_modified")
+        return Response(status_code=304, headers={"ETag": etag})
+    return pdf_response(content, record.file_path.split("/")[-1], etag)
+
+# Endpoint to expose in-process performance metrics (upstream calls, deduplicated calls, latencies)
+@app.get("/metrics")
+async def get_metrics():
+    snapshot = metrics.snapshot()
+    snapshot["inflight"] = {
+        flight.name: flight.inflight() for flight in (openai_flight, youtube_flight, pexels_flight, nutritionix_flight)
+    }
+    snapshot["llm_admission"] = llm.get_controller().status()
+    snapshot["inference_queue"] = inference_executor._work_queue.qsize()  # Encodes waiting for a worker
+    snapshot["recognition_workers"] = recognition_client.status()
+    snapshot["search_cache"] = search_cache.stats()
+    snapshot["search_cache"]["entries"] = await asyncio.to_thread(search_cache.entries)
+    snapshot["pdf_gc"] = artifact_gc.last_run
+    return snapshot
+
+# Endpoint to clear the performance metrics, so a benchmark step only reports its own samples
+@app.post("/metrics/reset")
+async def reset_metrics():
+    metrics.reset()
+    return {"message": "Metrics reset"}
+
+# Endpoint to report the circuit breaker state of each third-party API
+@app.get("/circuit-breakers")
+async def circuit_breakers():
+    return {breaker.name: breaker.status() for breaker in (pexels_breaker, youtube_breaker, nutritionix_breaker)}
+
+# Liveness endpoint: the process is up and serving requests (the recognition models may still be loading)
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "warm_up": warmup.state,
+        "recognition": recognition.status(),
+        "recognition_workers": recognition_client.status(),
+    }
+
+# Readiness endpoint: 200 once warm-up finished and images can be recognized (or will be loaded lazily),
+# 503 while warming up or when the models failed to load
+@app.get("/ready")
+async def ready():
+    body = {
+        "ready": warmup.state["done"] and (recognition_ready() or recognition.WARMUP_MODE == "lazy"),
+        "warm_up": warmup.state,
+        "recognition": recognition.status(),
+        "recognition_workers": recognition_client.status(),
+    }
+    if not body["ready"]:
+        return JSONResponse(status_code=503, content=body)
+    return body
@@ -0,0 +1,48 @@
+# metrics.py
+# This module keeps simple in-process performance metrics (counters and latency samples)
+# that the API exposes on the /metrics endpoint. Every worker process keeps its own numbers.
+from collections import defaultdict, deque
+from typing import Dict
+
+# Number of latency samples kept per metric (older samples are dropped)
+MAX_SAMPLES = 2000
+
+# Counters such as "singleflight.openai.deduplicated", keyed by metric name
+counters: Dict[str, int] = defaultdict(int)
+# Latency samples in seconds, keyed by metric name
+timings: Dict[str, deque] = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+
+# Function to increase a counter by the given amount
+def increment(name: str, amount: int = 1):
+    counters[name] += amount
+
+# Function to record one latency sample (in seconds) for a metric
+def observe(name: str, seconds: float):
+    timings[name].append(seconds)
+
+# Function to drop all counters and latency samples (e.g. between load-test steps)
+def reset():
+    counters.clear()
+    timings.clear()
+
+# Function to compute a percentile (0-100) from a list of samples
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+# Function to summarize all counters and latency samples as a JSON-friendly dictionary
+def snapshot() -> dict:
+    summary = {}
+    for name, samples in timings.items():
+        values = list(samples)
+        summary[name] = {
+            "count": len(values),
+            "avg_ms": round(1000 * sum(values) / len(values), 2) if values else 0.0,
+            "p50_ms": round(1000 * percentile(values, 50), 2),
+            "p95_ms": round(1000 * percentile(values, 95), 2),
+            "p99_ms": round(1000 * percentile(values, 99), 2),
+        }
+    return {"counters": dict(counters), "timings": summary}
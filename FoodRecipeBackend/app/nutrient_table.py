@@ -0,0 +1,242 @@
+# nutrient_table.py
+# This module keeps a local table of nutrient values keyed by normalized food name, so nutrition PDFs
+# for known foods need no Nutritionix round trip. The table is stored as JSON next to the recipe
+# catalogue; it is pre-warmed in bulk for every dish the image recognizer can return, filled from
+# Nutritionix when a food is missing, and entries older than NUTRIENT_TABLE_MAX_AGE_DAYS are refreshed
+# in the background when they are served (or by the offline job below).
+#
+# Run it as a job from the FoodRecipeBackend folder (e.g. weekly from cron):
+#   python -m app.nutrient_table                    # fetch missing dishes of the vocabulary
+#   python -m app.nutrient_table --max-age-days 30  # also refresh entries older than 30 days
+#   python -m app.nutrient_table --force            # refresh everything
+import argparse
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from . import file_store, http_client, metrics
+from .vocabulary import dish_display_name, load_vocabulary
+
+# Path of the stored table (relative to the working directory, like recipe_catalogue.json)
+NUTRIENT_TABLE_PATH = os.getenv("NUTRIENT_TABLE_PATH", "nutrient_table.json")
+# Entries older than this are refreshed in the background when they are served
+NUTRIENT_TABLE_MAX_AGE_DAYS = float(os.getenv("NUTRIENT_TABLE_MAX_AGE_DAYS", "30"))
+# Nutritionix API (point NUTRITIONIX_BASE_URL at app/standin_server.py for offline runs)
+NUTRITIONIX_BASE_URL = os.getenv("NUTRITIONIX_BASE_URL", "https://trackapi.nutritionix.com").rstrip("/")
+NUTRITIONIX_API_KEY = os.getenv("NUTRITIONIX_API_KEY")
+NUTRITIONIX_APP_ID = os.getenv("NUTRITIONIX_APP_ID")
+
+# Fields of a Nutritionix food that are stored (the rest, e.g. photos and alternative measures, is dropped)
+NUTRIENT_FIELDS = [
+    "food_name", "serving_qty", "serving_unit", "serving_weight_grams",
+    "nf_calories", "nf_total_fat", "nf_saturated_fat", "nf_cholesterol", "nf_sodium",
+    "nf_total_carbohydrate", "nf_dietary_fiber", "nf_sugars", "nf_protein", "nf_potassium",
+]
+
+# Type of the function used to query Nutritionix: (query) -> natural/nutrients response
+FetchFn = Callable[[str], Awaitable[dict]]
+
+class NutritionixError(Exception):
+    """Raised when Nutritionix answers with an error status (`status_code`) or cannot be reached (None)."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    # Whether Nutritionix rejected the query itself (e.g. a food name it cannot parse) rather than failing
+    @property
+    def rejected_query(self) -> bool:
+        return self.status_code in (400, 422)
+
+# Function to normalize a food name so "Chicken  Curry" and "chicken_curry" share one entry
+def normalize_food_name(name: str) -> str:
+    return " ".join(name.replace("_", " ").lower().split())
+
+# Function to call the Nutritionix natural-language nutrients API (a query may list several foods)
+async def fetch_nutrients(query: str) -> dict:
+    headers = {
+        "x-app-id": NUTRITIONIX_APP_ID or "",
+        "x-app-key": NUTRITIONIX_API_KEY or "",
+    }
+    try:
+        response = await http_client.get_client().post(
+            f"{NUTRITIONIX_BASE_URL}/v2/natural/nutrients", headers=headers, json={"query": query}
+        )
+    except httpx.HTTPError as e:
+        raise NutritionixError(f"Error reaching Nutritionix: {str(e) or type(e).__name__}") from e
+    if response.status_code == 404:
+        return {"foods": []}  # Nutritionix could not match any of the foods
+    if response.status_code != 200:
+        print(f"Nutritionix error: {response.text}")
+        raise NutritionixError(f"Error fetching nutrition data ({response.status_code}).", response.status_code)
+    return response.json()
+
+# Function to turn one Nutritionix food into a table entry
+def make_entry(food: dict) -> dict:
+    entry = {field: food[field] for field in NUTRIENT_FIELDS if field in food}
+    entry["fetched_at"] = time.time()  # Used to decide when the entry needs a refresh
+    return entry
+
+# Function to load the stored table (an empty table is returned if the file does not exist yet or is
+# unreadable, so a damaged file does not keep the API from starting; the next save replaces it)
+def load_table(path: str = NUTRIENT_TABLE_PATH) -> Dict[str, dict]:
+    return file_store.load_json(path)
+
+# Function to save the table atomically so that readers never see a half-written file
+def save_table(table: Dict[str, dict], path: str = NUTRIENT_TABLE_PATH):
+    file_store.save_json(table, path)
+
+# Function to merge entries into the file as stored on disk; the read-modify-write runs under the table's
+# file lock, so concurrent writers do not lose each other's entries. Returns the merged table.
+def update_table(entries: Dict[str, dict], path: str = NUTRIENT_TABLE_PATH) -> Dict[str, dict]:
+    return file_store.update_json(entries, path)
+
+# Function to check whether an entry is older than the allowed age
+def is_expired(entry: dict, max_age_seconds: Optional[float]) -> bool:
+    if max_age_seconds is None:
+        return False
+    return time.time() - entry.get("fetched_at", 0) > max_age_seconds
+
+# Function to fetch entries for several foods with one Nutritionix query ("pizza, chicken curry, ...").
+# Nutritionix answers with one food per item in order; when it splits or drops items the order can no
+# longer be trusted, so those foods are fetched one by one instead.
+async def fetch_entries(names: List[str], fetch: FetchFn) -> Dict[str, dict]:
+    if not names:
+        return {}
+    foods = (await fetch(", ".join(names))).get("foods", [])
+    if len(foods) == len(names):
+        return {normalize_food_name(name): make_entry(food) for name, food in zip(names, foods)}
+    if len(names) == 1:
+        return {normalize_food_name(names[0]): make_entry(foods[0])} if foods else {}
+    entries = {}
+    for result in await asyncio.gather(*(fetch_entries([name], fetch) for name in names)):
+        entries.update(result)
+    return entries
+
+class NutrientTable:
+    def __init__(self, path: str = NUTRIENT_TABLE_PATH, max_age_days: Optional[float] = NUTRIENT_TABLE_MAX_AGE_DAYS):
+        self.path = path
+        self.max_age = max_age_days * 86400 if max_age_days is not None else None
+        self.entries = load_table(path)
+        self._refresh_tasks = set()  # Background refreshes, kept referenced while running
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    # Function to get the stored entry for a food (None when it is not in the table)
+    def get(self, name: str) -> Optional[dict]:
+        return self.entries.get(normalize_food_name(name))
+
+    # Return the entry for a food from the table, or from Nutritionix on a miss (None if it knows no such food)
+    async def lookup(self, name: str, fetch: FetchFn) -> Optional[dict]:
+        key = normalize_food_name(name)
+        entry = self.entries.get(key)
+        if entry is None:
+            # Another worker may have stored it meanwhile
+            self.entries.update(await asyncio.to_thread(load_table, self.path))
+            entry = self.entries.get(key)
+        if entry is not None:
+            metrics.increment("nutrients.table.hit")
+            if is_expired(entry, self.max_age):
+                self.schedule_refresh(key, fetch)  # Serve the stored values now, refresh them for later
+            return entry
+        metrics.increment("nutrients.table.miss")
+        fetched = await fetch_entries([key], fetch)
+        await self.store(fetched)
+        return fetched.get(key)
+
+    # Return the entries for several foods (None for foods Nutritionix does not know); the foods missing
+    # from the table are fetched together in one batched Nutritionix query
+    async def lookup_many(self, names: List[str], fetch: FetchFn) -> Dict[str, Optional[dict]]:
+        keys = list(dict.fromkeys(normalize_food_name(name) for name in names))
+        if any(key not in self.entries for key in keys):
+            self.entries.update(await asyncio.to_thread(load_table, self.path))
+        missing = [key for key in keys if key not in self.entries]
+        metrics.increment("nutrients.table.hit", len(keys) - len(missing))
+        for key in keys:
+            if key in self.entries and is_expired(self.entries[key], self.max_age):
+                self.schedule_refresh(key, fetch)
+        if missing:
+            metrics.increment("nutrients.table.miss", len(missing))
+            await self.store(await fetch_entries(missing, fetch))
+        return {name: self.entries.get(normalize_food_name(name)) for name in names}
+
+    # Function to add entries to the table and merge them into the file as stored on disk
+    async def store(self, entries: Dict[str, dict]):
+        if not entries:
+            return
+        self.entries.update(entries)
+        try:
+            await asyncio.to_thread(update_table, entries, self.path)
+        except OSError as e:
+            print(f"Error saving the nutrient table: {str(e)}")
+
+    # Background task that fetches one food again and stores it
+    async def _refresh(self, key: str, fetch: FetchFn):
+        try:
+            await self.store(await fetch_entries([key], fetch))
+            metrics.increment("nutrients.table.refreshed")
+        except Exception as e:
+            print(f"Error refreshing nutrient values for {key}: {str(e)}")
+
+    # Function to schedule a background refresh for a food (at most one at a time per food)
+    def schedule_refresh(self, key: str, fetch: FetchFn):
+        if any(task.get_name() == f"nutrients:{key}" for task in self._refresh_tasks):
+            return
+        task = asyncio.create_task(self._refresh(key, fetch), name=f"nutrients:{key}")
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+# Function to fetch all missing (and optionally expired) foods in batched Nutritionix queries
+async def build_table(names: Iterable[str], table: Dict[str, dict], fetch: FetchFn,
+                      max_age_seconds: Optional[float] = None, force: bool = False,
+                      batch_size: int = 20, concurrency: int = 2):
+    pending = [
+        name for name in dict.fromkeys(normalize_food_name(name) for name in names)
+        if force or name not in table or is_expired(table[name], max_age_seconds)
+    ]
+    print(f"Fetching nutrients for {len(pending)} foods ({len(table)} already stored)")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_batch(batch: List[str]):
+        async with semaphore:
+            try:
+                entries = await fetch_entries(batch, fetch)
+                table.update(entries)
+                print(f"✅ {len(entries)}/{len(batch)} foods: {', '.join(batch)}")
+            except Exception as e:
+                print(f"❌ {', '.join(batch)}: {e}")  # Keep the old entries (if any) and continue
+
+    await asyncio.gather(*(
+        fetch_batch(pending[start:start + batch_size]) for start in range(0, len(pending), batch_size)
+    ))
+    return table
+
+# Entry point of the offline job
+async def main():
+    parser = argparse.ArgumentParser(description="Pre-warm the local nutrient table for the dish vocabulary.")
+    parser.add_argument("--max-age-days", type=float, default=None, help="Refresh entries older than this")
+    parser.add_argument("--force", action="store_true", help="Refresh every entry")
+    parser.add_argument("--batch-size", type=int, default=20, help="Foods per Nutritionix query")
+    parser.add_argument("--concurrency", type=int, default=2, help="Number of parallel Nutritionix requests")
+    args = parser.parse_args()
+
+    max_age = args.max_age_days * 86400 if args.max_age_days is not None else None
+    table = load_table()
+    names = [dish_display_name(label) for label in load_vocabulary()]
+    try:
+        await build_table(names, table, fetch_nutrients, max_age, args.force, args.batch_size, args.concurrency)
+    finally:
+        await http_client.close()
+    # Merge into the file as stored on disk, the API may have added foods meanwhile
+    stored = update_table(table)
+    print(f"✅ Nutrient table stored in {NUTRIENT_TABLE_PATH} ({len(stored)} foods)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
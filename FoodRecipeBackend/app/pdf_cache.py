@@ -0,0 +1,123 @@
+# pdf_cache.py
+# This module caches rendered nutrition PDFs on disk, keyed by a hash of everything that goes into the
+# document (the nutrient values, the file name and the template version). Two users asking for "pizza"
+# get byte-identical PDFs, so the second request is served from disk without rendering, and both
+# PDFRecord rows point at the same shared file, e.g. pdf_cache/<key>/pizza_nutrition_details.pdf.
+# The key doubles as the HTTP ETag. The cache holds at most PDF_CACHE_MAX_MB; the least recently used
+# files are evicted (a hit refreshes the file's modification time). Each worker keeps a running total
+# of the cache size and only scans the folder when the total goes over the limit or is older than
+# PDF_CACHE_RESCAN_SECONDS (other workers write to the same folder).
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Any, Optional
+
+from . import file_store, metrics
+
+# Folder of the cached PDFs (relative to the working directory) and its size limit
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "pdf_cache")
+PDF_CACHE_MAX_MB = float(os.getenv("PDF_CACHE_MAX_MB", "200"))
+# Seconds after which the running size total is recounted from the folder
+PDF_CACHE_RESCAN_SECONDS = float(os.getenv("PDF_CACHE_RESCAN_SECONDS", "300"))
+
+class PDFCache:
+    def __init__(self, directory: str = PDF_CACHE_DIR, max_mb: float = PDF_CACHE_MAX_MB):
+        self.directory = directory.rstrip("/")
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._write_tasks = set()  # Background writes, kept referenced while running
+        self._size: Optional[int] = None  # Running size total in bytes (None until the first scan)
+        self._scanned_at = 0.0  # time.monotonic() of the last scan
+        self._size_lock = threading.Lock()
+
+    # Function to compute the cache key of a document from its payload (any JSON-serializable data)
+    @staticmethod
+    def key(payload: Any) -> str:
+        encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()
+        return hashlib.sha256(encoded).hexdigest()[:32]
+
+    # Function to get the shared path of a cached document (always with "/", it is stored in the database)
+    def path(self, key: str, filename: str) -> str:
+        return f"{self.directory}/{key}/{filename}"
+
+    # Function to tell whether a stored path (PDFRecord.file_path) points into the cache
+    def owns(self, path: str) -> bool:
+        parts = path.split("/")
+        return path.startswith(self.directory + "/") and len(parts) == len(self.directory.split("/")) + 2 and ".." not in parts
+
+    # Function to read a cached document by its shared path; None once it has been evicted
+    def read_path(self, path: str) -> Optional[bytes]:
+        key, filename = path.split("/")[-2:]
+        return self.get(key, filename)
+
+    # Function to read a cached document and mark it as recently used (blocking; runs in a worker thread)
+    def get(self, key: str, filename: str) -> Optional[bytes]:
+        path = self.path(key, filename)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            os.utime(path)
+            return content
+        except FileNotFoundError:
+            return None
+
+    # Function to store a document, then evict the least recently used ones when the cache may be over its
+    # size limit (each writer uses its own temporary file, two workers may store the same key at once)
+    def put(self, key: str, filename: str, content: bytes):
+        path = self.path(key, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_store.write_atomic(path, content)
+        with self._size_lock:
+            if self._size is not None:
+                self._size += len(content)
+            if self._size is None or self._size > self.max_bytes or time.monotonic() - self._scanned_at > PDF_CACHE_RESCAN_SECONDS:
+                self.evict()
+
+    # Function to delete the least recently used documents until the cache fits its size limit (scans the
+    # folder and resets the running size total)
+    def evict(self):
+        entries, total = [], 0
+        for key_dir in os.scandir(self.directory):
+            if not key_dir.is_dir():
+                continue
+            try:
+                files = [file for file in os.scandir(key_dir.path) if not file.name.endswith(file_store.TEMP_SUFFIX)]
+                for file in files:
+                    stat = file.stat()
+                    entries.append((stat.st_mtime, stat.st_size, key_dir.path))
+                    total += stat.st_size
+            except FileNotFoundError:
+                pass  # Evicted by another worker meanwhile
+        entries.sort()
+        for _, size, key_dir in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(key_dir, ignore_errors=True)
+            total -= size
+            metrics.increment("pdf_cache.evicted")
+        self._size, self._scanned_at = total, time.monotonic()
+
+    async def _put(self, key: str, filename: str, content: bytes):
+        try:
+            await asyncio.to_thread(self.put, key, filename, content)
+        except OSError as e:
+            print(f"Error caching PDF {key}: {str(e)}")
+
+    # Function to look up a document; None on a miss
+    async def lookup(self, key: str, filename: str) -> Optional[bytes]:
+        try:
+            content = await asyncio.to_thread(self.get, key, filename)
+        except OSError as e:
+            print(f"Error reading cached PDF {key}: {str(e)}")
+            content = None
+        metrics.increment("pdf_cache.hit" if content is not None else "pdf_cache.miss")
+        return content
+
+    # Function to store a freshly rendered document in the background; the response does not wait for it
+    def store_later(self, key: str, filename: str, content: bytes):
+        task = asyncio.create_task(self._put(key, filename, content))
+        self._write_tasks.add(task)
+        task.add_done_callback(self._write_tasks.discard)
@@ -0,0 +1,377 @@
+# pdf_reports.py
+# This module renders the nutrition and shopping list PDFs. Rendering is CPU-bound pure-Python work
+# (layout, compression and image encoding), so the API runs it in a pool of worker processes instead of
+# on the event loop: the render functions take plain data (nutrient dicts, formatted ingredient lines)
+# and return the PDF bytes.
+#
+# The reports are declared as layouts: lists of (block, options) pairs such as
+# ("title", {"text": "{title} Nutrition Details"}), drawn in order by the BLOCKS functions with the
+# document's data filled into the texts. Page headers and footers are layouts too (PageTemplate).
+# Each worker decodes the template images once when it starts (preload_assets) and every document
+# reuses the decoded images instead of opening and parsing the PNG files again.
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from fpdf import FPDF
+
+# Number of rendering processes (0 renders in a thread of the API process instead)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+
+# Version of the nutrition PDF layout; bump it whenever FOOD_LAYOUT, MEAL_LAYOUT or NUTRITION_PAGE
+# change so cached documents rendered with the old layout are not served any more (see pdf_cache.py)
+NUTRITION_PDF_TEMPLATE_VERSION = 1
+
+# Function to generate the full file path for a given image filename
+def get_image_path(filename):
+    base_dir = os.path.abspath(os.path.join(__file__, ".."))  # Get the parent directory of this file
+    image_dir = os.path.join(base_dir, "static", "images")      # Construct the path to the static/images directory
+    return os.path.join(image_dir, filename)                  # Return the complete path to the image
+
+# Define a mapping between nutritional categories and their corresponding image file paths
+category_images = {
+    "Calories": get_image_path("running_person.png"),
+    "Total Fat": get_image_path("bacon.png"),
+    "Protein": get_image_path("chicken_leg.png"),
+    "Carbohydrates": get_image_path("bread.png"),
+}
+# Define nutritional categories as tuples: (Display Name, API Response Key, Unit)
+categories = [
+    ("Calories", "nf_calories", "kcal"),
+    ("Total Fat", "nf_total_fat", "g"),
+    ("Protein", "nf_protein", "g"),
+    ("Carbohydrates", "nf_total_carbohydrate", "g"),
+]
+# Set dimensions for images used in the PDF (width and height)
+image_width = 12
+image_height = 12
+# Food picture of the nutrition PDF and shopping cart icon of the shopping list PDF
+food_image = os.path.join(os.path.abspath(os.path.join(__file__, "..")), "static", "food.png")
+shopping_cart_image = get_image_path("shopping_cart.png")
+# Every image the layouts use
+template_images = [*category_images.values(), food_image, shopping_cart_image]
+
+# Whether each template asset exists on disk (path -> bool), resolved once per process by preload_assets
+_assets = {}
+# Decoded template images (path -> fpdf image resource), shared by every document of the process
+_images = {}
+
+# Function to decode a PNG into an fpdf image resource; None when the installed fpdf cannot (fpdf2
+# keeps its own image cache and has no PNG parser of this form)
+def decode_image(path: str) -> Optional[dict]:
+    if not hasattr(FPDF, "_parsepng"):
+        return None
+    return FPDF()._parsepng(path)
+
+# Function to resolve and decode the template assets and load the fonts (runs once when a worker process starts)
+def preload_assets():
+    for path in template_images:
+        _assets[path] = os.path.exists(path)
+        if _assets[path] and path not in _images:
+            image = decode_image(path)
+            if image is not None:
+                _images[path] = image
+    # A throwaway document loads the core font metrics used by the templates
+    pdf = FPDF()
+    pdf.add_page()
+    for style in ("", "B", "I"):
+        pdf.set_font("Arial", style, 12)
+
+# Function to tell whether a template asset exists (checked on disk only once per process)
+def has_asset(path: str) -> bool:
+    if path not in _assets:
+        _assets[path] = os.path.exists(path)
+    return _assets[path]
+
+# Header and footer layouts drawn on every page of a document, and the bottom margin of its automatic page breaks
+class PageTemplate(NamedTuple):
+    header: list
+    footer: list
+    margin: float
+
+# ---------------------------
+# A document drawn from layouts: the page template's header and footer on every page, and the
+# preloaded template images instead of parsing the files again
+class TemplatePDF(FPDF):
+    def __init__(self, page_template: Optional[PageTemplate] = None):
+        super().__init__()
+        self.page_template = page_template
+
+    def header(self):
+        if self.page_template:
+            draw_layout(self, self.page_template.header, {"page": self.page_no()})
+
+    def footer(self):
+        if self.page_template:
+            draw_layout(self, self.page_template.footer, {"page": self.page_no()})
+
+    def image(self, name, *args, **kwargs):
+        # fpdf parses an image on its first use in a document; hand it a copy of the decoded resource
+        # (the copy gets this document's image number, and fpdf drops its data once written)
+        if name in _images and name not in self.images:
+            resource = dict(_images[name])
+            resource["i"] = len(self.images) + 1
+            self.images[name] = resource
+            if "smask" in resource and self.pdf_version < "1.4":
+                self.pdf_version = "1.4"  # Alpha channels need PDF 1.4, as when fpdf parses the file itself
+        return super().image(name, *args, **kwargs)
+
+# Helper function to get the bytes of a PDF rendered in memory (fpdf returns a str, fpdf2 a bytearray)
+def pdf_bytes(pdf: FPDF) -> bytes:
+    content = pdf.output(dest="S")
+    return content.encode("latin-1") if isinstance(content, str) else bytes(content)
+
+# Helper function to draw the table of nutritional values of one food (or meal totals) with alternating row colors
+def draw_nutrient_rows(pdf: FPDF, food: dict):
+    row_color = False
+    for category, key, unit in categories:
+        value = food.get(key, "N/A")  # Get the nutritional value or use "N/A" if not available
+        image_path = category_images.get(category, "")  # Get the corresponding image for the category
+        x = pdf.get_x()
+        y = pdf.get_y()
+        fill_color = (245, 245, 245) if row_color else (255, 255, 255)  # Alternate row colors
+        pdf.set_fill_color(*fill_color)
+        # Create a cell for the category icon
+        pdf.cell(image_width, 12, "", border=1, fill=True)
+        if image_path and has_asset(image_path):
+            pdf.image(image_path, x + 1, y + 1, image_width - 2, image_height - 2)
+        pdf.set_x(x + image_width)
+        # Create a cell for the category name
+        pdf.cell(80, 12, category, border=1, fill=True)
+        # Create a cell for the nutritional value, right-aligned
+        pdf.cell(50, 12, f"{value} {unit}", border=1, align="R", fill=True)
+        pdf.ln(12)
+        row_color = not row_color  # Toggle row color for next row
+
+# Helper function to add up the nutritional values of several foods per category (missing values count as 0)
+def meal_totals(foods: List[dict]) -> dict:
+    return {
+        key: round(sum(food.get(key) or 0 for food in foods), 1)
+        for _, key, _ in categories
+    }
+
+# ---------------------------
+# Layout blocks. Each function draws one block from the document's data; "text" options are templates
+# such as "Food: {food_name}" filled from the data, "field" options name a data entry.
+
+# Block: full-width blue band with a centered text, at the top of the page or `bottom` units from its end
+def draw_band(pdf: FPDF, data: dict, text: str, height: float, text_height: float, style: str, size: int, bottom: bool = False):
+    if bottom:
+        pdf.set_y(-height)
+    pdf.set_fill_color(0, 102, 204)
+    pdf.rect(0, pdf.h - height if bottom else 0, pdf.w, height, 'F')
+    pdf.set_font("Arial", style, size)
+    pdf.set_text_color(255, 255, 255)
+    if bottom:
+        pdf.cell(0, text_height, text.format_map(data), align="C")
+    else:
+        pdf.cell(0, text_height, text.format_map(data), align="C", ln=True)
+        pdf.ln(5)
+    pdf.set_text_color(0, 0, 0)  # Reset text color to black for subsequent text
+
+# Block: centered document title, on a grey background unless fill is off
+def draw_title(pdf: FPDF, data: dict, text: str, height: float = 12, fill: bool = True, space: float = 8):
+    if fill:
+        pdf.set_fill_color(230, 230, 230)
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(0, height, text.format_map(data), ln=True, align="C", fill=fill)
+    pdf.ln(space)
+
+# Block: grey full-width banner, e.g. above the meal totals
+def draw_banner(pdf: FPDF, data: dict, text: str):
+    pdf.set_fill_color(230, 230, 230)
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(0, 12, text.format_map(data), ln=True, fill=True)
+
+# Block: bordered section heading followed by normal text
+def draw_section(pdf: FPDF, data: dict, text: str):
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(0, 10, text.format_map(data), ln=True, border=1)
+    pdf.set_font("Arial", "", 12)
+    pdf.ln(2)
+
+# Block: bold line of text
+def draw_heading(pdf: FPDF, data: dict, text: str):
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 10, text.format_map(data), ln=True)
+
+# Block: one line per entry of a list of strings
+def draw_lines(pdf: FPDF, data: dict, field: str):
+    for line in data[field]:
+        pdf.cell(0, 8, line, ln=True)
+
+# Block: italic note, skipped when its field is empty
+def draw_note(pdf: FPDF, data: dict, text: str, field: str):
+    if data[field]:
+        pdf.ln(5)
+        pdf.set_font("Arial", "I", 10)
+        pdf.multi_cell(0, 8, text.format_map(data))
+
+# Block: picture on the left with the following text to its right (skipped when the file is missing)
+def draw_picture(pdf: FPDF, data: dict, image: str, width: float = 30):
+    if has_asset(image):
+        pdf.image(image, x=10, y=pdf.get_y(), w=width)
+        pdf.set_xy(10 + width + 5, pdf.get_y() + 5)
+
+# Block: image at a fixed position (skipped when the file is missing)
+def draw_image(pdf: FPDF, data: dict, image: str, x: float, y: float, w: float, h: float):
+    if has_asset(image):
+        pdf.image(image, x=x, y=y, w=w, h=h)
+
+def draw_font(pdf: FPDF, data: dict, style: str = "", size: int = 12):
+    pdf.set_font("Arial", style, size)
+
+def draw_space(pdf: FPDF, data: dict, height: float):
+    pdf.ln(height)
+
+def draw_nutrients(pdf: FPDF, data: dict, field: str):
+    draw_nutrient_rows(pdf, data[field])
+
+# Block: draw a nested layout once per entry of a list of dicts (each entry is that layout's data)
+def draw_each(pdf: FPDF, data: dict, field: str, layout: list):
+    for entry in data[field]:
+        draw_layout(pdf, layout, entry)
+
+BLOCKS = {
+    "band": draw_band,
+    "title": draw_title,
+    "banner": draw_banner,
+    "section": draw_section,
+    "heading": draw_heading,
+    "lines": draw_lines,
+    "note": draw_note,
+    "picture": draw_picture,
+    "image": draw_image,
+    "font": draw_font,
+    "space": draw_space,
+    "nutrients": draw_nutrients,
+    "each": draw_each,
+}
+
+# Function to draw a layout's blocks in order
+def draw_layout(pdf: FPDF, layout: list, data: dict):
+    for block, options in layout:
+        BLOCKS[block](pdf, data, **options)
+
+# Function to render a document from a layout, with the page template's header and footer if given (returns the PDF bytes)
+def render_layout(layout: list, data: dict, page_template: Optional[PageTemplate] = None) -> bytes:
+    pdf = TemplatePDF(page_template)
+    pdf.add_page()
+    if page_template:
+        pdf.set_auto_page_break(auto=True, margin=page_template.margin)
+    draw_layout(pdf, layout, data)
+    return pdf_bytes(pdf)  # Render the PDF in memory
+
+# ---------------------------
+# Report layouts
+
+# Blue header and page-numbered footer of the nutrition reports
+NUTRITION_PAGE = PageTemplate(
+    header=[("band", {"text": "Nutrition Details", "height": 30, "text_height": 15, "style": "B", "size": 20})],
+    footer=[("band", {"text": "Page {page}", "height": 20, "text_height": 10, "style": "I", "size": 10, "bottom": True})],
+    margin=15,
+)
+
+# Nutrition details of one food (data: title, food_name, food)
+FOOD_LAYOUT = [
+    ("title", {"text": "{title} Nutrition Details"}),
+    ("picture", {"image": food_image}),
+    ("heading", {"text": "Food: {food_name}"}),
+    ("space", {"height": 5}),
+    ("nutrients", {"field": "food"}),
+]
+
+# Nutrition details of a meal (data: foods as food_name/serving/food entries, totals, not_found)
+MEAL_LAYOUT = [
+    ("title", {"text": "Meal Nutrition Details"}),
+    ("each", {"field": "foods", "layout": [
+        ("heading", {"text": "Food: {food_name}{serving}"}),
+        ("nutrients", {"field": "food"}),
+        ("space", {"height": 5}),
+    ]}),
+    ("banner", {"text": "Meal Totals"}),
+    ("font", {"style": "B", "size": 12}),
+    ("nutrients", {"field": "totals"}),
+    ("note", {"text": "Not found: {not_found}", "field": "not_found"}),
+]
+
+# Grocery shopping list (data: recipes and items as formatted lines)
+SHOPPING_LIST_LAYOUT = [
+    ("font", {"size": 12}),
+    ("title", {"text": "Grocery Shopping List", "height": 10, "fill": False, "space": 5}),
+    ("image", {"image": shopping_cart_image, "x": 95, "y": 20, "w": 10, "h": 10}),
+    ("space", {"height": 15}),
+    ("section", {"text": "Recipes"}),
+    ("lines", {"field": "recipes"}),
+    ("space", {"height": 5}),
+    ("section", {"text": "Ingredients"}),
+    ("lines", {"field": "items"}),
+    ("space", {"height": 5}),
+]
+
+# Function to render the nutrition details PDF of one food (returns the PDF bytes)
+def render_food_pdf(food_item: str, food: dict) -> bytes:
+    data = {"title": food_item.title(), "food_name": food["food_name"].title(), "food": food}
+    return render_layout(FOOD_LAYOUT, data, NUTRITION_PAGE)
+
+# Function to render one nutrition details PDF for a whole meal: every food plus the meal totals
+def render_meal_pdf(found: List[tuple], not_found: List[str]) -> bytes:
+    foods = [
+        {
+            "food_name": food["food_name"].title(),
+            "serving": f" ({food['serving_qty']} {food['serving_unit']})" if "serving_qty" in food and "serving_unit" in food else "",
+            "food": food,
+        }
+        for _, food in found
+    ]
+    data = {"foods": foods, "totals": meal_totals([food for _, food in found]), "not_found": ", ".join(not_found)}
+    return render_layout(MEAL_LAYOUT, data, NUTRITION_PAGE)
+
+# Function to render the grocery shopping list PDF from the selected recipes and the aggregated
+# ingredients, given as (formatted line, recipes that need it) pairs
+def render_shopping_list_pdf(recipes: List[str], items: List[Tuple[str, List[str]]]) -> bytes:
+    lines = []
+    for text, item_recipes in items:
+        line = f"- {text}"
+        if len(recipes) > 1 and item_recipes:
+            line += f" ({', '.join(recipe.title() for recipe in item_recipes)})"
+        lines.append(line)
+    data = {"recipes": [f"- {recipe.title()}" for recipe in recipes], "items": lines}
+    return render_layout(SHOPPING_LIST_LAYOUT, data)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+# Function to start the rendering processes (called from the app's startup event). "spawn" starts clean
+# interpreters that import only this module, not the API with its threads, models and connections.
+def start():
+    global _executor
+    if _executor is None and PDF_WORKERS > 0:
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"), initializer=preload_assets
+        )
+
+# Function to start every rendering process now (each preloads its assets) instead of on the first PDFs
+async def warm_up():
+    start()
+    if _executor is None:
+        await asyncio.to_thread(preload_assets)
+        return
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(_executor, has_asset, food_image) for _ in range(PDF_WORKERS)))
+
+# Function to render a PDF in a worker process: `render_fn` is one of the render_* functions above and
+# `args` its plain-data arguments; returns the PDF bytes
+async def render(render_fn: Callable[..., bytes], *args) -> bytes:
+    start()
+    if _executor is None:
+        return await asyncio.to_thread(render_fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(_executor, render_fn, *args)
+
+# Function to stop the rendering processes (called from the app's shutdown event)
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,192 @@
+# pdf_storage.py
+# This module keeps optional persisted copies of generated PDFs. PDFs are rendered in memory and sent
+# straight to the client; when PDF_PERSIST is on, a copy is written in the background through an
+# artifact storage backend to a per-user, content-addressed path such as
+# generated_pdfs/<user id>/<content hash>/shopping_list.pdf. Concurrent users therefore never overwrite
+# each other's files, and identical PDFs of one user share one file. The path is stored in
+# PDFRecord.file_path (keeping the "_nutrition_details.pdf" / "shopping_list.pdf" file names the history
+# pages look for) and GET /pdfs/{record_id} reads it back. Nutrition reports are the same for every
+# user, so they are kept once in the shared PDF cache instead (see pdf_cache.py).
+#
+# Storage stays bounded by two policies: each user keeps at most PDF_QUOTA_MB (the oldest files go
+# first, checked after every write), and files untouched for PDF_RETENTION_DAYS expire. Expired and
+# unreferenced files are deleted by the background garbage collector (see artifact_gc.py).
+import asyncio
+import hashlib
+import os
+import re
+import time
+from typing import List, NamedTuple, Optional
+
+from . import file_store
+
+# Storage backend (a key of STORAGE_BACKENDS) and its folder (relative to the working directory)
+PDF_STORAGE_BACKEND = os.getenv("PDF_STORAGE_BACKEND", "local")
+PDF_STORAGE_DIR = os.getenv("PDF_STORAGE_DIR", "generated_pdfs")
+# Whether copies are written at all
+PDF_PERSIST = os.getenv("PDF_PERSIST", "1") == "1"
+# Stored PDFs per user (0 for no limit) and days a file is kept after it was last written
+PDF_QUOTA_MB = float(os.getenv("PDF_QUOTA_MB", "50"))
+PDF_RETENTION_DAYS = float(os.getenv("PDF_RETENTION_DAYS", "30"))
+
+# Background writes, kept referenced while running
+_write_tasks = set()
+
+# Function to turn user input such as "chicken/../breast" into a safe file name part ("chicken_.._breast")
+def safe_filename(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name.strip()).strip(".") or "document"
+
+# Function to get the content hash used in artifact paths
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()[:16]
+
+# One stored file: its path, size in bytes and last write time (seconds since the epoch)
+class Artifact(NamedTuple):
+    path: str
+    size: int
+    modified: float
+
+class ArtifactStorage:
+    """Interface of an artifact storage backend. Artifacts are addressed by their path, as stored in
+    PDFRecord.file_path; the methods are blocking and run in worker threads."""
+
+    # Function to build the per-user, content-addressed path of an artifact
+    def path(self, user_id: int, filename: str, content: bytes) -> str:
+        raise NotImplementedError
+
+    # Function to tell whether a stored path belongs to this backend
+    def owns(self, path: str) -> bool:
+        raise NotImplementedError
+
+    # Function to store an artifact (refreshing its write time when the same content is already stored)
+    def write(self, path: str, content: bytes):
+        raise NotImplementedError
+
+    # Function to read an artifact; None when it does not exist (any more)
+    def read(self, path: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def delete(self, path: str):
+        raise NotImplementedError
+
+    # Function to list the users that have stored artifacts
+    def users(self) -> List[str]:
+        raise NotImplementedError
+
+    # Function to list the stored artifacts of one user
+    def artifacts(self, user: str) -> List[Artifact]:
+        raise NotImplementedError
+
+    # Function to delete a user's oldest artifacts until they fit the quota; returns the deleted ones
+    def enforce_quota(self, user: str, quota_mb: float = PDF_QUOTA_MB) -> List[Artifact]:
+        if quota_mb <= 0:
+            return []
+        limit = int(quota_mb * 1024 * 1024)
+        used, deleted = 0, []
+        # Newest first: keep files while they fit and delete the older ones (the newest file is always kept)
+        newest_first = sorted(self.artifacts(user), key=lambda artifact: artifact.modified, reverse=True)
+        for position, artifact in enumerate(newest_first):
+            used += artifact.size
+            if position > 0 and used > limit:
+                self.delete(artifact.path)
+                deleted.append(artifact)
+        return deleted
+
+    # Function to tell whether an artifact is older than the retention period
+    def expired(self, artifact: Artifact, retention_days: float = PDF_RETENTION_DAYS) -> bool:
+        return retention_days > 0 and time.time() - artifact.modified > retention_days * 86400
+
+# Artifacts as files on the local disk: <directory>/<user id>/<content hash>/<file name>
+class LocalArtifactStorage(ArtifactStorage):
+    def __init__(self, directory: str = PDF_STORAGE_DIR):
+        self.directory = directory.rstrip("/")
+
+    # Paths always use "/", they are stored in the database
+    def path(self, user_id: int, filename: str, content: bytes) -> str:
+        return "/".join([self.directory, str(user_id), content_hash(content), safe_filename(filename)])
+
+    def owns(self, path: str) -> bool:
+        return path.startswith(self.directory + "/") and ".." not in path.split("/")
+
+    # Write the file atomically through a temporary file of its own; an existing file already has this
+    # content, so only its time is refreshed
+    def write(self, path: str, content: bytes):
+        if os.path.exists(path):
+            os.utime(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_store.write_atomic(path, content)
+
+    def read(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    # Delete the file, then its content hash and user folders once they are empty
+    def delete(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.rmdir(os.path.dirname(path))
+            os.rmdir(os.path.dirname(os.path.dirname(path)))
+        except OSError:
+            pass  # Still holds other files
+
+    def users(self) -> List[str]:
+        try:
+            return [entry.name for entry in os.scandir(self.directory) if entry.is_dir()]
+        except FileNotFoundError:
+            return []
+
+    def artifacts(self, user: str) -> List[Artifact]:
+        found = []
+        try:
+            hash_dirs = [entry.path for entry in os.scandir(f"{self.directory}/{user}") if entry.is_dir()]
+        except FileNotFoundError:
+            return found
+        for hash_dir in hash_dirs:
+            try:
+                for file in os.scandir(hash_dir):
+                    if file.name.endswith(file_store.TEMP_SUFFIX):
+                        continue  # Write in progress
+                    stat = file.stat()
+                    found.append(Artifact(f"{self.directory}/{user}/{os.path.basename(hash_dir)}/{file.name}", stat.st_size, stat.st_mtime))
+            except FileNotFoundError:
+                pass  # Deleted meanwhile
+        return found
+
+# Available storage backends by name (PDF_STORAGE_BACKEND)
+STORAGE_BACKENDS = {
+    "local": LocalArtifactStorage,
+}
+
+# The storage backend used by the API
+storage: ArtifactStorage = STORAGE_BACKENDS[PDF_STORAGE_BACKEND]()
+
+# Function to build the per-user, content-addressed path of a PDF
+def artifact_path(user_id: int, filename: str, content: bytes) -> str:
+    return storage.path(user_id, filename, content)
+
+# Function to store a PDF, then keep the user within the quota (blocking; runs in a worker thread)
+def write_artifact(user_id: int, path: str, content: bytes):
+    storage.write(path, content)
+    for artifact in storage.enforce_quota(str(user_id)):
+        print(f"Deleted {artifact.path}: user {user_id} is over the PDF quota")
+
+async def _write(user_id: int, path: str, content: bytes):
+    try:
+        await asyncio.to_thread(write_artifact, user_id, path, content)
+    except OSError as e:
+        print(f"Error persisting PDF {path}: {str(e)}")
+
+# Function to persist a PDF in the background (no-op when PDF_PERSIST is off); the response does not wait for it
+def persist_later(user_id: int, path: str, content: bytes):
+    if not PDF_PERSIST:
+        return
+    task = asyncio.create_task(_write(user_id, path, content))
+    _write_tasks.add(task)
+    task.add_done_callback(_write_tasks.discard)
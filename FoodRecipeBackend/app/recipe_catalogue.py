@@ -0,0 +1,169 @@
+# recipe_catalogue.py
+# This module keeps a precomputed, structured recipe for every dish the image recognizer can return
+# (the labels in recipe_names.txt). The catalogue is generated offline and stored as JSON, so
+# /upload-image/ can answer with a local lookup instead of a live GPT-4 call. API workers and this job
+# merge their entries into the file under a file lock, and each worker reloads the file when it changed.
+#
+# Run it as a job from the FoodRecipeBackend folder (e.g. nightly from cron):
+#   python -m app.recipe_catalogue                    # fill in missing dishes
+#   python -m app.recipe_catalogue --max-age-days 30  # also regenerate entries older than 30 days
+#   python -m app.recipe_catalogue --force            # regenerate everything
+import argparse
+import asyncio
+import functools
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+from dotenv import load_dotenv
+
+# Load .env before importing llm.py, which reads its settings at import time
+load_dotenv()
+
+from . import file_store, llm
+from .vocabulary import dish_display_name, load_vocabulary
+
+# Path of the stored catalogue (relative to the working directory, like food_embeddings.npy)
+CATALOGUE_PATH = os.getenv("RECIPE_CATALOGUE_PATH", "recipe_catalogue.json")
+# Seconds between two checks whether another process rewrote the catalogue file
+CATALOGUE_RELOAD_SECONDS = float(os.getenv("RECIPE_CATALOGUE_RELOAD_SECONDS", "5"))
+
+# JSON schema for one structured recipe returned by OpenAI
+RECIPE_SCHEMA = {
+    "name": "recipe",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "servings": {"type": "integer"},
+            "prep_time": {"type": "string"},
+            "cook_time": {"type": "string"},
+            "ingredients": {"type": "array", "items": {"type": "string"}},
+            "steps": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["title", "servings", "prep_time", "cook_time", "ingredients", "steps"],
+        "additionalProperties": False,
+    },
+}
+
+# Type of the completion function used to talk to OpenAI: (messages, **kwargs) -> text
+# (normally llm.complete_task bound to the "catalogue" route)
+CompleteFn = Callable[..., Awaitable[str]]
+
+# Function to load the stored catalogue (an empty catalogue is returned if the file does not exist yet or
+# is unreadable, so a damaged file does not keep the API from starting; the next save replaces it)
+def load_catalogue(path: str = CATALOGUE_PATH) -> Dict[str, dict]:
+    return file_store.load_json(path)
+
+# Function to save the catalogue atomically so that readers never see a half-written file
+def save_catalogue(catalogue: Dict[str, dict], path: str = CATALOGUE_PATH):
+    file_store.save_json(catalogue, path)
+
+# Function to merge entries into the catalogue as stored on disk, under the catalogue's file lock, so
+# workers and the offline job do not lose each other's dishes. Returns the merged catalogue.
+def update_catalogue(entries: Dict[str, dict], path: str = CATALOGUE_PATH) -> Dict[str, dict]:
+    return file_store.update_json(entries, path)
+
+class StoredCatalogue:
+    """The catalogue as served by one API worker. The file is read again when it changed on disk (checked at
+    most every CATALOGUE_RELOAD_SECONDS), so dishes stored by other workers or the offline job show up."""
+
+    def __init__(self, path: str = CATALOGUE_PATH, reload_seconds: float = CATALOGUE_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.stamp = file_store.file_stamp(path)
+        self.entries = load_catalogue(path)
+        self.checked_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    # Function to reload the file if another process rewrote it since it was read
+    def reload_if_changed(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.reload_seconds:
+            return
+        self.checked_at = now
+        stamp = file_store.file_stamp(self.path)
+        if stamp != self.stamp:
+            self.stamp = stamp
+            self.entries = load_catalogue(self.path)
+
+    def get(self, label: str, default: Optional[dict] = None) -> Optional[dict]:
+        self.reload_if_changed()
+        return self.entries.get(label, default)
+
+    # Function to store one entry in memory and merge it into the file (blocking; runs in a worker thread)
+    def store(self, label: str, entry: dict):
+        self.entries[label] = entry
+        self.entries = update_catalogue({label: entry}, self.path)
+        self.stamp = file_store.file_stamp(self.path)
+
+# Function to check whether a catalogue entry is older than the allowed age
+def is_stale(entry: dict, max_age_seconds: Optional[float]) -> bool:
+    if max_age_seconds is None:
+        return False
+    return time.time() - entry.get("generated_at", 0) > max_age_seconds
+
+# Function to render a structured recipe as the plain text the frontend displays
+def format_recipe(entry: dict) -> str:
+    lines = [entry["title"], ""]
+    lines.append(f"Servings: {entry['servings']} | Prep time: {entry['prep_time']} | Cook time: {entry['cook_time']}")
+    lines += ["", "Ingredients:"] + [f"- {ingredient}" for ingredient in entry["ingredients"]]
+    lines += ["", "Instructions:"] + [f"{number}. {step}" for number, step in enumerate(entry["steps"], start=1)]
+    return "\n".join(lines)
+
+# Function to generate one structured catalogue entry for a recognition label
+async def generate_recipe_entry(complete: CompleteFn, label: str) -> dict:
+    messages = [
+        {"role": "system", "content": "You are an expert chef AI that generates detailed food recipes."},
+        {"role": "user", "content": f"Generate a detailed recipe for {dish_display_name(label)}."}
+    ]
+    # The "catalogue" route uses a model that supports structured outputs (response_format json_schema)
+    content = await complete(messages, response_format={"type": "json_schema", "json_schema": RECIPE_SCHEMA})
+    entry = json.loads(content)
+    entry["generated_at"] = time.time()  # Used to decide when the entry needs a refresh
+    return entry
+
+# Function to generate all missing (and optionally stale) entries with limited concurrency
+async def build_catalogue(complete: CompleteFn, labels: Iterable[str], catalogue: Dict[str, dict],
+                          max_age_seconds: Optional[float] = None, force: bool = False, concurrency: int = 4):
+    pending = [
+        label for label in labels
+        if force or label not in catalogue or is_stale(catalogue[label], max_age_seconds)
+    ]
+    print(f"Generating {len(pending)} recipes ({len(catalogue)} already stored)")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate(label: str):
+        async with semaphore:
+            try:
+                catalogue[label] = await generate_recipe_entry(complete, label)
+                print(f"✅ {label}")
+            except Exception as e:
+                print(f"❌ {label}: {e}")  # Keep the old entry (if any) and continue with the others
+
+    await asyncio.gather(*(generate(label) for label in pending))
+    return catalogue
+
+# Entry point of the offline job
+async def main():
+    parser = argparse.ArgumentParser(description="Generate the precomputed recipe catalogue.")
+    parser.add_argument("--max-age-days", type=float, default=None, help="Regenerate entries older than this")
+    parser.add_argument("--force", action="store_true", help="Regenerate every entry")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of parallel OpenAI requests")
+    args = parser.parse_args()
+
+    # Use the same OpenAI gateway (routing table, rate limits, retries) as the API
+    complete = functools.partial(llm.complete_task, "catalogue", priority=llm.PRIORITY_BACKGROUND)
+    max_age = args.max_age_days * 86400 if args.max_age_days is not None else None
+    catalogue = load_catalogue()
+    await build_catalogue(complete, load_vocabulary(), catalogue, max_age, args.force, args.concurrency)
+    # Merge into the file as stored on disk, the API may have added dishes meanwhile
+    stored = update_catalogue(catalogue)
+    print(f"✅ Recipe catalogue stored in {CATALOGUE_PATH} ({len(stored)} recipes)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+# recipe_sections.py
+# This module generates full-length recipes by asking OpenAI for the ingredients, the steps and the
+# timing/nutrition notes as three concurrent completions and assembling them into one structured recipe.
+# A long recipe then arrives at the latency of the longest section instead of the sum of all three.
+# When the ingredients are already known (e.g. from the recipe catalogue) that section is not requested.
+import asyncio
+import re
+from typing import List, Optional
+
+from . import llm
+
+# System prompt shared by all sections
+SECTION_SYSTEM_PROMPT = "You are an expert chef AI that writes one section of a detailed recipe. Reply with the section only."
+
+# Section name -> (routing table task, user prompt template)
+SECTION_PROMPTS = {
+    "ingredients": ("recipe_ingredients", "List every ingredient with its quantity for {dish}. One ingredient per line."),
+    "steps": ("recipe_steps", "Write the complete preparation and cooking steps for {dish}. One step per line."),
+    "notes": ("recipe_notes", "For {dish}, give the prep time, cook time, servings and approximate nutrition per serving. One fact per line."),
+}
+
+# Function to split a section reply into clean lines (bullets, numbering and headings removed)
+def parse_section_lines(text: str) -> List[str]:
+    lines = []
+    for line in text.splitlines():
+        line = re.sub(r"^\s*(?:[-*•]|\d+[.)]|step\s+\d+[:.)]?)\s*", "", line, flags=re.IGNORECASE).strip()
+        if line and not line.endswith(":"):
+            lines.append(line)
+    return lines
+
+# Function to request one section of the recipe
+async def generate_section(section: str, dish: str, priority: int, extra: str = "") -> List[str]:
+    task, template = SECTION_PROMPTS[section]
+    messages = [
+        {"role": "system", "content": SECTION_SYSTEM_PROMPT},
+        {"role": "user", "content": template.format(dish=dish) + extra},
+    ]
+    return parse_section_lines(await llm.complete_task(task, messages, priority=priority))
+
+# Function to generate all sections concurrently and assemble them into one structured recipe
+async def generate_sectioned_recipe(dish: str, stored_ingredients: Optional[List[str]] = None,
+                                    priority: int = llm.PRIORITY_INTERACTIVE) -> dict:
+    steps_hint = ""
+    if stored_ingredients:
+        # Known ingredients make the steps consistent with them, and save one completion
+        steps_hint = " Use these ingredients: " + "; ".join(stored_ingredients)
+        ingredients_call = asyncio.sleep(0, result=list(stored_ingredients))
+    else:
+        ingredients_call = generate_section("ingredients", dish, priority)
+    ingredients, steps, notes = await asyncio.gather(
+        ingredients_call,
+        generate_section("steps", dish, priority, steps_hint),
+        generate_section("notes", dish, priority),
+    )
+    return {"title": dish.title(), "ingredients": ingredients, "steps": steps, "notes": notes}
+
+# Function to render a sectioned recipe as the plain text the frontend displays
+def format_sectioned_recipe(recipe: dict) -> str:
+    lines = [recipe["title"], "", "Ingredients:"] + [f"- {item}" for item in recipe["ingredients"]]
+    lines += ["", "Instructions:"] + [f"{number}. {step}" for number, step in enumerate(recipe["steps"], start=1)]
+    lines += ["", "Timing & Nutrition:"] + [f"- {note}" for note in recipe["notes"]]
+    return "\n".join(lines)
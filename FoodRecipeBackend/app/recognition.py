@@ -0,0 +1,203 @@
+# recognition.py
+# This module owns the dish recognition stack: the CLIP ViT-B/32 image encoder, the FAISS index of
+# stored food embeddings and their dish names. Importing it is cheap; torch, clip and faiss are only
+# imported when the models are loaded, either by a background warm-up started with the app or on first
+# use. Until then the rest of the API (login, recipes, PDFs, history) is served normally and /ready
+# reports the recognition state.
+import asyncio
+import io
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import Executor, Future
+from typing import List, Optional
+
+from . import metrics
+from .vocabulary import RECIPE_NAMES_PATH
+
+# Stored image embeddings (one row per line of recipe_names.txt)
+EMBEDDINGS_PATH = os.getenv("FOOD_EMBEDDINGS_PATH", "food_embeddings.npy")
+# CLIP model variant and device used for inference
+CLIP_MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "ViT-B/32")
+DEVICE = "cpu"
+# "background" loads the models right after startup, "lazy" waits for the first image upload
+WARMUP_MODE = os.getenv("RECOGNITION_WARMUP", "background")
+# Batch sizes run through CLIP with a synthetic image before the models are reported ready
+WARMUP_BATCH_SIZES = [int(size) for size in os.getenv("RECOGNITION_WARMUP_BATCH_SIZES", "1").split(",") if size.strip()]
+# Seconds before a failed load may be retried; doubles after every further failure up to the maximum
+RETRY_SECONDS = float(os.getenv("RECOGNITION_RETRY_SECONDS", "10"))
+RETRY_MAX_SECONDS = float(os.getenv("RECOGNITION_RETRY_MAX_SECONDS", "300"))
+
+# Loading states reported on /health and /ready
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+WARMING_UP = "warming_up"
+READY = "ready"
+FAILED = "failed"
+
+state = NOT_LOADED
+error: Optional[str] = None
+load_seconds: Optional[float] = None
+failures = 0  # Failed loads in a row
+failed_at: Optional[float] = None  # time.monotonic() of the last failed load
+_model = None
+_preprocess = None
+_index = None
+_recipe_names = []
+_lock = threading.Lock()
+_warm_up: Optional[Future] = None
+_retry_task: Optional[asyncio.Task] = None
+warm_up_timings = {}  # Warm-up step -> seconds, reported on /health
+
+# Function to load CLIP, the stored embeddings and the dish names, then warm them up (blocking; runs in
+# a worker thread). `batch_sizes` overrides RECOGNITION_WARMUP_BATCH_SIZES.
+def load(batch_sizes: Optional[List[int]] = None):
+    global state, error, load_seconds, failures, failed_at, _model, _preprocess, _index, _recipe_names
+    with _lock:
+        if state == READY:
+            return
+        state = LOADING
+        started = time.perf_counter()
+        try:
+            import clip
+            import faiss
+            import numpy as np
+
+            step = time.perf_counter()
+            model, preprocess = clip.load(CLIP_MODEL_NAME, device=DEVICE)
+            model.eval()
+            metrics.observe("recognition.load.clip", time.perf_counter() - step)
+
+            step = time.perf_counter()
+            stored_embeddings = np.load(EMBEDDINGS_PATH).astype("float32")
+            index = faiss.IndexFlatL2(stored_embeddings.shape[1])
+            index.add(stored_embeddings)
+            with open(RECIPE_NAMES_PATH, "r") as f:
+                recipe_names = f.read().splitlines()
+            metrics.observe("recognition.load.index", time.perf_counter() - step)
+        except FileNotFoundError as e:
+            state, error = FAILED, f"No stored embeddings found, please generate them first ({e.filename})."
+            failures, failed_at = failures + 1, time.monotonic()
+            print(error)
+            return
+        except Exception as e:
+            state, error = FAILED, str(e)
+            failures, failed_at = failures + 1, time.monotonic()
+            print(f"Error loading the recognition models: {error}")
+            traceback.print_exc()
+            return
+        _model, _preprocess, _index, _recipe_names = model, preprocess, index, recipe_names
+        state = WARMING_UP
+        try:
+            warm_up(batch_sizes or WARMUP_BATCH_SIZES)
+        except Exception as e:
+            print(f"Recognition warm-up failed, serving without it: {str(e)}")
+        load_seconds = time.perf_counter() - started
+        state, error, failures = READY, None, 0
+        print(f"Recognition models loaded in {load_seconds:.2f} seconds ({index.ntotal} stored embeddings)")
+
+# Function to run synthetic encodes at each batch size and a dummy search, so the first real upload does
+# not pay for lazy kernel initialization, allocator growth and first-touch page faults of the index
+def warm_up(batch_sizes: List[int]):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (224, 224), color=(200, 120, 60)).save(buffer, format="PNG")
+    image_bytes = buffer.getvalue()
+    embedding = None
+    for size in sorted(set(batch_sizes)):
+        step = time.perf_counter()
+        embedding = _encode([image_bytes] * size)[:1]
+        warm_up_timings[f"encode_batch_{size}"] = time.perf_counter() - step
+    step = time.perf_counter()
+    _index.search(embedding if embedding is not None else _encode([image_bytes]), 1)
+    warm_up_timings["search"] = time.perf_counter() - step
+    for name, seconds in warm_up_timings.items():
+        metrics.observe(f"recognition.warmup.{name}", seconds)
+    print("Recognition warm-up: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in warm_up_timings.items()))
+
+# Seconds until a failed load may be retried (0 when it may be retried now or has not failed)
+def retry_after() -> float:
+    if state != FAILED or failed_at is None:
+        return 0.0
+    backoff = min(RETRY_MAX_SECONDS, RETRY_SECONDS * 2 ** (failures - 1))
+    return max(0.0, failed_at + backoff - time.monotonic())
+
+# Function to start loading the models in the given executor (once; later calls return the same future).
+# After a failed load, e.g. a transient file or GPU error, the next call once the backoff has passed
+# starts another attempt.
+def start_warm_up(executor: Executor) -> Optional[Future]:
+    global _warm_up
+    retry = state == FAILED and _warm_up is not None and _warm_up.done() and retry_after() == 0
+    if (_warm_up is None and state == NOT_LOADED) or retry:
+        if retry:
+            print(f"Retrying to load the recognition models (attempt {failures + 1})")
+        _warm_up = executor.submit(load)
+    return _warm_up
+
+# Background loop that retries a failed load once its backoff has passed. /ready answers 503 while the
+# models are not loaded, so a load balancer sends this instance no uploads that could trigger the retry.
+async def retry_failed_loads(executor: Executor, poll_seconds: float = 1.0):
+    while True:
+        await asyncio.sleep(max(poll_seconds, retry_after()))
+        if state == FAILED:
+            future = start_warm_up(executor)
+            if future is not None:
+                await asyncio.wrap_future(future)
+
+# Function to start the retry loop (called from the app's startup event)
+def start_retries(executor: Executor):
+    global _retry_task
+    if _retry_task is None:
+        _retry_task = asyncio.create_task(retry_failed_loads(executor))
+
+# Function to stop the retry loop (called from the app's shutdown event)
+def stop_retries():
+    global _retry_task
+    if _retry_task is not None:
+        _retry_task.cancel()
+        _retry_task = None
+
+# Function to tell whether images can be recognized right now
+def is_ready() -> bool:
+    return state == READY
+
+# Function to summarize the recognition state for /health and /ready
+def status() -> dict:
+    return {
+        "state": state,
+        "error": error,
+        "load_seconds": round(load_seconds, 2) if load_seconds is not None else None,
+        "failures": failures,
+        "retry_after_seconds": round(retry_after(), 1),
+        "stored_embeddings": _index.ntotal if _index is not None else 0,
+        "warm_up_ms": {name: round(seconds * 1000, 1) for name, seconds in warm_up_timings.items()},
+    }
+
+# Function to generate image embeddings for several images in one CLIP forward pass (one row per image)
+def encode_batch(images: List[bytes]):
+    load()  # No-op once the models are loaded
+    return _encode(images)
+
+def _encode(images: List[bytes]):
+    import torch
+    from PIL import Image
+
+    batch = torch.stack([_preprocess(Image.open(io.BytesIO(image_bytes))) for image_bytes in images]).to(DEVICE)
+    with torch.no_grad():
+        embeddings = _model.encode_image(batch)  # Compute the image embeddings using CLIP
+    return embeddings.cpu().numpy().astype("float32")
+
+# Function to generate an image embedding from raw image bytes using the CLIP model
+def encode(image_bytes: bytes):
+    return encode_batch([image_bytes])
+
+# Function to find the k stored embeddings closest to a query embedding (distances, row ids)
+def search(query_embedding, k: int = 1):
+    load()
+    return _index.search(query_embedding, k)
+
+# Function to get the dish name of a stored embedding row
+def label(row: int) -> str:
+    return _recipe_names[row]
@@ -0,0 +1,172 @@
+# recognition_client.py
+# This module lets API workers use out-of-process recognition workers (app/recognition_worker.py)
+# over Unix sockets, so web workers and CPU-heavy inference workers can be scaled independently.
+# Every message is one frame: an 8-byte prefix (header length, body length), a JSON header and a
+# binary body (image bytes or float32 embeddings). Requests carry an id, so many requests can be in
+# flight on one connection and the worker can batch requests from all API workers together.
+# When no worker socket is configured or reachable, the API falls back to in-process recognition.
+import asyncio
+import itertools
+import json
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import metrics
+
+# Comma-separated Unix socket paths of the recognition workers (empty = in-process recognition)
+RECOGNITION_SOCKETS = [path for path in os.getenv("RECOGNITION_SOCKETS", "").split(",") if path.strip()]
+# Seconds between reconnect attempts to a worker that went away
+RECONNECT_SECONDS = float(os.getenv("RECOGNITION_RECONNECT_SECONDS", "5"))
+
+# Frame prefix: JSON header length and body length
+FRAME_PREFIX = struct.Struct(">II")
+
+class RecognitionError(Exception):
+    """Raised when a recognition worker answered with an error (e.g. the upload is not an image)."""
+
+# Function to read one frame and return its JSON header and binary body
+async def read_message(reader: asyncio.StreamReader) -> Tuple[dict, bytes]:
+    header_length, body_length = FRAME_PREFIX.unpack(await reader.readexactly(FRAME_PREFIX.size))
+    header = json.loads(await reader.readexactly(header_length))
+    body = await reader.readexactly(body_length) if body_length else b""
+    return header, body
+
+# Function to write one frame (a JSON header and an optional binary body)
+def write_message(writer: asyncio.StreamWriter, header: dict, body: bytes = b""):
+    encoded = json.dumps(header).encode()
+    writer.write(FRAME_PREFIX.pack(len(encoded), len(body)) + encoded + body)
+
+# One connection to one recognition worker, with any number of requests in flight
+class WorkerConnection:
+    def __init__(self, path: str):
+        self.path = path
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.pending: Dict[int, asyncio.Future] = {}  # Request id -> future of its reply
+        self._ids = itertools.count()
+        self._reader_task: Optional[asyncio.Task] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+        self._reader_task = asyncio.create_task(self._read_replies())
+        print(f"Connected to recognition worker at {self.path}")
+
+    # Keep trying to connect in the background until the worker is back
+    def reconnect_later(self):
+        if self._closed:
+            return
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while not self.connected:
+            await asyncio.sleep(RECONNECT_SECONDS)
+            try:
+                await self.connect()
+            except OSError:
+                pass
+
+    # Hand every reply to the request waiting for it; on disconnect fail the waiting requests
+    async def _read_replies(self):
+        try:
+            while True:
+                header, body = await read_message(self.reader)
+                future = self.pending.pop(header.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result((header, body))
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            print(f"Lost connection to recognition worker at {self.path}")
+            self.writer.close()
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Recognition worker at {self.path} disconnected"))
+            self.pending.clear()
+            self.reconnect_later()
+
+    # Send one request and wait for its reply
+    async def call(self, op: str, header: dict, body: bytes = b"") -> Tuple[dict, bytes]:
+        if not self.connected:
+            raise ConnectionError(f"Recognition worker at {self.path} is not connected")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            write_message(self.writer, {**header, "id": request_id, "op": op}, body)
+            await self.writer.drain()
+            reply, reply_body = await future
+        finally:
+            self.pending.pop(request_id, None)
+        if "error" in reply:
+            raise RecognitionError(reply["error"])
+        return reply, reply_body
+
+    async def close(self):
+        self._closed = True
+        for task in (self._reconnect_task, self._reader_task):
+            if task is not None:
+                task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+# Client for a set of recognition workers; requests go to the connected worker with the fewest in flight
+class RecognitionClient:
+    def __init__(self, paths: List[str]):
+        self.connections = [WorkerConnection(path) for path in paths]
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.connections)
+
+    # Connect to every worker; unreachable workers are retried in the background
+    async def start(self):
+        for connection in self.connections:
+            try:
+                await connection.connect()
+            except OSError as e:
+                print(f"Recognition worker at {connection.path} is not reachable ({e}), retrying in the background")
+                connection.reconnect_later()
+
+    # Whether at least one worker can take requests right now
+    def available(self) -> bool:
+        return any(connection.connected for connection in self.connections)
+
+    def _pick(self) -> WorkerConnection:
+        connected = [connection for connection in self.connections if connection.connected]
+        if not connected:
+            raise ConnectionError("No recognition worker is connected")
+        return min(connected, key=lambda connection: len(connection.pending))
+
+    # Function to compute the CLIP embedding of an image in a worker (batched with other requests there)
+    async def encode(self, image_bytes: bytes) -> np.ndarray:
+        header, body = await self._pick().call("encode", {}, image_bytes)
+        metrics.increment("recognition.remote.encode")
+        return np.frombuffer(body, dtype="float32").reshape(header["shape"])
+
+    # Function to search the worker's index; returns (distances, rows, labels) with one row per query
+    async def search(self, query_embedding: np.ndarray, k: int = 1):
+        query_embedding = np.ascontiguousarray(query_embedding, dtype="float32")
+        header, _ = await self._pick().call("search", {"k": k, "shape": list(query_embedding.shape)}, query_embedding.tobytes())
+        metrics.increment("recognition.remote.search")
+        return header["distances"], header["rows"], header["labels"]
+
+    # Function to summarize the worker connections for /health and /metrics
+    def status(self) -> list:
+        return [
+            {"socket": connection.path, "connected": connection.connected, "in_flight": len(connection.pending)}
+            for connection in self.connections
+        ]
+
+    async def close(self):
+        for connection in self.connections:
+            await connection.close()
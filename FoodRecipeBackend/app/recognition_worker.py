@@ -0,0 +1,186 @@
+# recognition_worker.py
+# Out-of-process recognition service. It owns the CLIP model and the FAISS index and serves encode and
+# search requests from any number of API workers over a Unix socket (see recognition_client.py for
+# the message format). Requests that arrive close together are run as one batch, so concurrent uploads
+# across all API workers share CLIP forward passes and FAISS searches.
+#
+# Start it from the FoodRecipeBackend folder, one process per inference worker:
+#   python -m app.recognition_worker --socket /tmp/food_recognition_0.sock
+#   python -m app.recognition_worker --socket /tmp/food_recognition_1.sock
+# and point the API at them:
+#   RECOGNITION_SOCKETS=/tmp/food_recognition_0.sock,/tmp/food_recognition_1.sock
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from . import metrics, recognition
+from .recognition_client import read_message, write_message
+
+# Default socket path, batch size limit and how long a batch waits for more requests
+DEFAULT_SOCKET = os.getenv("RECOGNITION_SOCKET", "/tmp/food_recognition.sock")
+DEFAULT_MAX_BATCH = int(os.getenv("RECOGNITION_MAX_BATCH", "16"))
+DEFAULT_MAX_WAIT_MS = float(os.getenv("RECOGNITION_MAX_WAIT_MS", "5"))
+
+# Collects requests into batches and runs each batch with one call of `func(items) -> results`
+class Batcher:
+    def __init__(self, name: str, func: Callable[[List[Any]], List[Any]], max_batch: int, max_wait: float):
+        self.name = name
+        self.func = func
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    # Queue one item and wait for its result
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    # Loop that takes the next batch from the queue and runs it in the inference thread
+    async def run(self, executor: ThreadPoolExecutor):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            closes_at = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = closes_at - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch = [(item, future) for item, future in batch if not future.done()]  # Requester went away
+            if not batch:
+                continue
+            started = time.perf_counter()
+            results = await loop.run_in_executor(executor, self._run_batch, [item for item, _ in batch])
+            metrics.observe(f"worker.{self.name}.batch", time.perf_counter() - started)
+            metrics.increment(f"worker.{self.name}.batches")
+            metrics.increment(f"worker.{self.name}.items", len(batch))
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    # Run a batch; if it fails, run its items one by one so one bad image does not fail the others
+    def _run_batch(self, items: List[Any]) -> List[Any]:
+        try:
+            return list(self.func(items))
+        except Exception:
+            results = []
+            for item in items:
+                try:
+                    results.append(self.func([item])[0])
+                except Exception as e:
+                    results.append(e)
+            return results
+
+# Batch function for encode requests: image bytes -> one embedding row per image
+def encode_images(images: List[bytes]) -> List[np.ndarray]:
+    return list(recognition.encode_batch(images))
+
+# Batch function for search requests: (embedding rows, k) -> (distances, rows, labels) per request
+def search_embeddings(queries: List[tuple]) -> List[tuple]:
+    stacked = np.vstack([embedding for embedding, _ in queries])
+    distances, rows = recognition.search(stacked, max(k for _, k in queries))
+    results, start = [], 0
+    for embedding, k in queries:
+        end = start + len(embedding)
+        query_rows = rows[start:end, :k].tolist()
+        labels = [[recognition.label(row) if row >= 0 else None for row in row_ids] for row_ids in query_rows]
+        results.append((distances[start:end, :k].tolist(), query_rows, labels))
+        start = end
+    return results
+
+# Function to answer one request from an API worker
+async def handle_request(header: dict, body: bytes, writer: asyncio.StreamWriter, batchers: dict):
+    reply = {"id": header.get("id")}
+    reply_body = b""
+    try:
+        if header.get("op") == "encode":
+            embedding = await batchers["encode"].submit(body)
+            reply["shape"] = [1, len(embedding)]
+            reply_body = np.ascontiguousarray(embedding, dtype="float32").tobytes()
+        elif header.get("op") == "search":
+            embedding = np.frombuffer(body, dtype="float32").reshape(header["shape"])
+            reply["distances"], reply["rows"], reply["labels"] = await batchers["search"].submit((embedding, int(header["k"])))
+        elif header.get("op") == "status":
+            reply["recognition"] = recognition.status()
+            reply["metrics"] = metrics.snapshot()
+        else:
+            reply["error"] = f"Unknown operation {header.get('op')!r}"
+    except Exception as e:
+        reply["error"] = str(e)
+    if not writer.is_closing():
+        write_message(writer, reply, reply_body)
+        await writer.drain()
+
+# Function to serve one API worker connection; its requests are handled concurrently
+async def serve_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, batchers: dict):
+    tasks = set()
+    try:
+        while True:
+            header, body = await read_message(reader)
+            task = asyncio.create_task(handle_request(header, body, writer, batchers))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass  # The API worker disconnected
+    finally:
+        for task in tasks:
+            task.cancel()
+        writer.close()
+
+async def serve(socket_path: str, max_batch: int, max_wait: float):
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recognition")
+    loop = asyncio.get_running_loop()
+    # Load and warm up (single images and full batches) before accepting requests
+    batch_sizes = None if os.getenv("RECOGNITION_WARMUP_BATCH_SIZES") else [1, max_batch]
+    await loop.run_in_executor(executor, recognition.load, batch_sizes)
+    if not recognition.is_ready():
+        raise SystemExit(f"Recognition models could not be loaded: {recognition.error}")
+    batchers = {
+        "encode": Batcher("encode", encode_images, max_batch, max_wait),
+        "search": Batcher("search", search_embeddings, max_batch, max_wait),
+    }
+    batch_tasks = [asyncio.create_task(batcher.run(executor)) for batcher in batchers.values()]
+    if os.path.exists(socket_path):
+        os.remove(socket_path)  # Left over from a previous run
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: serve_connection(reader, writer, batchers), path=socket_path
+    )
+    print(f"Recognition worker listening on {socket_path} (max batch {max_batch}, max wait {max_wait * 1000:.0f} ms)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in batch_tasks:
+            task.cancel()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve CLIP encodes and FAISS searches over a Unix socket.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path to listen on")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH, help="Largest batch per CLIP/FAISS call")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS, help="How long a batch waits for more requests")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.socket, args.max_batch, args.max_wait_ms / 1000))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
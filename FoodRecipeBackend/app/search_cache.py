@@ -0,0 +1,178 @@
+# search_cache.py
+# This module keeps a persistent cache of Pexels image and YouTube video search results in a SQLite
+# file, so every API worker on the host shares it and it survives restarts. Results for a dish change
+# rarely (and each YouTube search costs 100 quota units), so a page view is normally answered from the
+# local file in a few milliseconds:
+#   - fresh entry (younger than the TTL): served from the cache
+#   - stale entry (within the stale window after the TTL): served from the cache while one background
+#     request refreshes it for later page views
+#   - missing or expired entry: fetched from the upstream, stored and returned; when the upstream fails
+#     (or its circuit breaker is open) an expired entry is still served as the last known good result
+# The file holds at most SEARCH_CACHE_MAX_ENTRIES entries; the least recently used ones are evicted.
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from . import metrics
+
+# Path of the cache file (relative to the working directory, like food_embeddings.npy)
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "search_cache.db")
+# Hours a stored result is served without refreshing it
+SEARCH_CACHE_TTL_HOURS = float(os.getenv("SEARCH_CACHE_TTL_HOURS", "24"))
+# Hours after the TTL during which a stale result is still served while it is refreshed in the background
+SEARCH_CACHE_STALE_HOURS = float(os.getenv("SEARCH_CACHE_STALE_HOURS", "168"))
+# Largest number of stored results (all kinds together)
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "5000"))
+
+# Function to normalize a search query so "Chicken  Curry" and "chicken curry" share one entry
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+class SearchCache:
+    def __init__(self, path: str = SEARCH_CACHE_PATH, ttl_hours: float = SEARCH_CACHE_TTL_HOURS,
+                 stale_hours: float = SEARCH_CACHE_STALE_HOURS, max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl_hours * 3600
+        self.stale = stale_hours * 3600
+        self.max_entries = max_entries
+        self._refresh_tasks = set()  # Background refreshes, kept referenced while running
+        self._initialized = False
+
+    # Open a connection to the shared file (one per call, so the calls can run in any thread)
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._initialized:
+            # WAL lets the workers read while one of them writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "kind TEXT NOT NULL, query TEXT NOT NULL, value TEXT NOT NULL, "
+                "stored_at REAL NOT NULL, accessed_at REAL NOT NULL, PRIMARY KEY (kind, query))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS search_cache_accessed ON search_cache (accessed_at)")
+            conn.commit()
+            self._initialized = True
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # Function to read a stored result and its age in seconds (blocking; runs in a worker thread)
+    def get(self, kind: str, query: str) -> Optional[Tuple[Any, float]]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT value, stored_at FROM search_cache WHERE kind = ? AND query = ?", (kind, query)
+            ).fetchone()
+            if row is None:
+                return None
+            with conn:
+                conn.execute("UPDATE search_cache SET accessed_at = ? WHERE kind = ? AND query = ?", (now, kind, query))
+            return json.loads(row[0]), now - row[1]
+        finally:
+            conn.close()
+
+    # Function to store a result, then evict the least recently used entries beyond the size limit
+    # (expired entries are kept until then, as last known good results for when the upstream is down)
+    def set(self, kind: str, query: str, value: Any):
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO search_cache (kind, query, value, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (kind, query, json.dumps(value), now, now),
+                )
+                evicted = conn.execute(
+                    "DELETE FROM search_cache WHERE rowid IN "
+                    "(SELECT rowid FROM search_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                ).rowcount
+            if evicted:
+                metrics.increment("search_cache.evicted", evicted)
+        finally:
+            conn.close()
+
+    # Function to count the stored results per kind (blocking; runs in a worker thread)
+    def entries(self) -> dict:
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT kind, COUNT(*) FROM search_cache GROUP BY kind").fetchall())
+        finally:
+            conn.close()
+
+    # Return the result for a query from the cache, or from `fetch(query)` on a miss. `fetch` gets the
+    # normalized query, so the stored result matches its key. Upstream errors are raised unless an expired
+    # result is stored for the query.
+    async def get_or_fetch(self, kind: str, query: str, fetch: Callable[[str], Awaitable[Any]]):
+        query = normalize_query(query)
+        started = time.perf_counter()
+        try:
+            cached = await asyncio.to_thread(self.get, kind, query)
+        except sqlite3.Error as e:
+            print(f"Search cache read failed: {str(e)}")
+            cached = None
+        if cached is not None:
+            value, age = cached
+            if age < self.ttl:
+                metrics.increment(f"search_cache.{kind}.hit")
+                metrics.observe(f"search_cache.{kind}.lookup", time.perf_counter() - started)
+                return value
+            if age < self.ttl + self.stale:
+                metrics.increment(f"search_cache.{kind}.stale")
+                metrics.observe(f"search_cache.{kind}.lookup", time.perf_counter() - started)
+                self.schedule_refresh(kind, query, fetch)  # Serve the stored result now, refresh it for later
+                return value
+        metrics.increment(f"search_cache.{kind}.miss")
+        try:
+            value = await fetch(query)
+        except Exception as e:
+            if cached is None:
+                raise
+            metrics.increment(f"search_cache.{kind}.fallback")
+            print(f"Serving expired {kind} results for {query!r} ({str(e)})")
+            return cached[0]
+        await self._store(kind, query, value)
+        return value
+
+    async def _store(self, kind: str, query: str, value: Any):
+        try:
+            await asyncio.to_thread(self.set, kind, query, value)
+        except sqlite3.Error as e:
+            print(f"Search cache write failed: {str(e)}")
+
+    # Background task that fetches a stale result again and stores it
+    async def _refresh(self, kind: str, query: str, fetch: Callable[[str], Awaitable[Any]]):
+        try:
+            await self._store(kind, query, await fetch(query))
+            metrics.increment(f"search_cache.{kind}.refreshed")
+        except Exception as e:
+            metrics.increment(f"search_cache.{kind}.refresh_failed")
+            print(f"Error refreshing cached {kind} results for {query!r}: {str(e)}")
+
+    # Function to schedule a background refresh for a query (at most one at a time per query)
+    def schedule_refresh(self, kind: str, query: str, fetch: Callable[[str], Awaitable[Any]]):
+        name = f"{kind}:{query}"
+        if any(task.get_name() == name for task in self._refresh_tasks):
+            return
+        task = asyncio.create_task(self._refresh(kind, query, fetch), name=name)
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    # Function to summarize hits, stale hits, misses and the hit rate per kind for /metrics
+    def stats(self, kinds=("pexels", "youtube")) -> dict:
+        summary = {}
+        for kind in kinds:
+            hit = metrics.counters.get(f"search_cache.{kind}.hit", 0)
+            stale = metrics.counters.get(f"search_cache.{kind}.stale", 0)
+            miss = metrics.counters.get(f"search_cache.{kind}.miss", 0)
+            total = hit + stale + miss
+            summary[kind] = {
+                "hit": hit,
+                "stale": stale,
+                "miss": miss,
+                "hit_rate": round((hit + stale) / total, 3) if total else None,
+            }
+        return summary
@@ -0,0 +1,50 @@
+# singleflight.py
+# This module coalesces identical in-flight upstream calls: when several requests need the same
+# OpenAI / YouTube / Pexels / Nutritionix result at the same time, only the first one calls the
+# upstream and the others await the same future.
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from . import metrics
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name  # Upstream name used in metric names, e.g. "openai"
+        self._inflight: Dict[Hashable, asyncio.Task] = {}  # Running upstream calls keyed by cache key
+        self._waiters: Dict[asyncio.Task, int] = {}  # Number of callers awaiting each running call
+
+    # Run `func(*args, **kwargs)` once per key; concurrent callers with the same key share the result
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs):
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.increment(f"singleflight.{self.name}.deduplicated")
+        else:
+            metrics.increment(f"singleflight.{self.name}.executed")
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            # Shield the shared task so one caller being cancelled does not cancel it for the others
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # The last interested caller went away (e.g. the client disconnected): stop the upstream call too
+            if self._waiters.get(task) == 1 and not task.done():
+                task.cancel()
+                metrics.increment(f"singleflight.{self.name}.cancelled")
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if self._waiters[task] == 0:
+                del self._waiters[task]
+
+    # Remove a finished call so the next request for the key starts a fresh upstream call
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Mark the exception as retrieved even if every waiter went away
+
+    # Number of upstream calls currently in flight
+    def inflight(self) -> int:
+        return len(self._inflight)
@@ -0,0 +1,265 @@
+# standin_server.py
+# This module is a local stand-in for every external API the backend calls (OpenAI chat completions,
+# Pexels search, YouTube search and Nutritionix natural/nutrients). It answers with realistic fake data
+# after an injected latency and can inject errors and 429 rate limits, so performance work and load
+# tests can run offline and tail-latency problems can be reproduced.
+#
+# Start it from the FoodRecipeBackend folder:
+#   uvicorn app.standin_server:app --port 9000
+# and point the API at it in .env:
+#   OPENAI_BASE_URL=http://127.0.0.1:9000/v1
+#   PEXELS_BASE_URL=http://127.0.0.1:9000
+#   YOUTUBE_BASE_URL=http://127.0.0.1:9000
+#   NUTRITIONIX_BASE_URL=http://127.0.0.1:9000
+#
+# Latency, error and 429 settings per upstream come from STANDIN_CONFIG_PATH (a JSON file with the same
+# shape as DEFAULT_CONFIG) and can be changed at runtime with POST /standin/config.
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import random
+import time
+from collections import defaultdict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Default behaviour of each upstream. Latency distributions:
+#   {"distribution": "fixed", "ms": 100}
+#   {"distribution": "uniform", "min_ms": 50, "max_ms": 300}
+#   {"distribution": "normal", "mean_ms": 200, "std_ms": 50}
+#   {"distribution": "lognormal", "median_ms": 600, "sigma": 0.5}   (long tail, like real LLM latency)
+DEFAULT_CONFIG = {
+    "openai": {
+        "latency": {"distribution": "lognormal", "median_ms": 600, "sigma": 0.5},
+        "per_token_ms": 0.0,  # Extra latency per completion token, to model long generations
+        "error_rate": 0.0,  # Share of requests answered with a 500
+        "rate_limit_rate": 0.0,  # Share of requests answered with a 429
+        "retry_after_seconds": 1,  # Retry-After header sent with injected 429s
+    },
+    "pexels": {
+        "latency": {"distribution": "lognormal", "median_ms": 150, "sigma": 0.4},
+        "error_rate": 0.0, "rate_limit_rate": 0.0, "retry_after_seconds": 1,
+    },
+    "youtube": {
+        "latency": {"distribution": "lognormal", "median_ms": 200, "sigma": 0.4},
+        "error_rate": 0.0, "rate_limit_rate": 0.0, "retry_after_seconds": 1,
+    },
+    "nutritionix": {
+        "latency": {"distribution": "lognormal", "median_ms": 250, "sigma": 0.4},
+        "error_rate": 0.0, "rate_limit_rate": 0.0, "retry_after_seconds": 1,
+    },
+}
+
+# Ingredient names used for fake ingredient lists (small pool so shopping lists have duplicates to merge)
+FAKE_INGREDIENTS = [
+    "onion", "tomato", "garlic", "olive oil", "salt", "black pepper", "chicken breast", "rice", "butter",
+    "flour", "egg", "milk", "sugar", "ginger", "green chili", "lemon", "cumin", "coriander", "yogurt", "potato",
+]
+FAKE_UNITS = ["", "", "g", "cup", "tbsp", "tsp", "clove"]
+
+app = FastAPI(title="External API stand-in")
+
+# Function to merge a partial config into a full one (nested dictionaries are merged key by key)
+def merge_config(base: dict, override: dict) -> dict:
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+# Function to load the stand-in configuration from STANDIN_CONFIG_PATH (if set)
+def load_config() -> dict:
+    path = os.getenv("STANDIN_CONFIG_PATH")
+    if not path:
+        return copy.deepcopy(DEFAULT_CONFIG)
+    with open(path, "r") as f:
+        return merge_config(DEFAULT_CONFIG, json.load(f))
+
+config = load_config()
+# Request counters per upstream and outcome, exposed on GET /standin/stats
+stats = defaultdict(int)
+
+# Function to draw one latency sample (in seconds) from a distribution config
+def sample_latency(latency: dict) -> float:
+    kind = latency.get("distribution", "fixed")
+    if kind == "uniform":
+        ms = random.uniform(latency["min_ms"], latency["max_ms"])
+    elif kind == "normal":
+        ms = random.gauss(latency["mean_ms"], latency["std_ms"])
+    elif kind == "lognormal":
+        ms = random.lognormvariate(0, latency["sigma"]) * latency["median_ms"]
+    else:
+        ms = latency.get("ms", 0)
+    return max(0.0, ms) / 1000
+
+# Function to apply the configured latency and fault injection; returns an error response or None
+async def simulate(upstream: str, tokens: int = 0):
+    settings = config[upstream]
+    stats[f"{upstream}.requests"] += 1
+    delay = sample_latency(settings["latency"]) + tokens * settings.get("per_token_ms", 0.0) / 1000
+    await asyncio.sleep(delay)
+    roll = random.random()
+    if roll < settings.get("rate_limit_rate", 0.0):
+        stats[f"{upstream}.rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit reached (stand-in)", "type": "rate_limit_exceeded"}},
+            headers={"Retry-After": str(settings.get("retry_after_seconds", 1))},
+        )
+    if roll < settings.get("rate_limit_rate", 0.0) + settings.get("error_rate", 0.0):
+        stats[f"{upstream}.errors"] += 1
+        return JSONResponse(status_code=500, content={"error": {"message": "Injected error (stand-in)", "type": "server_error"}})
+    return None
+
+# Function to build a fake value that matches a JSON schema (used for structured-output requests)
+def fake_from_schema(schema: dict, name: str = ""):
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "string")
+    if kind == "object":
+        return {key: fake_from_schema(value, key) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [fake_from_schema(schema.get("items", {}), name) for _ in range(random.randint(3, 8))]
+    if kind == "integer":
+        return random.randint(1, 6)
+    if kind == "number":
+        return random.choice([0.5, 1, 1, 2, 2, 3, 250])
+    if kind == "boolean":
+        return random.random() < 0.5
+    if name == "item":
+        return random.choice(FAKE_INGREDIENTS)
+    if name == "unit":
+        return random.choice(FAKE_UNITS)
+    if name in ("prep_time", "cook_time"):
+        return f"{random.randint(1, 12) * 5} minutes"
+    if name == "ingredients":
+        return f"{random.randint(1, 3)} {random.choice(FAKE_UNITS)} {random.choice(FAKE_INGREDIENTS)}".replace("  ", " ")
+    return f"Stand-in {name or 'text'} {random.randint(1, 999)}"
+
+# Function to build a fake free-text reply of roughly `max_tokens` tokens (one item per line)
+def fake_text(max_tokens: int) -> str:
+    lines = []
+    words = 0
+    while words < max_tokens * 0.75:  # About 0.75 words per token
+        line = f"{len(lines) + 1}. {random.randint(1, 3)} {random.choice(FAKE_UNITS)} {random.choice(FAKE_INGREDIENTS)}"
+        lines.append(line.replace("  ", " "))
+        words += len(line.split())
+    return "\n".join(lines)
+
+# Stand-in for OpenAI's chat completions endpoint
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    max_tokens = int(body.get("max_tokens") or 200)
+    error = await simulate("openai", tokens=max_tokens)
+    if error:
+        return error
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        content = json.dumps(fake_from_schema(response_format["json_schema"]["schema"]))
+    else:
+        content = fake_text(max_tokens)
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "id": f"chatcmpl-standin-{random.getrandbits(48):x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+# Stand-in for OpenAI's model list (the API calls it at startup to open its connection pool)
+@app.get("/v1/models")
+async def list_models():
+    error = await simulate("openai")
+    if error:
+        return error
+    models = ["gpt-4", "gpt-4o", "gpt-4o-mini"]
+    return {"object": "list", "data": [{"id": name, "object": "model", "created": 0, "owned_by": "standin"} for name in models]}
+
+# Stand-in for the Pexels photo search endpoint
+@app.get("/v1/search")
+async def pexels_search(query: str = "", per_page: int = 8):
+    error = await simulate("pexels")
+    if error:
+        return error
+    photos = [
+        {"id": 1000 + i, "src": {"medium": f"https://images.pexels.com/photos/standin/{i}.jpeg?h=350"}, "alt": query}
+        for i in range(per_page)
+    ]
+    return {"page": 1, "per_page": per_page, "photos": photos, "total_results": per_page}
+
+# Stand-in for the YouTube Data API search endpoint
+@app.get("/youtube/v3/search")
+async def youtube_search(q: str = "", maxResults: int = 3):
+    error = await simulate("youtube")
+    if error:
+        return error
+    items = [
+        {
+            "id": {"kind": "youtube#video", "videoId": f"standin{i:04d}"},
+            "snippet": {
+                "title": f"{q.title()} #{i + 1}",
+                "thumbnails": {"medium": {"url": f"https://i.ytimg.com/vi/standin{i:04d}/mqdefault.jpg"}},
+            },
+        }
+        for i in range(maxResults)
+    ]
+    return {"kind": "youtube#searchListResponse", "items": items}
+
+# Function to build deterministic fake nutrients for a food name (same food -> same numbers)
+def fake_food(name: str) -> dict:
+    seed = int(hashlib.md5(name.lower().encode()).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    return {
+        "food_name": name.lower(),
+        "serving_qty": 1,
+        "serving_unit": "serving",
+        "nf_calories": round(rng.uniform(50, 700), 1),
+        "nf_total_fat": round(rng.uniform(0, 40), 1),
+        "nf_protein": round(rng.uniform(0, 45), 1),
+        "nf_total_carbohydrate": round(rng.uniform(0, 90), 1),
+    }
+
+# Stand-in for the Nutritionix natural-language nutrients endpoint (a query may list several foods)
+@app.post("/v2/natural/nutrients")
+async def nutritionix_nutrients(request: Request):
+    body = await request.json()
+    error = await simulate("nutritionix")
+    if error:
+        return error
+    names = [part.strip() for part in str(body.get("query", "")).replace(" and ", ",").split(",") if part.strip()]
+    if not names:
+        return JSONResponse(status_code=404, content={"message": "We couldn't match any of your foods"})
+    return {"foods": [fake_food(name) for name in names]}
+
+# Endpoint to read the current stand-in configuration
+@app.get("/standin/config")
+async def get_config():
+    return config
+
+# Endpoint to change the stand-in configuration at runtime (partial updates are merged)
+@app.post("/standin/config")
+async def update_config(request: Request):
+    global config
+    config = merge_config(config, await request.json())
+    return config
+
+# Endpoint to read (and optionally reset) the request counters
+@app.get("/standin/stats")
+async def get_stats(reset: bool = False):
+    snapshot = dict(stats)
+    if reset:
+        stats.clear()
+    return snapshot
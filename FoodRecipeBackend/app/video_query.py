@@ -0,0 +1,92 @@
+# video_query.py
+# This module builds YouTube search queries locally. Almost every /get-videos/ call is for a dish the
+# image recognizer knows (a label from recipe_names.txt), and the best search for it is simply
+# "<dish> recipe", so no GPT call is needed. Only free-text queries outside the vocabulary may
+# optionally be refined by OpenAI, and those refinements are cached per dish.
+import os
+import re
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+# Template used for dishes in the vocabulary ("{dish}" is replaced by the readable dish name)
+VIDEO_QUERY_TEMPLATE = os.getenv("VIDEO_QUERY_TEMPLATE", "{dish} recipe")
+# Set VIDEO_QUERY_LLM_REFINEMENT=1 to let OpenAI rewrite free-text queries that are not in the vocabulary
+LLM_REFINEMENT_ENABLED = os.getenv("VIDEO_QUERY_LLM_REFINEMENT", "0") == "1"
+# Number of refined free-text queries kept in memory
+REFINED_CACHE_SIZE = 1000
+
+# Other names people use for dishes in the vocabulary (normalized text -> label); only names of the
+# same dish, not of a related dish or one variant of it
+DISH_SYNONYMS = {
+    "burger": "hamburger",
+    "cheeseburger": "hamburger",
+    "fries": "french_fries",
+    "chips": "french_fries",
+    "mac and cheese": "macaroni_and_cheese",
+    "mac n cheese": "macaroni_and_cheese",
+    "mac & cheese": "macaroni_and_cheese",
+    "spag bol": "spaghetti_bolognese",
+    "bolognese": "spaghetti_bolognese",
+    "carbonara": "spaghetti_carbonara",
+    "cupcake": "cup_cakes",
+    "doughnut": "donuts",
+    "wings": "chicken_wings",
+    "buffalo wings": "chicken_wings",
+    "calamari": "fried_calamari",
+    "creme brule": "creme_brulee",
+    "crème brûlée": "creme_brulee",
+    "onion soup": "french_onion_soup",
+    "eggs benny": "eggs_benedict",
+    "omelet": "omelette",
+    "sushi roll": "sushi",
+    "pot sticker": "gyoza",
+    "potsticker": "gyoza",
+}
+
+# Filler words stripped from free text before looking it up ("how to make pizza recipe" -> "pizza")
+FILLER_WORDS = {"how", "to", "make", "cook", "recipe", "recipes", "easy", "best", "homemade", "a", "the", "video"}
+
+# Function to normalize free text for vocabulary lookups
+def normalize_query(query: str) -> str:
+    query = query.lower().replace("_", " ").replace("-", " ")
+    query = re.sub(r"[^\w\s]", " ", query)  # Drop punctuation
+    return " ".join(word for word in query.split() if word not in FILLER_WORDS)
+
+class VideoQueryBuilder:
+    def __init__(self, labels: Iterable[str]):
+        # Index every label by its normalized name, its singular form and the known synonyms
+        self.lookup = {}
+        for label in labels:
+            name = normalize_query(label)
+            self.lookup[name] = label
+            if name.endswith("s"):
+                self.lookup.setdefault(name[:-1], label)  # "tacos" also matches "taco"
+        for synonym, label in DISH_SYNONYMS.items():
+            self.lookup.setdefault(normalize_query(synonym), label)
+        self.refined: "OrderedDict[str, str]" = OrderedDict()  # LRU cache of OpenAI-refined free-text queries
+
+    # Function to find the vocabulary label for a query, or None if it is free text outside the vocabulary
+    def match_dish(self, query: str) -> Optional[str]:
+        name = normalize_query(query)
+        return self.lookup.get(name) or self.lookup.get(name.rstrip("s"))
+
+    # Function to build the local search query; uses the vocabulary label when the query matches one
+    def build(self, query: str) -> str:
+        label = self.match_dish(query)
+        dish = label.replace("_", " ") if label else (normalize_query(query) or query.strip())
+        return VIDEO_QUERY_TEMPLATE.format(dish=dish)
+
+    # Function to read a cached OpenAI refinement for a free-text query
+    def cached_refinement(self, query: str) -> Optional[str]:
+        key = normalize_query(query)
+        refined = self.refined.get(key)
+        if refined is not None:
+            self.refined.move_to_end(key)
+        return refined
+
+    # Function to store an OpenAI refinement for a free-text query (oldest entries are evicted first)
+    def store_refinement(self, query: str, refined: str):
+        self.refined[normalize_query(query)] = refined
+        self.refined.move_to_end(normalize_query(query))
+        while len(self.refined) > REFINED_CACHE_SIZE:
+            self.refined.popitem(last=False)
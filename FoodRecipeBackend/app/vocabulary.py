@@ -0,0 +1,17 @@
+# vocabulary.py
+# This module holds the recognition vocabulary: the dish labels in recipe_names.txt, one per stored
+# image embedding. It has no dependencies, so the recognition worker process can read the labels
+# without loading the OpenAI gateway that the recipe catalogue needs.
+from typing import List
+
+# Path of the recognition vocabulary (one label per stored embedding)
+RECIPE_NAMES_PATH = "recipe_names.txt"
+
+# Function to turn a recognition label such as "chicken_curry" into a readable dish name
+def dish_display_name(label: str) -> str:
+    return label.replace("_", " ").strip()
+
+# Function to read the unique labels of the recognition vocabulary, keeping their original order
+def load_vocabulary(path: str = RECIPE_NAMES_PATH) -> List[str]:
+    with open(path, "r") as f:
+        return list(dict.fromkeys(line.strip() for line in f if line.strip()))
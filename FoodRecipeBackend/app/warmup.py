@@ -0,0 +1,59 @@
+# warmup.py
+# This module warms a freshly started API process before it reports ready: it opens the pooled database
+# connections, makes the first (TLS) connections to OpenAI and the other external APIs, and waits for
+# the recognition models to finish their synthetic encodes. The first real request then runs at the
+# same speed as the rest instead of paying for all of that. Every step is timed and logged; a failed
+# step is logged and does not keep the instance from becoming ready.
+import asyncio
+import os
+import time
+from typing import Awaitable, Dict
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from . import http_client, llm, metrics
+
+# Number of database connections opened during warm-up (the engine's pool keeps them)
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "5"))
+# Seconds each external API connection may take during warm-up
+WARMUP_HTTP_TIMEOUT = float(os.getenv("WARMUP_HTTP_TIMEOUT", "5"))
+
+# Warm-up progress reported on /health and /ready
+state = {"done": False, "timings_ms": {}, "errors": {}}
+
+# Function to open several pooled database connections at once (each runs a trivial query)
+async def warm_up_database(engine: AsyncEngine, connections: int = WARMUP_DB_CONNECTIONS):
+    async def open_connection():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    await asyncio.gather(*(open_connection() for _ in range(connections)))
+
+# Function to open the OpenAI client's connection pool (listing models costs no tokens)
+async def warm_up_openai():
+    await llm.get_client().models.list()
+
+# Function to open a pooled keep-alive connection to an external API (any HTTP answer is fine)
+async def warm_up_http(url: str):
+    await http_client.get_client().head(url, timeout=WARMUP_HTTP_TIMEOUT)
+
+# Function to run one warm-up step, recording how long it took and whether it failed
+async def timed_step(name: str, step: Awaitable):
+    started = time.perf_counter()
+    try:
+        await step
+    except Exception as e:
+        state["errors"][name] = str(e)
+        print(f"Warm-up step {name} failed: {str(e)}")
+    finally:
+        seconds = time.perf_counter() - started
+        state["timings_ms"][name] = round(seconds * 1000, 1)
+        metrics.observe(f"warmup.{name}", seconds)
+
+# Function to run all warm-up steps concurrently and then mark the instance as warmed up
+async def run(steps: Dict[str, Awaitable]):
+    started = time.perf_counter()
+    await asyncio.gather(*(timed_step(name, step) for name, step in steps.items()))
+    state["timings_ms"]["total"] = round((time.perf_counter() - started) * 1000, 1)
+    state["done"] = True
+    print("Warm-up finished: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in state["timings_ms"].items()))
@@ -0,0 +1,243 @@
+# index_sweep.py
+# Offline evaluation of vector-search configurations for dish recognition. It loads the stored CLIP
+# embeddings (food_embeddings.npy) and their labels (recipe_names.txt), holds out a stratified query
+# set (the same share of every dish), and sweeps FAISS index types and parameters:
+#   flat (what main.py uses today), IVF (nlist/nprobe), HNSW (M/efSearch), scalar quantization,
+#   product quantization, one prototype (mean embedding) per dish, and k-nearest-neighbour voting.
+# For every configuration it reports top-1/top-5 label accuracy, queries per second (one query at a
+# time, like the upload endpoint, and as one batch), build time and index size, as a table and JSON.
+#
+# Run it from the FoodRecipeBackend folder:
+#   python -m benchmarks.index_sweep --output index_sweep_results.json
+import argparse
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Tuple
+
+import faiss
+import numpy as np
+
+# Neighbours retrieved for the accuracy pass (enough to find five different dishes)
+ACCURACY_K = 50
+
+# Function to load the embeddings and their labels (one label per embedding row)
+def load_dataset(embeddings_path: str, names_path: str, normalize: bool) -> Tuple[np.ndarray, np.ndarray]:
+    embeddings = np.ascontiguousarray(np.load(embeddings_path).astype("float32"))
+    with open(names_path, "r") as f:
+        names = f.read().splitlines()
+    if len(names) != len(embeddings):
+        print(f"Warning: {len(embeddings)} embeddings but {len(names)} names; using the first {min(len(names), len(embeddings))}")
+    count = min(len(names), len(embeddings))
+    embeddings = embeddings[:count]
+    if normalize:
+        faiss.normalize_L2(embeddings)
+    return embeddings, np.array(names[:count])
+
+# Function to split the rows into a database and a query set, holding out the same share of every label
+def stratified_split(labels: np.ndarray, query_fraction: float, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    rows_by_label = defaultdict(list)
+    for row, label in enumerate(labels):
+        rows_by_label[label].append(row)
+    database_rows, query_rows = [], []
+    for rows in rows_by_label.values():
+        rows = rng.permutation(rows)
+        # Labels with a single example stay in the database, otherwise they could never be found
+        held_out = int(round(len(rows) * query_fraction)) if len(rows) > 1 else 0
+        held_out = min(max(held_out, 1 if len(rows) > 1 else 0), len(rows) - 1)
+        query_rows.extend(rows[:held_out])
+        database_rows.extend(rows[held_out:])
+    return np.sort(np.array(database_rows, dtype=np.int64)), np.sort(np.array(query_rows, dtype=np.int64))
+
+# Function to rank distinct labels in neighbour order (the first five are the top-5 prediction)
+def ranked_labels(neighbour_labels) -> List[str]:
+    ranked = []
+    for label in neighbour_labels:
+        if label not in ranked:
+            ranked.append(label)
+            if len(ranked) == 5:
+                break
+    return ranked
+
+# Function to rank labels by a majority vote of the k nearest neighbours (ties go to the nearer label)
+def vote_labels(neighbour_labels, k: int) -> List[str]:
+    votes = Counter(neighbour_labels[:k])
+    order = {label: position for position, label in reversed(list(enumerate(neighbour_labels)))}
+    voted = sorted(votes, key=lambda label: (-votes[label], order[label]))
+    return ranked_labels(voted + list(neighbour_labels))
+
+# Function to time searching one query at a time (like the upload endpoint) and as one batch
+def measure_qps(index, queries: np.ndarray, k: int, single_queries: int) -> Tuple[float, float]:
+    sample = queries[:single_queries]
+    started = time.perf_counter()
+    for row in range(len(sample)):
+        index.search(sample[row:row + 1], k)
+    single_qps = len(sample) / max(time.perf_counter() - started, 1e-9)
+    started = time.perf_counter()
+    index.search(queries, k)
+    batch_qps = len(queries) / max(time.perf_counter() - started, 1e-9)
+    return single_qps, batch_qps
+
+# Function to measure the serialized size of an index (what it costs in memory and on disk)
+def index_bytes(index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+# Function to build an index from a factory string, train it if needed and add the database vectors
+def build_factory_index(factory: str, database: np.ndarray, metric: int) -> Tuple[object, float]:
+    started = time.perf_counter()
+    index = faiss.index_factory(database.shape[1], factory, metric)
+    if not index.is_trained:
+        index.train(database)
+    index.add(database)
+    return index, time.perf_counter() - started
+
+# Function to list the index configurations to sweep: (name, factory string, search parameters)
+def factory_configs(database_size: int) -> List[Tuple[str, str, Dict[str, int]]]:
+    configs = [("flat", "Flat", {})]
+    # FAISS wants roughly 39 training points per IVF list
+    for nlist in [nlist for nlist in (64, 256, 1024) if nlist * 39 <= database_size]:
+        for nprobe in (1, 4, 16, 64):
+            if nprobe <= nlist:
+                configs.append((f"ivf{nlist}/nprobe{nprobe}", f"IVF{nlist},Flat", {"nprobe": nprobe}))
+    for m in (16, 32):
+        for ef_search in (16, 64, 128):
+            configs.append((f"hnsw{m}/ef{ef_search}", f"HNSW{m}", {"efSearch": ef_search}))
+    configs.append(("sq8", "SQ8", {}))
+    configs.append(("sqfp16", "SQfp16", {}))
+    if database_size >= 256 * 39:  # PQ codebooks have 256 centroids per sub-vector
+        for m in (32, 64):
+            configs.append((f"pq{m}", f"PQ{m}", {}))
+    return configs
+
+# Function to apply search-time parameters (nprobe, efSearch) to an index
+def set_search_params(index, params: Dict[str, int]):
+    for name, value in params.items():
+        if name == "nprobe":
+            faiss.extract_index_ivf(index).nprobe = value
+        elif name == "efSearch":
+            faiss.downcast_index(index).hnsw.efSearch = value
+
+# Function to evaluate one configuration: accuracy from the ranked labels, speed at the production k
+def evaluate(name: str, index, build_seconds: float, queries: np.ndarray, query_labels: np.ndarray,
+             rank: Callable[[np.ndarray], List[str]], accuracy_k: int, speed_k: int, single_queries: int) -> dict:
+    _, neighbours = index.search(queries, accuracy_k)
+    top1 = top5 = 0
+    for row, truth in enumerate(query_labels):
+        ranked = rank(neighbours[row])
+        top1 += bool(ranked) and ranked[0] == truth
+        top5 += truth in ranked[:5]
+    single_qps, batch_qps = measure_qps(index, queries, speed_k, single_queries)
+    return {
+        "config": name,
+        "top1_accuracy": round(top1 / len(query_labels), 4),
+        "top5_accuracy": round(top5 / len(query_labels), 4),
+        "single_qps": round(single_qps, 1),
+        "batch_qps": round(batch_qps, 1),
+        "build_seconds": round(build_seconds, 3),
+        "index_mb": round(index_bytes(index) / 2 ** 20, 2),
+    }
+
+# Function to run the whole sweep and return one result row per configuration
+def run_sweep(embeddings: np.ndarray, labels: np.ndarray, args) -> Tuple[List[dict], dict]:
+    database_rows, query_rows = stratified_split(labels, args.query_fraction, args.seed)
+    database, queries = embeddings[database_rows], embeddings[query_rows]
+    database_labels, query_labels = labels[database_rows], labels[query_rows]
+    metric = faiss.METRIC_INNER_PRODUCT if args.normalize else faiss.METRIC_L2
+    accuracy_k = min(ACCURACY_K, len(database))
+    dataset = {
+        "vectors": int(len(embeddings)), "dimension": int(embeddings.shape[1]), "labels": int(len(set(labels))),
+        "database": int(len(database)), "queries": int(len(queries)), "metric": "ip" if args.normalize else "l2",
+    }
+    print(f"{dataset['database']} database vectors, {dataset['queries']} queries, {dataset['labels']} labels")
+    print_header()
+
+    results = []
+    def selected(name):
+        return not args.only or any(name.startswith(prefix) for prefix in args.only)
+
+    def neighbour_rank(neighbours):
+        return ranked_labels(database_labels[neighbours[neighbours >= 0]])
+
+    for name, factory, params in factory_configs(len(database)):
+        if not selected(name):
+            continue
+        index, build_seconds = build_factory_index(factory, database, metric)
+        set_search_params(index, params)
+        results.append(evaluate(name, index, build_seconds, queries, query_labels, neighbour_rank,
+                                accuracy_k, 1, args.single_queries))
+        print_row(results[-1])
+
+    # k-nearest-neighbour voting on the exact index
+    if selected("kvote"):
+        index, build_seconds = build_factory_index("Flat", database, metric)
+        for k in (5, 10, 20):
+            def vote_rank(neighbours, k=k):
+                return vote_labels(list(database_labels[neighbours[neighbours >= 0]]), k)
+            results.append(evaluate(f"kvote{k}", index, build_seconds, queries, query_labels, vote_rank,
+                                    max(accuracy_k, k), k, args.single_queries))
+            print_row(results[-1])
+
+    # One prototype per dish: the mean of its database embeddings
+    if selected("prototypes"):
+        started = time.perf_counter()
+        prototype_labels = np.array(sorted(set(database_labels)))
+        positions = {label: position for position, label in enumerate(prototype_labels)}
+        prototypes = np.zeros((len(prototype_labels), database.shape[1]), dtype="float32")
+        counts = np.zeros(len(prototype_labels), dtype="float32")
+        for vector, label in zip(database, database_labels):
+            prototypes[positions[label]] += vector
+            counts[positions[label]] += 1
+        prototypes /= counts[:, None]
+        if args.normalize:
+            faiss.normalize_L2(prototypes)
+        index = faiss.IndexFlatIP(prototypes.shape[1]) if args.normalize else faiss.IndexFlatL2(prototypes.shape[1])
+        index.add(prototypes)
+        build_seconds = time.perf_counter() - started
+        def prototype_rank(neighbours):
+            return ranked_labels(prototype_labels[neighbours[neighbours >= 0]])
+        results.append(evaluate("prototypes", index, build_seconds, queries, query_labels, prototype_rank,
+                                min(5, len(prototypes)), 1, args.single_queries))
+        print_row(results[-1])
+    return results, dataset
+
+# Function to print the table header and rows
+def print_header():
+    print(f"{'config':<20}{'top1':>8}{'top5':>8}{'1-by-1 qps':>12}{'batch qps':>12}{'build s':>10}{'size MB':>10}")
+
+def print_row(row: dict):
+    print(f"{row['config']:<20}{row['top1_accuracy']:>8.4f}{row['top5_accuracy']:>8.4f}{row['single_qps']:>12.1f}"
+          f"{row['batch_qps']:>12.1f}{row['build_seconds']:>10.3f}{row['index_mb']:>10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep FAISS index configurations for dish recognition.")
+    parser.add_argument("--embeddings", default="food_embeddings.npy")
+    parser.add_argument("--names", default="recipe_names.txt")
+    parser.add_argument("--query-fraction", type=float, default=0.1, help="Share of every dish held out as queries")
+    parser.add_argument("--single-queries", type=int, default=1000, help="Queries timed one at a time")
+    parser.add_argument("--normalize", action="store_true", help="L2-normalize vectors and use inner product (cosine)")
+    parser.add_argument("--threads", type=int, default=0, help="FAISS threads (0 keeps the FAISS default)")
+    parser.add_argument("--only", help="Comma-separated config name prefixes to run, e.g. flat,hnsw,kvote")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="index_sweep_results.json", help="JSON file the results are written to")
+    args = parser.parse_args()
+    args.only = args.only.split(",") if args.only else None
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+
+    embeddings, labels = load_dataset(args.embeddings, args.names, args.normalize)
+    results, dataset = run_sweep(embeddings, labels, args)
+    with open(args.output, "w") as f:
+        json.dump({
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "dataset": dataset,
+            "config": {
+                "query_fraction": args.query_fraction, "normalize": args.normalize, "threads": args.threads or faiss.omp_get_max_threads(),
+                "seed": args.seed, "faiss_version": faiss.__version__,
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
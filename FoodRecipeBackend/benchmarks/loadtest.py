@@ -0,0 +1,287 @@
+# loadtest.py
+# End-to-end load test of the API. It starts the local stand-in for the external APIs
+# (app/standin_server.py) and the API itself against a fresh SQLite database and empty caches in a
+# temporary folder, then drives the register/login, generate-recipe, upload-image, PDF and history
+# endpoints at stepped concurrency levels. For every step it reports throughput and p50/p95/p99 per endpoint, plus the per-stage
+# latencies the API records itself (DB, CLIP, search, LLM ... from /metrics), and writes everything
+# to a JSON file so runs can be compared between releases.
+#
+# Run it from the FoodRecipeBackend folder (needs aiosqlite and httpx):
+#   python -m benchmarks.loadtest --concurrency 1,4,16 --duration 30 --output loadtest_results.json
+# Use --base-url to benchmark an API that is already running (no servers are started then).
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.metrics import percentile
+
+# Folder the servers are started from (FoodRecipeBackend)
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# Images sent to /upload-image/
+IMAGE_DIR = os.path.join(BACKEND_DIR, "app", "food_images")
+# Dishes used for recipe, PDF and shopping list requests
+DISHES = ["pizza", "chicken biryani", "pasta", "fried rice", "pancakes", "caesar salad", "ramen", "tacos"]
+
+# Scenario name -> weight (how often a worker picks it relative to the others)
+SCENARIO_WEIGHTS = {
+    "login": 1,
+    "generate_recipe": 3,
+    "upload_image": 2,
+    "nutrition_pdf": 2,
+    "shopping_list": 1,
+    "history": 3,
+}
+HISTORY_ENDPOINTS = [
+    "/chat-history/", "/recipe-generator-history/", "/uploads-history/", "/nutrition-history/", "/shopping-list-history/",
+]
+
+# Latency samples (seconds) and status codes per endpoint for the current step
+class StepRecorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, seconds: float, status: int):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][status] += 1
+
+    # Summary per endpoint: counts, errors, throughput and latency percentiles
+    def summary(self, duration: float) -> dict:
+        result = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            statuses = self.statuses[endpoint]
+            result[endpoint] = {
+                "count": len(samples),
+                "errors": sum(count for status, count in statuses.items() if status >= 400 or status == 0),
+                "status_codes": {str(status): count for status, count in sorted(statuses.items())},
+                "throughput_rps": round(len(samples) / duration, 2),
+                "avg_ms": round(1000 * sum(samples) / len(samples), 2),
+                "p50_ms": round(1000 * percentile(samples, 50), 2),
+                "p95_ms": round(1000 * percentile(samples, 95), 2),
+                "p99_ms": round(1000 * percentile(samples, 99), 2),
+            }
+        return result
+
+# Function to send one request and record its latency (status 0 means the request itself failed)
+async def timed(recorder: StepRecorder, endpoint: str, send) -> httpx.Response:
+    started = time.perf_counter()
+    try:
+        response = await send()
+        status = response.status_code
+    except httpx.HTTPError:
+        response, status = None, 0
+    recorder.record(endpoint, time.perf_counter() - started, status)
+    return response
+
+# Function to register a fresh user and return (username, password, bearer token)
+async def register_user(client: httpx.AsyncClient, recorder: StepRecorder):
+    username = f"loadtest_{uuid.uuid4().hex[:12]}"
+    password = "loadtest-password"
+    response = await timed(recorder, "register", lambda: client.post(
+        "/register", json={"username": username, "email": f"{username}@example.com", "password": password}
+    ))
+    if response is None or response.status_code != 200:
+        raise RuntimeError(f"Could not register a load-test user: {response.text if response is not None else 'no response'}")
+    return username, password, response.json()["access_token"]
+
+# Function to run one scenario for a worker
+async def run_scenario(name: str, client: httpx.AsyncClient, recorder: StepRecorder, user: tuple):
+    username, password, token = user
+    headers = {"Authorization": f"Bearer {token}"}
+    dish = random.choice(DISHES)
+    if name == "login":
+        await timed(recorder, "login", lambda: client.post("/login", json={"username": username, "password": password}))
+    elif name == "generate_recipe":
+        await timed(recorder, "generate_recipe", lambda: client.post("/generate-recipe/", json={"prompt": dish}, headers=headers))
+    elif name == "upload_image":
+        image = random.choice(sorted(os.listdir(IMAGE_DIR)))
+        with open(os.path.join(IMAGE_DIR, image), "rb") as f:
+            content = f.read()
+        await timed(recorder, "upload_image", lambda: client.post(
+            "/upload-image/", files={"file": (image, content, "image/png")}, headers=headers
+        ))
+    elif name == "nutrition_pdf":
+        await timed(recorder, "nutrition_pdf", lambda: client.post("/generate-food-pdf/", json={"food_item": dish}, headers=headers))
+    elif name == "shopping_list":
+        recipes = random.sample(DISHES, 2)
+        await timed(recorder, "shopping_list", lambda: client.post("/generate-shopping-list/", json={"recipes": recipes}, headers=headers))
+    elif name == "history":
+        path = random.choice(HISTORY_ENDPOINTS)
+        await timed(recorder, "history", lambda: client.get(path, headers=headers))
+
+# Function for one simulated client: register once, then keep running weighted scenarios until the step ends
+async def worker(client: httpx.AsyncClient, recorder: StepRecorder, stop_at: float, scenarios: List[str], weights: List[int]):
+    user = await register_user(client, recorder)
+    while time.monotonic() < stop_at:
+        await run_scenario(random.choices(scenarios, weights)[0], client, recorder, user)
+
+# Function to run one concurrency step and summarize it (client-side and server-side numbers)
+async def run_step(base_url: str, concurrency: int, duration: float, scenario_weights: Dict[str, int]) -> dict:
+    limits = httpx.Limits(max_connections=concurrency + 4, max_keepalive_connections=concurrency + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        await client.post("/metrics/reset")
+        recorder = StepRecorder()
+        scenarios, weights = list(scenario_weights), list(scenario_weights.values())
+        started = time.monotonic()
+        await asyncio.gather(*(worker(client, recorder, started + duration, scenarios, weights) for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+        server = (await client.get("/metrics")).json()
+    endpoints = recorder.summary(elapsed)
+    total = sum(entry["count"] for entry in endpoints.values())
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "endpoints": endpoints,
+        # Server-side latencies: per-stage timings (stage.<endpoint>.<stage>), LLM tasks, queues ...
+        "stages": {name: value for name, value in server["timings"].items() if name.startswith("stage.")},
+        "server_timings": {name: value for name, value in server["timings"].items() if not name.startswith("stage.")},
+        "server_counters": server["counters"],
+    }
+
+# Function to start a uvicorn server in the background and wait until it answers
+def start_server(module: str, port: int, env: dict, ready_path: str, ready_timeout: float) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        wait_until_ready(f"http://127.0.0.1:{port}{ready_path}", ready_timeout, process)
+    except RuntimeError:
+        process.terminate()
+        raise
+    return process
+
+# Function to wait until a URL answers below 500; the API's /ready answers 503 until its warm-up
+# (connections, recognition models) has finished, so the first step does not measure a cold instance
+def wait_until_ready(url: str, timeout: float, process: Optional[subprocess.Popen] = None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server behind {url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(1)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+# Function to build the environment of the API under test (local SQLite DB, stand-in upstreams). Every
+# cache and stored file goes to the run's own folder, so the stand-in's fake answers never reach the
+# real caches and each run starts cold (unless --catalogue copies a warm recipe catalogue in).
+def app_environment(args, state_dir: str) -> dict:
+    standin_url = f"http://127.0.0.1:{args.standin_port}"
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.abspath(args.database)}",
+        "DATABASE_ECHO": "0",
+        "OPENAI_BASE_URL": f"{standin_url}/v1",
+        "PEXELS_BASE_URL": standin_url,
+        "YOUTUBE_BASE_URL": standin_url,
+        "NUTRITIONIX_BASE_URL": standin_url,
+        "SEARCH_CACHE_PATH": os.path.join(state_dir, "search_cache.db"),
+        "NUTRIENT_TABLE_PATH": os.path.join(state_dir, "nutrient_table.json"),
+        "RECIPE_CATALOGUE_PATH": os.path.join(state_dir, "recipe_catalogue.json"),
+        "PDF_CACHE_DIR": os.path.join(state_dir, "pdf_cache"),
+        "PDF_STORAGE_DIR": os.path.join(state_dir, "generated_pdfs"),
+    })
+    if args.catalogue:
+        shutil.copyfile(args.catalogue, env["RECIPE_CATALOGUE_PATH"])
+    # The stand-in does not check keys, but the API expects them to be set
+    for name in ("OPENAI_API_KEY", "PEXELS_API_KEY", "YOUTUBE_API_KEY", "NUTRITIONIX_API_KEY", "NUTRITIONIX_APP_ID"):
+        env.setdefault(name, "loadtest")
+    env.setdefault("SECRET_KEY", "loadtest-secret")
+    return env
+
+# Function to find the commit being benchmarked (so result files can be compared between releases)
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# Function to print a short per-endpoint table for one step
+def print_step(step: dict):
+    print(f"\nConcurrency {step['concurrency']}: {step['requests']} requests, {step['throughput_rps']} req/s")
+    print(f"  {'endpoint':<18}{'count':>7}{'errors':>8}{'req/s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, entry in step["endpoints"].items():
+        print(f"  {name:<18}{entry['count']:>7}{entry['errors']:>8}{entry['throughput_rps']:>8}"
+              f"{entry['p50_ms']:>10}{entry['p95_ms']:>10}{entry['p99_ms']:>10}")
+    for name, entry in step["stages"].items():
+        print(f"  {name:<40} p50 {entry['p50_ms']} ms  p95 {entry['p95_ms']} ms  p99 {entry['p99_ms']} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the API at stepped concurrency levels.")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels (simulated clients)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per concurrency step")
+    parser.add_argument("--output", default="loadtest_results.json", help="JSON file the results are written to")
+    parser.add_argument("--scenarios", default=",".join(SCENARIO_WEIGHTS), help="Comma-separated scenarios to run")
+    parser.add_argument("--base-url", help="Benchmark an API that is already running instead of starting one")
+    parser.add_argument("--app-port", type=int, default=8100)
+    parser.add_argument("--standin-port", type=int, default=9100)
+    parser.add_argument("--standin-config", help="JSON file with stand-in latency/error settings (STANDIN_CONFIG_PATH)")
+    parser.add_argument("--database", default="loadtest.db", help="SQLite file for the API (recreated on every run)")
+    parser.add_argument("--catalogue", help="Recipe catalogue copied in before the API starts (default: start without one)")
+    parser.add_argument("--startup-timeout", type=float, default=300, help="Seconds to wait for the API to report ready (warm-up, CLIP/FAISS load)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the scenario mix")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    scenario_weights = {name: SCENARIO_WEIGHTS[name] for name in args.scenarios.split(",")}
+
+    processes = []
+    state_dir = tempfile.mkdtemp(prefix="loadtest-")  # Caches and stored files of the API under test
+    try:
+        base_url = args.base_url
+        if not base_url:
+            if os.path.exists(args.database):
+                os.remove(args.database)
+            standin_env = dict(os.environ)
+            if args.standin_config:
+                standin_env["STANDIN_CONFIG_PATH"] = os.path.abspath(args.standin_config)
+            processes.append(start_server("app.standin_server:app", args.standin_port, standin_env, "/standin/config", 30))
+            processes.append(start_server("app.main:app", args.app_port, app_environment(args, state_dir), "/ready", args.startup_timeout))
+            base_url = f"http://127.0.0.1:{args.app_port}"
+        else:
+            wait_until_ready(f"{base_url.rstrip('/')}/ready", args.startup_timeout)
+
+        results = {
+            "commit": git_commit(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {
+                "concurrency": levels, "duration_s": args.duration, "scenarios": scenario_weights,
+                "base_url": base_url, "standin_config": args.standin_config, "seed": args.seed,
+            },
+            "steps": [],
+        }
+        for concurrency in levels:
+            step = asyncio.run(run_step(base_url, concurrency, args.duration, scenario_weights))
+            results["steps"].append(step)
+            print_step(step)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=30)
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# pdf_render.py
+# Micro-benchmark of the PDF templates in app/pdf_reports.py. It renders the food nutrition, meal
+# nutrition and shopping list PDFs from fixed sample data in one process (what a single rendering
+# worker does) and reports PDFs per second, milliseconds per PDF and the document size per kind, as a
+# table and JSON. The first render of each kind is not timed. By default the template assets are
+# preloaded first, like a worker's initializer does; --no-preload measures a cold process instead.
+#
+# Run it from the FoodRecipeBackend folder:
+#   python -m benchmarks.pdf_render --documents 200 --output pdf_render_results.json
+import argparse
+import json
+import time
+from typing import Callable, Dict, List
+
+from app import pdf_reports
+
+# Sample nutrient values as stored in the nutrient table (Nutritionix fields)
+SAMPLE_FOODS = [
+    {"food_name": "pizza", "serving_qty": 1, "serving_unit": "slice", "nf_calories": 284.6,
+     "nf_total_fat": 10.4, "nf_protein": 12.2, "nf_total_carbohydrate": 35.7},
+    {"food_name": "caesar salad", "serving_qty": 1, "serving_unit": "bowl", "nf_calories": 184.1,
+     "nf_total_fat": 15.2, "nf_protein": 4.4, "nf_total_carbohydrate": 7.9},
+    {"food_name": "garlic bread", "serving_qty": 2, "serving_unit": "pieces", "nf_calories": 206.0,
+     "nf_total_fat": 9.6, "nf_protein": 4.8, "nf_total_carbohydrate": 24.5},
+    {"food_name": "cola", "serving_qty": 1, "serving_unit": "can", "nf_calories": 139.7,
+     "nf_total_fat": 0.0, "nf_protein": 0.3, "nf_total_carbohydrate": 35.4},
+]
+SAMPLE_RECIPES = ["chicken karahi", "vegetable biryani", "raita"]
+SAMPLE_INGREDIENTS = [
+    ("1 kg chicken", ["chicken karahi"]),
+    ("4 tomatoes", ["chicken karahi", "vegetable biryani"]),
+    ("2 onions", ["chicken karahi", "vegetable biryani"]),
+    ("500 g basmati rice", ["vegetable biryani"]),
+    ("500 g yogurt", ["vegetable biryani", "raita"]),
+    ("1 cucumber", ["raita"]),
+] * 4
+
+# Render functions and their arguments per document kind
+KINDS: Dict[str, Callable[[], bytes]] = {
+    "food": lambda: pdf_reports.render_food_pdf("pizza", SAMPLE_FOODS[0]),
+    "meal": lambda: pdf_reports.render_meal_pdf([(food["food_name"], food) for food in SAMPLE_FOODS], ["mint chutney"]),
+    "shopping_list": lambda: pdf_reports.render_shopping_list_pdf(SAMPLE_RECIPES, SAMPLE_INGREDIENTS),
+}
+
+# Function to time `documents` renders of one kind after one untimed render
+def measure(render: Callable[[], bytes], documents: int) -> dict:
+    size = len(render())
+    started = time.perf_counter()
+    for _ in range(documents):
+        render()
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    return {
+        "pdfs_per_second": documents / elapsed,
+        "ms_per_pdf": elapsed / documents * 1000,
+        "size_kb": size / 1024,
+    }
+
+def print_table(results: List[dict]):
+    print(f"{'kind':<16}{'pdfs/s':>10}{'ms/pdf':>10}{'size KB':>10}")
+    for row in results:
+        print(f"{row['kind']:<16}{row['pdfs_per_second']:>10.1f}{row['ms_per_pdf']:>10.2f}{row['size_kb']:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how many PDFs per second the report templates render.")
+    parser.add_argument("--documents", type=int, default=200, help="Timed renders per kind")
+    parser.add_argument("--only", help="Comma-separated kinds to run, e.g. food,meal,shopping_list")
+    parser.add_argument("--no-preload", action="store_true", help="Do not preload the template assets first")
+    parser.add_argument("--output", default="pdf_render_results.json", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if not args.no_preload:
+        pdf_reports.preload_assets()
+    preload_seconds = time.perf_counter() - started
+
+    kinds = args.only.split(",") if args.only else list(KINDS)
+    results = []
+    for kind in kinds:
+        results.append({"kind": kind, **measure(KINDS[kind], args.documents)})
+    print_table(results)
+    with open(args.output, "w") as f:
+        json.dump({"documents": args.documents, "preload": not args.no_preload,
+                   "preload_seconds": preload_seconds, "results": results}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Tests of the per-request deadline split across stages (app/deadlines.py)
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app import deadlines
+
+
+def test_stages_in_order_with_slow_llm(monkeypatch):
+    # Shopping list shape: DB reads, a slow LLM call, the render and the DB write after it
+    monkeypatch.setitem(deadlines.ENDPOINT_BUDGETS, "generate_shopping_list", (1.0, {"db": 0.05, "llm": 0.9, "render": 0.05}))
+
+    async def request():
+        deadlines.start_deadline("generate_shopping_list")
+        await deadlines.within_stage("db", asyncio.sleep(0.01))
+        await deadlines.within_stage("llm", asyncio.sleep(0.3))
+        await deadlines.within_stage("render", asyncio.sleep(0.01))
+        return await deadlines.within_stage("db", asyncio.sleep(0.01, result="saved"))
+
+    assert asyncio.run(request()) == "saved"
+
+
+def test_db_write_after_llm_without_render(monkeypatch):
+    # Generate-recipe shape: the LLM takes most of the budget, the DB write still fits in what is left
+    monkeypatch.setitem(deadlines.ENDPOINT_BUDGETS, "generate_recipe", (1.0, {"db": 0.1, "llm": 0.9}))
+
+    async def request():
+        deadlines.start_deadline("generate_recipe")
+        await deadlines.within_stage("llm", asyncio.sleep(0.5))
+        return await deadlines.within_stage("db", asyncio.sleep(0.01, result="saved"))
+
+    assert asyncio.run(request()) == "saved"
+
+
+def test_early_stage_keeps_time_for_later_stages(monkeypatch):
+    monkeypatch.setitem(deadlines.ENDPOINT_BUDGETS, "generate_recipe", (1.0, {"db": 0.1, "llm": 0.9}))
+
+    async def request():
+        deadline = deadlines.start_deadline("generate_recipe")
+        assert deadline.stage_timeout("db") == pytest.approx(0.1, abs=0.02)
+        await deadlines.within_stage("db", asyncio.sleep(0.5))
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(request())
+    assert error.value.status_code == 504
+
+
+def test_timed_out_db_stage_rolls_back_the_session(monkeypatch):
+    monkeypatch.setitem(deadlines.ENDPOINT_BUDGETS, "generate_recipe", (1.0, {"db": 0.1, "llm": 0.9}))
+
+    class Session:
+        rolled_back = False
+
+        async def rollback(self):
+            self.rolled_back = True
+
+    session = Session()
+
+    async def request():
+        deadlines.start_deadline("generate_recipe")
+        await deadlines.within_stage("db", asyncio.sleep(0.5), session)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(request())
+    assert error.value.status_code == 504
+    assert session.rolled_back
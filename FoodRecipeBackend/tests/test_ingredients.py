@@ -0,0 +1,49 @@
+# Tests of the free-text ingredient parser and the shopping list aggregation (app/ingredients.py)
+from app.ingredients import (
+    IngredientRow, aggregate_ingredients, batch_recipes, format_ingredient_row, parse_ingredient_line,
+)
+
+
+def test_plain_quantity_unit_and_item():
+    assert parse_ingredient_line("- 2 cups rice", "biryani") == IngredientRow("rice", 2.0, "cup", ("biryani",))
+
+
+def test_range_takes_upper_bound_and_drops_preparation():
+    row = parse_ingredient_line("2-3 cloves garlic, minced")
+    assert row == IngredientRow("garlic", 3.0, "clove")
+    assert format_ingredient_row(row) == "3 cloves garlic"
+
+
+def test_range_with_spaces_and_en_dash():
+    assert parse_ingredient_line("1 – 2 tbsp oil") == IngredientRow("oil", 2.0, "tbsp")
+
+
+def test_parenthetical_size_is_dropped():
+    assert parse_ingredient_line("1 (14 oz) can tomatoes") == IngredientRow("tomato", 1.0, "can")
+
+
+def test_mixed_number_and_unicode_fraction():
+    assert parse_ingredient_line("1 1/2 tsp salt").quantity == 1.5
+    assert parse_ingredient_line("½ cup milk") == IngredientRow("milk", 0.5, "cup")
+
+
+def test_headings_are_skipped():
+    assert parse_ingredient_line("Ingredients:") is None
+
+
+def test_aggregation_merges_across_recipes():
+    rows = [parse_ingredient_line("2 onions", "a"), parse_ingredient_line("1 onion, sliced", "b")]
+    merged = aggregate_ingredients(rows)
+    assert merged == [IngredientRow("onion", 3.0, "", ("a", "b"))]
+    assert format_ingredient_row(merged[0]) == "3 onions"
+
+
+def test_long_selection_is_split_into_batches_within_the_token_limit():
+    recipes = [f"recipe {number}" for number in range(45)]
+    batches = batch_recipes(recipes, tokens_per_recipe=200, max_tokens=4000)
+    assert [len(batch) for batch in batches] == [20, 20, 5]
+    assert [recipe for batch in batches for recipe in batch] == recipes
+
+
+def test_one_recipe_per_batch_when_a_recipe_exceeds_the_limit():
+    assert batch_recipes(["biryani", "karahi"], tokens_per_recipe=500, max_tokens=300) == [["biryani"], ["karahi"]]
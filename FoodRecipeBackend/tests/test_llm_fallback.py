@@ -0,0 +1,42 @@
+# Tests of the fallback model under a request deadline (app/llm.py)
+import asyncio
+
+from app import deadlines, llm
+
+
+def test_slow_primary_falls_back_within_deadline(monkeypatch):
+    monkeypatch.setitem(deadlines.ENDPOINT_BUDGETS, "generate_recipe", (1.0, {"db": 0.1, "llm": 0.9}))
+    monkeypatch.setitem(llm.MODEL_ROUTES, "recipe", llm.ModelRoute("slow-model", max_tokens=10, timeout=30.0, fallback_model="fast-model"))
+    calls = []
+
+    async def fake_complete(model, messages, max_tokens, temperature=0.7, priority=0, **kwargs):
+        calls.append(model)
+        await asyncio.sleep(5 if model == "slow-model" else 0.01)
+        return f"answer from {model}"
+
+    monkeypatch.setattr(llm, "complete", fake_complete)
+
+    async def request():
+        deadlines.start_deadline("generate_recipe")
+        await deadlines.within_stage("db", asyncio.sleep(0))
+        return await deadlines.within_stage("llm", llm.complete_task("recipe", []))
+
+    assert asyncio.run(request()) == "answer from fast-model"
+    assert calls == ["slow-model", "fast-model"]
+
+
+def test_primary_uses_whole_budget_without_fallback(monkeypatch):
+    monkeypatch.setitem(deadlines.ENDPOINT_BUDGETS, "generate_recipe", (1.0, {"db": 0.1, "llm": 0.9}))
+    monkeypatch.setitem(llm.MODEL_ROUTES, "recipe", llm.ModelRoute("only-model", max_tokens=10, timeout=30.0))
+
+    async def fake_complete(model, messages, max_tokens, temperature=0.7, priority=0, **kwargs):
+        await asyncio.sleep(0.75)  # Longer than the primary's share when a fallback exists
+        return "done"
+
+    monkeypatch.setattr(llm, "complete", fake_complete)
+
+    async def request():
+        deadlines.start_deadline("generate_recipe")
+        return await deadlines.within_stage("llm", llm.complete_task("recipe", []))
+
+    assert asyncio.run(request()) == "done"
@@ -0,0 +1,71 @@
+# Tests of the nutrient table and its Nutritionix client (app/nutrient_table.py)
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from app import nutrient_table
+
+
+def test_concurrent_updates_keep_every_entry(tmp_path):
+    path = str(tmp_path / "nutrient_table.json")
+
+    def writer(worker):
+        for i in range(50):
+            nutrient_table.update_table({f"food {worker}-{i}": {"nf_calories": i}}, path)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(writer, range(4)))
+
+    assert len(nutrient_table.load_table(path)) == 200
+    assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
+
+
+def test_concurrent_stores_keep_every_entry(tmp_path):
+    path = str(tmp_path / "nutrient_table.json")
+    first, second = nutrient_table.NutrientTable(path), nutrient_table.NutrientTable(path)
+
+    async def store_all():
+        await asyncio.gather(*(table.store({f"food {name}-{i}": {"nf_calories": i}})
+                               for i in range(20) for name, table in (("a", first), ("b", second))))
+
+    asyncio.run(store_all())
+    assert len(nutrient_table.load_table(path)) == 40
+
+
+def test_corrupt_file_loads_as_empty_table(tmp_path):
+    path = tmp_path / "nutrient_table.json"
+    path.write_text('{"pizza": {"nf_calories": 28', encoding="utf-8")
+
+    table = nutrient_table.NutrientTable(str(path))
+    assert len(table) == 0
+
+    asyncio.run(table.store({"pizza": {"nf_calories": 284.6}}))
+    assert json.loads(path.read_text(encoding="utf-8")) == {"pizza": {"nf_calories": 284.6}}
+
+
+def nutritionix_answering(monkeypatch, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(nutrient_table.http_client, "get_client", lambda: client)
+
+
+def test_rejected_query_is_told_apart_from_upstream_faults(monkeypatch):
+    nutritionix_answering(monkeypatch, lambda request: httpx.Response(400, json={"message": "invalid query"}))
+    with pytest.raises(nutrient_table.NutritionixError) as rejected:
+        asyncio.run(nutrient_table.fetch_nutrients("%%%"))
+    assert rejected.value.rejected_query
+
+    nutritionix_answering(monkeypatch, lambda request: httpx.Response(503))
+    with pytest.raises(nutrient_table.NutritionixError) as failed:
+        asyncio.run(nutrient_table.fetch_nutrients("pizza"))
+    assert not failed.value.rejected_query
+
+    def unreachable(request):
+        raise httpx.ConnectError("connection refused")
+
+    nutritionix_answering(monkeypatch, unreachable)
+    with pytest.raises(nutrient_table.NutritionixError) as down:
+        asyncio.run(nutrient_table.fetch_nutrients("pizza"))
+    assert down.value.status_code is None
@@ -0,0 +1,32 @@
+# Tests of the shared nutrition PDF cache (app/pdf_cache.py)
+from concurrent.futures import ThreadPoolExecutor
+
+from app.pdf_cache import PDFCache
+
+
+def test_concurrent_puts_of_one_key(tmp_path):
+    cache = PDFCache(str(tmp_path), max_mb=10)
+    content = b"%PDF-1.3 pizza" * 100
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: cache.put("k" * 32, "pizza_nutrition_details.pdf", content), range(40)))
+
+    assert cache.get("k" * 32, "pizza_nutrition_details.pdf") == content
+    assert [file.name for file in (tmp_path / ("k" * 32)).iterdir()] == ["pizza_nutrition_details.pdf"]
+
+
+def test_folder_is_only_scanned_when_over_the_limit(tmp_path, monkeypatch):
+    cache = PDFCache(str(tmp_path), max_mb=10 / 1024)  # 10 KB
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: (scans.append(1), evict()))
+
+    for number in range(8):
+        cache.put(f"{number:032d}", "food_nutrition_details.pdf", b"x" * 1024)
+    assert len(scans) == 1  # First put only, the running total stays below 10 KB
+
+    for number in range(8, 16):
+        cache.put(f"{number:032d}", "food_nutrition_details.pdf", b"x" * 1024)
+    assert len(scans) > 1
+    assert sum(1 for _ in tmp_path.iterdir()) <= 10
+    assert cache.get(f"{15:032d}", "food_nutrition_details.pdf") is not None  # The newest one is kept
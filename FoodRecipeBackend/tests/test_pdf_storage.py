@@ -0,0 +1,39 @@
+# Tests of the persisted PDF storage and its garbage collector lock (app/pdf_storage.py, app/artifact_gc.py)
+from concurrent.futures import ThreadPoolExecutor
+
+from app import artifact_gc, file_store
+from app.pdf_storage import LocalArtifactStorage
+
+
+def test_concurrent_writes_of_one_artifact(tmp_path):
+    storage = LocalArtifactStorage(str(tmp_path))
+    content = b"%PDF-1.3 shopping list" * 100
+    path = storage.path(1, "shopping_list.pdf", content)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: storage.write(path, content), range(40)))
+
+    assert storage.read(path) == content
+    assert [artifact.path for artifact in storage.artifacts("1")] == [path]
+
+
+def test_temporary_files_are_not_listed(tmp_path):
+    storage = LocalArtifactStorage(str(tmp_path))
+    path = storage.path(1, "shopping_list.pdf", b"pdf")
+    storage.write(path, b"pdf")
+    (tmp_path / "1" / path.split("/")[-2] / "shopping_list.pdf.x1y2.tmp").write_bytes(b"half written")
+
+    assert [artifact.path for artifact in storage.artifacts("1")] == [path]
+
+
+def test_only_one_process_collects(tmp_path, monkeypatch):
+    lock_path = str(tmp_path / "pdf_gc")
+    other_worker = file_store.try_file_lock(lock_path)
+    assert other_worker is not None
+
+    monkeypatch.setattr(artifact_gc, "_lock_file", None)
+    assert not artifact_gc.is_collector(lock_path)
+
+    other_worker.close()  # That worker exits
+    assert artifact_gc.is_collector(lock_path)
+    artifact_gc.stop()
@@ -0,0 +1,40 @@
+# Tests of storing and reloading the recipe catalogue file (app/recipe_catalogue.py)
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from app import recipe_catalogue
+
+
+def test_concurrent_stores_keep_every_dish(tmp_path):
+    path = str(tmp_path / "recipe_catalogue.json")
+    workers = [recipe_catalogue.StoredCatalogue(path) for _ in range(4)]
+
+    def refresh(worker):
+        for i in range(25):
+            workers[worker].store(f"dish_{worker}_{i}", {"title": f"Dish {i}"})
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(refresh, range(4)))
+
+    assert len(recipe_catalogue.load_catalogue(path)) == 100
+    assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
+
+
+def test_corrupt_file_loads_as_empty_catalogue(tmp_path):
+    path = tmp_path / "recipe_catalogue.json"
+    path.write_text('{"biryani": {"title": "Biry', encoding="utf-8")
+
+    catalogue = recipe_catalogue.StoredCatalogue(str(path))
+    assert len(catalogue) == 0
+    catalogue.store("biryani", {"title": "Biryani"})
+    assert json.loads(path.read_text(encoding="utf-8")) == {"biryani": {"title": "Biryani"}}
+
+
+def test_worker_picks_up_dishes_stored_elsewhere(tmp_path):
+    path = str(tmp_path / "recipe_catalogue.json")
+    worker = recipe_catalogue.StoredCatalogue(path, reload_seconds=0)
+    assert worker.get("pizza") is None
+
+    # The offline job (or another worker) writes the file
+    recipe_catalogue.update_catalogue({"pizza": {"title": "Pizza"}}, path)
+    assert worker.get("pizza") == {"title": "Pizza"}
@@ -0,0 +1,50 @@
+# Tests of retrying a failed recognition model load (app/recognition.py)
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import recognition
+
+
+def test_failed_load_is_retried_after_backoff(monkeypatch):
+    monkeypatch.setitem(sys.modules, "clip", None)  # Importing clip fails, like a broken install or device
+    monkeypatch.setattr(recognition, "state", recognition.NOT_LOADED)
+    monkeypatch.setattr(recognition, "_warm_up", None)
+    monkeypatch.setattr(recognition, "failures", 0)
+    monkeypatch.setattr(recognition, "RETRY_SECONDS", 60)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        first = recognition.start_warm_up(executor)
+        first.result()
+        assert recognition.state == recognition.FAILED
+        assert recognition.failures == 1
+        assert recognition.retry_after() > 0
+
+        # Within the backoff the failed attempt is returned, no new load starts
+        assert recognition.start_warm_up(executor) is first
+
+        monkeypatch.setattr(recognition, "RETRY_SECONDS", 0)
+        second = recognition.start_warm_up(executor)
+        assert second is not first
+        second.result()
+        assert recognition.failures == 2
+
+
+def test_failed_load_is_retried_without_uploads(monkeypatch):
+    monkeypatch.setitem(sys.modules, "clip", None)
+    monkeypatch.setattr(recognition, "state", recognition.NOT_LOADED)
+    monkeypatch.setattr(recognition, "_warm_up", None)
+    monkeypatch.setattr(recognition, "failures", 0)
+    monkeypatch.setattr(recognition, "RETRY_SECONDS", 0.05)
+
+    async def run():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            recognition.start_warm_up(executor).result()
+            assert recognition.failures == 1
+            # Only the background loop runs from here on, no upload calls start_warm_up
+            loop = asyncio.create_task(recognition.retry_failed_loads(executor, poll_seconds=0.01))
+            await asyncio.sleep(0.5)
+            loop.cancel()
+        return recognition.failures
+
+    assert asyncio.run(run()) >= 2
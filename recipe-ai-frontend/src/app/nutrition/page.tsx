@@ -10,6 +10,7 @@ import { motion, AnimatePresence } from "framer-motion"; // Import Framer Motion
 const NutritionPage = () => {
     const [foodItem, setFoodItem] = useState("");
     const [pdfURL, setPdfURL] = useState<string | null>(null);
+    const [pdfName, setPdfName] = useState("nutrition_details.pdf"); // File name of the shown PDF
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState<string | null>(null);
     const [history, setHistory] = useState([]); // User's PDF history
@@ -77,6 +78,7 @@ const NutritionPage = () => {
             const blob = new Blob([response.data], { type: "application/pdf" });
             const url = window.URL.createObjectURL(blob);
             setPdfURL(url);
+            setPdfName(`${foodToGenerate.replace(/ /g, "_")}_nutrition_details.pdf`);
             setFoodItem(foodToGenerate); // Update input field to reflect the generated food item
 
             // Refresh history after generating a PDF
@@ -94,12 +96,46 @@ const NutritionPage = () => {
         }
     };
 
-    // Handle clicking a history item
-    const handleHistoryClick = (entry: any) => {
-        // Extract food item from file path (e.g., "chicken_breast_nutrition_details.pdf" → "chicken breast")
-        const fileName = entry.file_path.replace("_nutrition_details.pdf", "");
-        const foodItemName = fileName.replace(/_/g, " ");
-        handleGeneratePDF(foodItemName);
+    // Handle clicking a history item: download the stored PDF by its record id (food and meal PDFs alike)
+    const handleHistoryClick = async (entry: any) => {
+        const fileName = entry.file_path.split("/").pop();
+        const isMeal = fileName === "meal_nutrition_details.pdf";
+        // Extract food item from file path (e.g., "pdf_cache/3f2a.../chicken_breast_nutrition_details.pdf" → "chicken breast")
+        const foodItemName = fileName.replace("_nutrition_details.pdf", "").replace(/_/g, " ");
+        setLoading(true);
+        setError(null);
+        setPdfURL(null);
+
+        const token = Cookies.get("token");
+        try {
+            const response = await axios.get(`http://127.0.0.1:8000/pdfs/${entry.id}`, {
+                headers: {
+                    "Authorization": `Bearer ${token}`,
+                },
+                responseType: "blob",
+            });
+
+            const blob = new Blob([response.data], { type: "application/pdf" });
+            const url = window.URL.createObjectURL(blob);
+            setPdfURL(url);
+            setPdfName(fileName);
+            if (!isMeal) {
+                setFoodItem(foodItemName);
+            }
+        } catch (error) {
+            console.error("Error downloading PDF:", error);
+            if (axios.isAxiosError(error) && (error.response?.status === 403 || error.response?.status === 401)) {
+                Cookies.remove("token");
+                router.push("/login");
+            } else if (axios.isAxiosError(error) && error.response?.status === 410 && !isMeal) {
+                // The stored file expired, so generate the food PDF again
+                await handleGeneratePDF(foodItemName);
+            } else {
+                setError("This PDF is no longer available. Please generate it again.");
+            }
+        } finally {
+            setLoading(false);
+        }
     };
 
     // Animation variants for Framer Motion
@@ -243,7 +279,7 @@ const NutritionPage = () => {
                             />
                             <motion.a
                                 href={pdfURL}
-                                download={`${foodItem.replace(" ", "_")}_nutrition_details.pdf`}
+                                download={pdfName}
                                 className="mt-4 inline-block text-indigo-600 underline hover:text-indigo-800 transition-colors duration-300"
                                 initial={{ opacity: 0 }}
                                 animate={{ opacity: 1 }}